@@ -0,0 +1,104 @@
+"""
+Markdown 表格渲染基准：对比旧的逐行拼接实现与 connectors.markdown_tables 的耗时和峰值内存。
+
+按列渲染与旧实现的耗时基本相同 (CPython 对字符串 += 有原地扩容优化，瓶颈在逐单元格格式化)；
+差别在于流式写文件时峰值内存只与块大小有关，不随表格行数增长。
+
+用法 (在项目根目录运行):
+    python benchmarks/bench_markdown_table.py
+    python benchmarks/bench_markdown_table.py --rows 10000 50000 100000 --repeat 3
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connectors.markdown_tables import render_markdown_table, write_markdown_table
+
+HEADERS = ["页面URL", "点击量", "展示量", "点击率(%)", "平均排名"]
+FORMATTERS = {"点击率(%)": lambda x: f"{x*100:.2f}%", "平均排名": lambda x: f"{x:.2f}"}
+
+
+def legacy_markdown_table(headers, rows_data, metric_formatters=None):
+    """重构前 ga4_data / gsc_data 中的实现，作为对照。"""
+    if not rows_data:
+        return "    - 无数据\n"
+    table = f"| {' | '.join(headers)} |\n"
+    table += f"|{'|'.join(['---'] * len(headers))}|\n"
+    for r_data in rows_data:
+        formatted_row = []
+        for header in headers:
+            value = r_data.get(header, 'N/A')
+            if metric_formatters and header in metric_formatters:
+                try:
+                    value = metric_formatters[header](value)
+                except Exception:
+                    pass
+            formatted_row.append(str(value))
+        table += f"| {' | '.join(formatted_row)} |\n"
+    return table
+
+
+def make_columns(row_count):
+    rng = random.Random(42)
+    return {
+        "页面URL": [f"https://example.com/products/item-{i}" for i in range(row_count)],
+        "点击量": [rng.randint(0, 5000) for _ in range(row_count)],
+        "展示量": [rng.randint(0, 100000) for _ in range(row_count)],
+        "点击率(%)": [rng.random() for _ in range(row_count)],
+        "平均排名": [rng.uniform(1, 80) for _ in range(row_count)],
+    }
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings), result
+
+
+def peak_memory_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown 表格渲染基准")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000, 100000], help="表格行数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    args = parser.parse_args()
+
+    print(f"{'行数':>8} {'旧实现(s)':>10} {'按列渲染(s)':>12} {'流式写文件(s)':>14} {'旧实现峰值(MB)':>15} {'流式峰值(MB)':>13}")
+    for row_count in args.rows:
+        columns = make_columns(row_count)
+        rows_data = [dict(zip(HEADERS, row)) for row in zip(*(columns[h] for h in HEADERS))]
+
+        legacy_time, legacy_table = best_of(args.repeat, lambda: legacy_markdown_table(HEADERS, rows_data, FORMATTERS))
+        columns_time, columns_table = best_of(args.repeat, lambda: render_markdown_table(HEADERS, columns, FORMATTERS))
+        assert legacy_table == columns_table, "渲染结果与旧实现不一致"
+        del legacy_table, columns_table
+
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as out:
+            def stream():
+                out.seek(0)
+                out.truncate()
+                return write_markdown_table(out, HEADERS, columns, FORMATTERS)
+            stream_time, _ = best_of(args.repeat, stream)
+            stream_peak = peak_memory_mb(stream)
+        legacy_peak = peak_memory_mb(lambda: legacy_markdown_table(HEADERS, rows_data, FORMATTERS))
+
+        print(f"{row_count:>8} {legacy_time:>10.3f} {columns_time:>12.3f} {stream_time:>14.3f} {legacy_peak:>15.1f} {stream_peak:>13.1f}")
+
+if __name__ == "__main__":
+    main()
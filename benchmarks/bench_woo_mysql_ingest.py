@@ -0,0 +1,142 @@
+"""
+WooCommerce 订单入库基准：用合成订单测量 mysql_loader 的写入吞吐量 (订单/秒)。
+
+始终测量纯 Python 部分 (订单映射为表行、生成 LOAD DATA 文件)；配置了 DB_HOST 等数据库环境变量时，
+再分别测量多行 upsert (WooOrderWriter) 和 LOAD DATA LOCAL INFILE 回填写入本地 MySQL 的速度。
+合成订单的 order_id 从 --id-start 开始，测试结束后会删除这些行。
+
+用法 (在项目根目录运行):
+    python benchmarks/bench_woo_mysql_ingest.py
+    python benchmarks/bench_woo_mysql_ingest.py --orders 50000 100000 --items 3
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from contextlib import closing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from mysql_loader import (
+    WooOrderWriter, backfill_woo_orders_with_load_data, get_mysql_connection,
+    woo_order_row, woo_order_item_rows, _write_load_data_rows,
+)
+
+
+def make_orders(order_count, items_per_order, id_start):
+    """生成与 WooCommerce API 返回结构一致的订单字典 (含账单/收货地址、商品和元数据)。"""
+    rng = random.Random(42)
+    orders = []
+    for offset in range(order_count):
+        order_id = id_start + offset
+        created = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+        address = {
+            "first_name": "Alex", "last_name": f"Buyer{order_id}", "company": "", "address_1": f"{rng.randint(1, 999)} Main St",
+            "address_2": "", "city": "London", "state": "", "postcode": "SW1A 1AA", "country": "GB",
+        }
+        orders.append({
+            "id": order_id,
+            "number": str(order_id),
+            "status": rng.choice(("processing", "completed")),
+            "currency": "USD",
+            "total": f"{rng.uniform(100, 20000):.2f}",
+            "discount_total": "0.00",
+            "shipping_total": "25.00",
+            "customer_id": rng.randint(1, 50000),
+            "billing": {**address, "email": f"buyer{order_id}@example.com", "phone": "+44 20 0000 0000"},
+            "shipping": address,
+            "customer_ip_address": "203.0.113.7",
+            "customer_user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+            "payment_method": "stripe",
+            "payment_method_title": "Credit Card (Stripe)",
+            "transaction_id": f"ch_{order_id:x}",
+            "date_created_gmt": created,
+            "date_paid_gmt": created,
+            "date_completed_gmt": None,
+            "date_modified_gmt": created,
+            "customer_note": "",
+            "meta_data": [
+                {"id": 1, "key": "_utm_source", "value": "google"},
+                {"id": 2, "key": "_utm_medium", "value": "cpc"},
+                {"id": 3, "key": "_wc_order_attribution_session_entry", "value": "https://example.com/products/phone"},
+            ],
+            "line_items": [
+                {
+                    "id": order_id * 10 + n, "name": f"Product {rng.randint(1, 500)}", "product_id": rng.randint(1, 500),
+                    "quantity": rng.randint(1, 3), "total": f"{rng.uniform(50, 8000):.2f}", "sku": f"SKU-{rng.randint(1000, 9999)}",
+                    "meta_data": [],
+                }
+                for n in range(items_per_order)
+            ],
+        })
+    return orders
+
+
+def timed(func):
+    started_at = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started_at, result
+
+
+def map_rows(orders):
+    for order in orders:
+        woo_order_row(order)
+        woo_order_item_rows(order)
+
+
+def write_tsv(orders):
+    with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as out:
+        for order in orders:
+            _write_load_data_rows(out, [woo_order_row(order)])
+            _write_load_data_rows(out, woo_order_item_rows(order))
+
+
+def upsert(orders):
+    writer = WooOrderWriter()
+    for order in orders:
+        writer.add(order)
+    return writer.close()
+
+
+def delete_orders(id_start, order_count):
+    with closing(get_mysql_connection()) as conn, closing(conn.cursor()) as cursor:
+        for table in ("woocommerce_order_items", "woocommerce_orders"):
+            cursor.execute(f"DELETE FROM `{table}` WHERE `order_id` BETWEEN %s AND %s", (id_start, id_start + order_count - 1))
+        conn.commit()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="WooCommerce 订单入库基准")
+    parser.add_argument("--orders", type=int, nargs="+", default=[10000, 50000], help="订单数")
+    parser.add_argument("--items", type=int, default=2, help="每个订单的商品行数")
+    parser.add_argument("--id-start", type=int, default=900000000, help="合成订单的起始 order_id")
+    args = parser.parse_args()
+    use_db = bool(os.getenv("DB_HOST"))
+    if not use_db:
+        print("未配置 DB_HOST，只测量映射与文件生成部分。")
+
+    print(f"{'订单数':>8} {'映射(订单/s)':>14} {'生成TSV(订单/s)':>16} {'多行upsert(订单/s)':>20} {'LOAD DATA(订单/s)':>18}")
+    for order_count in args.orders:
+        orders = make_orders(order_count, args.items, args.id_start)
+        map_time, _ = timed(lambda: map_rows(orders))
+        tsv_time, _ = timed(lambda: write_tsv(orders))
+        upsert_rate = load_rate = "-"
+        if use_db:
+            try:
+                upsert_time, totals = timed(lambda: upsert(orders))
+                assert totals["orders"] == order_count, f"upsert 只写入了 {totals['orders']} 个订单"
+                upsert_rate = f"{order_count / upsert_time:,.0f}"
+                load_time, totals = timed(lambda: backfill_woo_orders_with_load_data(None, None, orders=orders))
+                assert totals["orders"] == order_count, f"LOAD DATA 只导入了 {totals['orders']} 个订单"
+                load_rate = f"{order_count / load_time:,.0f}"
+            finally:
+                delete_orders(args.id_start, order_count)
+        print(f"{order_count:>8} {order_count / map_time:>14,.0f} {order_count / tsv_time:>16,.0f} {upsert_rate:>20} {load_rate:>18}")
+
+
+if __name__ == "__main__":
+    main()
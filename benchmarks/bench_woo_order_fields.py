@@ -0,0 +1,104 @@
+"""
+WooCommerce 订单 _fields 投影基准：用合成订单测量每页响应的 JSON 字节数。
+
+对比完整订单、WOO_ORDER_FIELDS 投影，以及嵌套投影 _fields=...,meta_data.key,meta_data.value。
+投影按 WordPress rest_filter_response_fields 的规则模拟：点号路径逐层按键名取交集，
+meta_data 是列表 (键为 0,1,2...)，嵌套路径会把其中的条目全部过滤掉，因此无法只取 meta_data 的部分键。
+"最小" 一行是只保留 UTM/来源元数据时的理论下限 (服务端无法按元数据键名过滤)。
+
+用法 (在项目根目录运行):
+    python benchmarks/bench_woo_order_fields.py
+    python benchmarks/bench_woo_order_fields.py --per-page 100 --plugin-meta 20 --plugin-meta-bytes 400
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connectors.woo_data import WOO_ORDER_FIELDS, _is_relevant_meta_key
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_woo_mysql_ingest import make_orders
+
+
+def add_plugin_meta(orders, plugin_meta, plugin_meta_bytes):
+    """给每个订单追加插件元数据 (支付网关、物流、归因插件等写入的大段序列化数据)。"""
+    rng = random.Random(7)
+    for order in orders:
+        next_id = len(order["meta_data"]) + 1
+        for n in range(plugin_meta):
+            value = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(plugin_meta_bytes))
+            order["meta_data"].append({"id": next_id + n, "key": f"_plugin_meta_{n}", "value": value})
+    return orders
+
+
+def _keyed_fields(fields):
+    keyed = {}
+    for field in fields:
+        node = keyed
+        parts = field.split(".")
+        for depth, part in enumerate(parts):
+            if node is True:
+                break
+            if depth == len(parts) - 1:
+                node[part] = True
+            else:
+                node = node.setdefault(part, {})
+    return keyed
+
+
+def _intersect(data, keyed):
+    if not isinstance(data, dict):
+        # PHP 关联数组与列表同为 array，列表的键是下标，与字段名取交集后为空
+        return [] if isinstance(data, list) else data
+    result = {}
+    for key, value in data.items():
+        if key in keyed:
+            result[key] = value if keyed[key] is True else _intersect(value, keyed[key])
+    return result
+
+
+def project(order, fields):
+    """按 WordPress REST _fields 的规则投影订单。"""
+    return _intersect(order, _keyed_fields(fields))
+
+
+def minimal(order):
+    projected = project(order, WOO_ORDER_FIELDS)
+    projected["meta_data"] = [meta for meta in order["meta_data"] if _is_relevant_meta_key(meta.get("key"))]
+    return projected
+
+
+def page_bytes(orders):
+    return len(json.dumps(orders, ensure_ascii=False).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WooCommerce 订单 _fields 投影响应大小")
+    parser.add_argument("--per-page", type=int, default=100, help="每页订单数")
+    parser.add_argument("--items", type=int, default=3, help="每个订单的商品数")
+    parser.add_argument("--plugin-meta", type=int, default=10, help="每个订单的插件元数据条目数")
+    parser.add_argument("--plugin-meta-bytes", type=int, default=200, help="每条插件元数据值的长度")
+    args = parser.parse_args()
+
+    orders = add_plugin_meta(make_orders(args.per_page, args.items, 1), args.plugin_meta, args.plugin_meta_bytes)
+    nested_fields = [field for field in WOO_ORDER_FIELDS if field != "meta_data"] + ["meta_data.key", "meta_data.value"]
+    variants = [
+        ("完整订单", orders),
+        ("WOO_ORDER_FIELDS", [project(order, WOO_ORDER_FIELDS) for order in orders]),
+        ("meta_data.key,meta_data.value", [project(order, nested_fields) for order in orders]),
+        ("最小 (仅相关元数据)", [minimal(order) for order in orders]),
+    ]
+    full_bytes = page_bytes(orders)
+    print(f"每页 {args.per_page} 单，每单 {args.items} 个商品、{args.plugin_meta} 条插件元数据 (各 {args.plugin_meta_bytes} 字节)")
+    for name, page in variants:
+        size = page_bytes(page)
+        kept_meta = sum(len(order.get("meta_data", [])) for order in page)
+        print(f"{name:<32} {size / 1024:>9.1f} KiB  {size / full_bytes:>6.1%}  meta_data 条目: {kept_meta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+data_api_service 压测：并发请求固定查询端点，输出吞吐量与 p50/p95/p99 延迟。
+
+先启动服务 (python data_api_service.py)，再运行:
+    python benchmarks/load_test_data_api.py --url http://localhost:5001 --requests 2000 --concurrency 20
+
+对比连接池效果时，分别以 DB_POOL_SIZE=0 (每个请求新建连接) 和默认连接池启动服务各测一次。
+"""
+import time
+import argparse
+import statistics
+import requests
+import requests.adapters
+from concurrent.futures import ThreadPoolExecutor
+
+GA4_ENDPOINTS = ("/get_ga4_pages", "/get_ga4_channels", "/get_ga4_devices", "/get_ga4_sessions", "/get_ga4_visit_depth")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data_api_service 压测")
+    parser.add_argument("--url", default="http://localhost:5001", help="服务地址")
+    parser.add_argument("--requests", type=int, default=2000, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发数")
+    parser.add_argument("--start-date", default="2024-01-01")
+    parser.add_argument("--end-date", default="2024-12-31")
+    parser.add_argument("--include-get-data", action="store_true", help="同时请求 /get_data (db_ga4_daily_overview)")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    date_params = {"start_date": args.start_date, "end_date": args.end_date}
+    targets = [("GET", f"{args.url}{endpoint}", None) for endpoint in GA4_ENDPOINTS]
+    if args.include_get_data:
+        targets.append(("POST", f"{args.url}/get_data", {"data_type": "db_ga4_daily_overview", "params": date_params}))
+
+    def send(index):
+        method, url, body = targets[index % len(targets)]
+        started_at = time.perf_counter()
+        try:
+            if method == "GET":
+                response = session.get(url, params=date_params, timeout=30)
+            else:
+                response = session.post(url, json=body, timeout=30)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - started_at, ok
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - started_at
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    print(f"请求数: {len(results)}  失败: {errors}  并发: {args.concurrency}  总耗时: {elapsed:.2f}s  吞吐: {len(results) / elapsed:.1f} req/s")
+    print(
+        f"延迟(ms)  平均: {statistics.mean(latencies):.1f}  p50: {percentile(latencies, 50):.1f}  "
+        f"p95: {percentile(latencies, 95):.1f}  p99: {percentile(latencies, 99):.1f}  最大: {latencies[-1]:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,31 @@
 import os
 import json
 import time
-import jwt
 import requests
 from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import DateRange, Metric, Dimension, RunReportRequest, OrderBy
 from google.oauth2 import service_account
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from connectors.google_auth import get_service_account_token, GA4_SCOPE
+from connectors.report_cache import ReportCache
+from connectors.paging import iter_pages, get_page_concurrency
+from connectors.markdown_tables import render_markdown_table
+from connectors.report_frames import ga4_report_to_frame, bounce_rate_percent
 
 logger = logging.getLogger(__name__)
 
+GA4_BATCH_REPORT_LIMIT = 5 # batchRunReports 单次请求最多包含的报告数
+GA4_REQUEST_TIMEOUT = 60 # GA4 API 请求超时 (秒)
+GA4_PAGE_SIZE = 10000 # iter_report_rows 每页行数 (API 上限 250000)
+GA4_FINALIZED_AFTER_DAYS = 3 # GA4 数据约 72 小时后定稿，之后不再变化，可永久缓存
+
 load_dotenv()
 
 class GA4Client:
     def __init__(self):
-        self.access_token = None
-        self.token_expiry = None
         self.property_id = os.getenv("VITE_GA4_PROPERTY_ID")
         self.client_email = os.getenv("VITE_GA4_CLIENT_EMAIL")
         raw_private_key = os.getenv("VITE_GA4_PRIVATE_KEY", "")
@@ -32,74 +40,51 @@ class GA4Client:
             logger.warning("GA4私钥格式似乎不正确。请确保它包含完整的BEGIN/END标记并且换行符正确。")
 
         self.api_url = f"https://analyticsdata.googleapis.com/v1beta/properties/{self.property_id}:runReport"
+        self.batch_api_url = f"https://analyticsdata.googleapis.com/v1beta/properties/{self.property_id}:batchRunReports"
+        self.cache = ReportCache("ga4", GA4_FINALIZED_AFTER_DAYS)
+
+    def _cache_key(self, report_config):
+        return ReportCache.make_key(property_id=self.property_id, report=report_config)
+
+    def _cache_report(self, report_config, report):
+        self.cache.set(self._cache_key(report_config), report, report_config["dateRanges"][0]["endDate"])
 
     def get_access_token(self):
-        """获取访问令牌"""
-        if self.access_token and self.token_expiry and time.time() < self.token_expiry:
-            return self.access_token
-
-        now = int(time.time())
-        header = {
-            "alg": "RS256",
-            "typ": "JWT"
-        }
-        
-        payload = {
-            "iss": self.client_email,
-            "sub": self.client_email,
-            "aud": "https://oauth2.googleapis.com/token",
-            "iat": now,
-            "exp": now + 3600,
-            "scope": "https://www.googleapis.com/auth/analytics.readonly"
+        """获取访问令牌 (由 google_auth 统一缓存并在过期前刷新)"""
+        return get_service_account_token(self.client_email, self.private_key, GA4_SCOPE, label="GA4")
+
+    @staticmethod
+    def _build_report_config(dimensions, metrics, date_ranges, order_bys=None, limit=10, offset=0):
+        """构造单个报告的请求体，runReport 和 batchRunReports 共用。"""
+        report_config = {
+            "dateRanges": [{
+                "startDate": date_ranges[0].start_date,
+                "endDate": date_ranges[0].end_date
+            }],
+            "dimensions": [{"name": dim} for dim in dimensions],
+            "metrics": [{"name": met} for met in metrics],
+            "limit": limit
         }
+        if offset:
+            report_config["offset"] = offset
 
-        try:
-            if not self.private_key or not self.client_email:
-                logger.error("GA4客户端邮件或私钥未配置。")
-                raise ValueError("GA4客户端邮件或私钥未配置。")
-            jwt_token = jwt.encode(payload, self.private_key, algorithm="RS256", headers=header)
-            response = requests.post(
-                "https://oauth2.googleapis.com/token",
-                data={
-                    "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
-                    "assertion": jwt_token
-                }
-            )
-            response.raise_for_status()
-            token_data = response.json()
-            self.access_token = token_data["access_token"]
-            self.token_expiry = now + token_data["expires_in"]
-            return self.access_token
-        except jwt.exceptions.InvalidKeyError as ike:
-            logger.error(f"GA4 JWT无效密钥错误: {str(ike)} - 这通常意味着私钥格式无法被解析。请检查VITE_GA4_PRIVATE_KEY环境变量。确保BEGIN/END标记存在且换行符正确。")
-            raise
-        except Exception as e:
-            logger.error(f"获取GA4访问令牌失败: {str(e)}")
-            if "Could not deserialize key data" in str(e) or "parse" in str(e).lower():
-                 logger.error("详细错误提示：GA4私钥解析失败。请检查VITE_GA4_PRIVATE_KEY环境变量中的私钥格式，确保BEGIN/END标记完整，并且换行符（\n）正确无误。不要使用字面上的\\n。")
-            raise
+        if order_bys:
+            report_config["orderBys"] = [
+                {
+                    "metric": {"metricName": order_by.metric.metric_name},
+                    "desc": order_by.desc
+                } for order_by in order_bys
+            ]
+        return report_config
 
-    def run_ga_report(self, dimensions, metrics, date_ranges, order_bys=None, limit=10):
+    def run_ga_report(self, dimensions, metrics, date_ranges, order_bys=None, limit=10, offset=0):
         """运行GA4报告"""
         try:
+            report_config = self._build_report_config(dimensions, metrics, date_ranges, order_bys, limit, offset)
+            cached = self.cache.get(self._cache_key(report_config))
+            if cached is not None:
+                return cached
             token = self.get_access_token()
-            report_config = {
-                "dateRanges": [{
-                    "startDate": date_ranges[0].start_date,
-                    "endDate": date_ranges[0].end_date
-                }],
-                "dimensions": [{"name": dim} for dim in dimensions],
-                "metrics": [{"name": met} for met in metrics],
-                "limit": limit
-            }
-            
-            if order_bys:
-                report_config["orderBys"] = [
-                    {
-                        "metric": {"metricName": order_by.metric.metric_name},
-                        "desc": order_by.desc
-                    } for order_by in order_bys
-                ]
 
             response = requests.post(
                 self.api_url,
@@ -110,28 +95,107 @@ class GA4Client:
                 json=report_config
             )
             response.raise_for_status()
-            return response.json()
+            report = response.json()
+            self._cache_report(report_config, report)
+            return report
         except Exception as e:
             logger.error(f"GA4 API请求失败 ({', '.join(dimensions)} / {', '.join(metrics)}): {e}", exc_info=True)
             return None
 
-def format_report_data_to_markdown_table(headers, rows_data, metric_formatters=None):
-    if not rows_data:
-        return "    - 无数据\n"
-    table = f"| {' | '.join(headers)} |\n"
-    table += f"|{'|'.join(['---'] * len(headers))}|\n"
-    for r_data in rows_data:
-        formatted_row = []
-        for header in headers:
-            value = r_data.get(header, 'N/A')
-            if metric_formatters and header in metric_formatters:
-                try:
-                    value = metric_formatters[header](value)
-                except Exception:
-                    pass 
-            formatted_row.append(str(value))
-        table += f"| {' | '.join(formatted_row)} |\n"
-    return table
+    def iter_report_rows(self, dimensions, metrics, date_ranges, order_bys=None, page_size=GA4_PAGE_SIZE, max_rows=None, concurrency=None):
+        """
+        分页读取报告的全部行，逐行产出，不受单次请求 limit 的限制。
+
+        第一页响应中的 rowCount 给出总行数，其余页按 offset 请求，最多 concurrency 页同时进行
+        (默认读取 REPORT_PAGE_CONCURRENCY)。行按报告顺序产出，内存占用只与并发页数有关。
+        某一页请求失败时记录错误并停止迭代。
+
+        Args:
+            page_size (int): 每页行数。
+            max_rows (int, optional): 最多读取的行数，默认读取全部。
+
+        Yields:
+            dict: GA4 响应中的 row ({"dimensionValues", "metricValues"})。
+        """
+        concurrency = concurrency or get_page_concurrency()
+        first_page = self.run_ga_report(dimensions, metrics, date_ranges, order_bys, page_size)
+        if first_page is None:
+            return
+        row_count = first_page.get("rowCount", 0)
+        if max_rows is not None:
+            row_count = min(row_count, max_rows)
+        rows = first_page.get("rows", [])
+        yield from rows[:row_count]
+        if len(rows) < page_size:
+            return
+
+        def fetch_page(offset):
+            return self.run_ga_report(dimensions, metrics, date_ranges, order_bys, min(page_size, row_count - offset), offset)
+
+        offset = page_size
+        for page in iter_pages(fetch_page, range(page_size, row_count, page_size), concurrency):
+            if page is None:
+                logger.error(f"GA4 分页读取在 offset={offset} 处失败，已读取 {offset}/{row_count} 行")
+                return
+            rows = page.get("rows", [])
+            yield from rows
+            offset += len(rows)
+            if len(rows) < page_size and offset < row_count:
+                logger.warning(f"GA4 分页读取提前结束: 已读取 {offset}/{row_count} 行")
+                return
+
+    def _run_report_batch(self, report_specs):
+        """用一次 batchRunReports 请求运行至多 GA4_BATCH_REPORT_LIMIT 个报告，失败时每个报告返回 None。"""
+        try:
+            token = self.get_access_token()
+            report_configs = [self._build_report_config(**spec) for spec in report_specs]
+            response = requests.post(
+                self.batch_api_url,
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json"
+                },
+                json={"requests": report_configs},
+                timeout=GA4_REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+            reports = response.json().get("reports", [])
+            if len(reports) != len(report_specs):
+                logger.warning(f"GA4 batchRunReports 返回 {len(reports)} 个报告，请求了 {len(report_specs)} 个")
+            for report_config, report in zip(report_configs, reports):
+                self._cache_report(report_config, report)
+            return [reports[idx] if idx < len(reports) else None for idx in range(len(report_specs))]
+        except Exception as e:
+            names = "; ".join(", ".join(spec["dimensions"]) or ", ".join(spec["metrics"]) for spec in report_specs)
+            logger.error(f"GA4 batchRunReports 请求失败 ({names}): {e}", exc_info=True)
+            return [None] * len(report_specs)
+
+    def run_batch_reports(self, report_specs):
+        """
+        批量运行多个报告：每 GA4_BATCH_REPORT_LIMIT (5) 个报告合并为一次 batchRunReports 请求，
+        多个批次并发执行，整体耗时约为一次请求的延迟。已缓存的报告不再请求。
+
+        Args:
+            report_specs (list): 每项为 run_ga_report 的关键字参数
+                {"dimensions", "metrics", "date_ranges", "order_bys" (可选), "limit" (可选)}。
+
+        Returns:
+            list: 与 report_specs 顺序一致的报告响应，失败的报告为 None。
+        """
+        results = [self.cache.get(self._cache_key(self._build_report_config(**spec))) for spec in report_specs]
+        pending = [idx for idx, report in enumerate(results) if report is None]
+        if len(pending) < len(report_specs):
+            logger.info(f"GA4 报告缓存命中 {len(report_specs) - len(pending)}/{len(report_specs)}")
+        if not pending:
+            return results
+        self.get_access_token() # 并发前先获取令牌，避免多个线程同时换取
+        batches = [pending[i:i + GA4_BATCH_REPORT_LIMIT] for i in range(0, len(pending), GA4_BATCH_REPORT_LIMIT)]
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            batch_results = list(executor.map(lambda batch: self._run_report_batch([report_specs[idx] for idx in batch]), batches))
+        for batch, reports in zip(batches, batch_results):
+            for idx, report in zip(batch, reports):
+                results[idx] = report
+        return results
 
 def get_ga4_summary(start_date_dt, end_date_dt):
     if not os.getenv("VITE_GA4_PROPERTY_ID") or not os.getenv("VITE_GA4_CLIENT_EMAIL") or not os.getenv("VITE_GA4_PRIVATE_KEY"):
@@ -144,28 +208,69 @@ def get_ga4_summary(start_date_dt, end_date_dt):
         
         markdown_output = [f"### GA4 数据 ({start_date_dt.strftime('%Y-%m-%d')} to {end_date_dt.strftime('%Y-%m-%d')})\n"]
 
+        # 六个报告通过 batchRunReports 合并请求 (每次至多5个)，各批次并发执行
+        logger.info("获取GA4数据: 各流量渠道、来源/媒介/活动、各个页面、总体跳出率/加购/结账、访问深度、PC与移动端对比")
+        report_specs = [
+            {
+                "dimensions": ["sessionDefaultChannelGroup"],
+                "metrics": ["sessions", "averageSessionDuration"],
+                "date_ranges": date_range,
+                "order_bys": [OrderBy(metric=OrderBy.MetricOrderBy(metric_name="sessions"), desc=True)],
+                "limit": 100
+            },
+            {
+                "dimensions": ["firstUserSource", "firstUserMedium", "firstUserCampaignName"],
+                "metrics": ["sessions", "activeUsers", "bounceRate", "averageSessionDuration", "addToCarts", "checkouts"],
+                "date_ranges": date_range,
+                "order_bys": [OrderBy(metric=OrderBy.MetricOrderBy(metric_name="sessions"), desc=True)],
+                "limit": 100
+            },
+            {
+                "dimensions": ["pagePath"],
+                "metrics": ["screenPageViews", "averageSessionDuration", "engagementRate"],
+                "date_ranges": date_range,
+                "order_bys": [OrderBy(metric=OrderBy.MetricOrderBy(metric_name="screenPageViews"), desc=True)],
+                "limit": 100
+            },
+            {
+                "dimensions": [],
+                "metrics": ["sessions", "engagedSessions", "addToCarts", "checkouts"],
+                "date_ranges": date_range
+            },
+            {
+                "dimensions": [],
+                "metrics": ["activeUsers", "sessions"],
+                "date_ranges": date_range
+            },
+            {
+                "dimensions": ["deviceCategory"],
+                "metrics": ["activeUsers", "sessions", "engagedSessions", "averageSessionDuration", "addToCarts", "checkouts"],
+                "date_ranges": date_range,
+                "limit": 100
+            },
+        ]
+        (
+            traffic_channels_response,
+            source_medium_campaign_response,
+            page_metrics_response,
+            overall_conversion_metrics,
+            total_users_response,
+            device_metrics_response,
+        ) = client.run_batch_reports(report_specs)
+
         # 1. 各流量渠道的：访客数，平均互动时长
-        logger.info("获取GA4数据: 各流量渠道")
-        traffic_channels_response = client.run_ga_report(
-            dimensions=["sessionDefaultChannelGroup"],
-            metrics=["sessions", "averageSessionDuration"],
-            date_ranges=date_range,
-            order_bys=[OrderBy(metric=OrderBy.MetricOrderBy(metric_name="sessions"), desc=True)],
-            limit=100 
-        )
         md_section = "#### 1. 各流量渠道 (前100)\n"
-        if traffic_channels_response and "rows" in traffic_channels_response:
+        frame = ga4_report_to_frame(traffic_channels_response)
+        if frame is not None:
             headers = ["流量渠道", "会话数", "平均会话时长(秒)"]
-            rows_data = []
-            for row in traffic_channels_response["rows"]:
-                rows_data.append({
-                    "流量渠道": row["dimensionValues"][0]["value"],
-                    "会话数": int(row["metricValues"][0]["value"]),
-                    "平均会话时长(秒)": float(row["metricValues"][1]["value"])
-                })
-            md_section += format_report_data_to_markdown_table(
-                headers, 
-                rows_data,
+            frame = frame.rename(columns={
+                "sessionDefaultChannelGroup": "流量渠道",
+                "sessions": "会话数",
+                "averageSessionDuration": "平均会话时长(秒)"
+            })
+            md_section += render_markdown_table(
+                headers,
+                frame,
                 {"平均会话时长(秒)": lambda x: f"{x:.2f}"}
             )
         else:
@@ -173,33 +278,24 @@ def get_ga4_summary(start_date_dt, end_date_dt):
         markdown_output.append(md_section)
 
         # 新增：来源/媒介/活动分析（与前端保持一致，使用firstUserSource等维度）
-        logger.info("获取GA4数据: 来源/媒介/活动（firstUserSource/firstUserMedium/firstUserCampaignName）")
-        source_medium_campaign_response = client.run_ga_report(
-            dimensions=["firstUserSource", "firstUserMedium", "firstUserCampaignName"],
-            metrics=["sessions", "activeUsers", "bounceRate", "averageSessionDuration", "addToCarts", "checkouts"],
-            date_ranges=date_range,
-            order_bys=[OrderBy(metric=OrderBy.MetricOrderBy(metric_name="sessions"), desc=True)],
-            limit=100
-        )
         md_section = "#### 访问来源/媒介/活动分析 (前100)\n"
-        if source_medium_campaign_response and "rows" in source_medium_campaign_response:
+        frame = ga4_report_to_frame(source_medium_campaign_response)
+        if frame is not None:
             headers = ["来源", "媒介", "活动", "会话数", "访客数", "跳出率(%)", "平均访问时长(秒)", "加购数", "发结数"]
-            rows_data = []
-            for row in source_medium_campaign_response["rows"]:
-                rows_data.append({
-                    "来源": row["dimensionValues"][0]["value"],
-                    "媒介": row["dimensionValues"][1]["value"],
-                    "活动": row["dimensionValues"][2]["value"],
-                    "会话数": int(row["metricValues"][0]["value"]),
-                    "访客数": int(row["metricValues"][1]["value"]),
-                    "跳出率(%)": float(row["metricValues"][2]["value"]),
-                    "平均访问时长(秒)": float(row["metricValues"][3]["value"]),
-                    "加购数": int(row["metricValues"][4]["value"]),
-                    "发结数": int(row["metricValues"][5]["value"])
-                })
-            md_section += format_report_data_to_markdown_table(
+            frame = frame.rename(columns={
+                "firstUserSource": "来源",
+                "firstUserMedium": "媒介",
+                "firstUserCampaignName": "活动",
+                "sessions": "会话数",
+                "activeUsers": "访客数",
+                "bounceRate": "跳出率(%)",
+                "averageSessionDuration": "平均访问时长(秒)",
+                "addToCarts": "加购数",
+                "checkouts": "发结数"
+            })
+            md_section += render_markdown_table(
                 headers,
-                rows_data,
+                frame,
                 {
                     "跳出率(%)": lambda x: f"{x:.2f}",
                     "平均访问时长(秒)": lambda x: f"{x:.2f}"
@@ -210,30 +306,19 @@ def get_ga4_summary(start_date_dt, end_date_dt):
         markdown_output.append(md_section)
 
         # 2. 各个页面的：停留时长，跳出率
-        logger.info("获取GA4数据: 各个页面")
-        page_metrics_response = client.run_ga_report(
-            dimensions=["pagePath"],
-            metrics=["screenPageViews", "averageSessionDuration", "engagementRate"],
-            date_ranges=date_range,
-            order_bys=[OrderBy(metric=OrderBy.MetricOrderBy(metric_name="screenPageViews"), desc=True)],
-            limit=100
-        )
         md_section = "#### 2. 各个页面 (按浏览量前100)\n"
-        if page_metrics_response and "rows" in page_metrics_response:
+        frame = ga4_report_to_frame(page_metrics_response)
+        if frame is not None:
             headers = ["页面路径", "浏览量", "平均会话时长(秒)", "跳出率(%)"]
-            rows_data = []
-            for row in page_metrics_response["rows"]:
-                engagement_rate = float(row["metricValues"][2]["value"])
-                bounce_rate = (1 - engagement_rate) * 100
-                rows_data.append({
-                    "页面路径": row["dimensionValues"][0]["value"],
-                    "浏览量": int(row["metricValues"][0]["value"]),
-                    "平均会话时长(秒)": float(row["metricValues"][1]["value"]),
-                    "跳出率(%)": bounce_rate
-                })
-            md_section += format_report_data_to_markdown_table(
-                headers, 
-                rows_data,
+            frame["跳出率(%)"] = (1 - frame["engagementRate"]) * 100
+            frame = frame.rename(columns={
+                "pagePath": "页面路径",
+                "screenPageViews": "浏览量",
+                "averageSessionDuration": "平均会话时长(秒)"
+            })
+            md_section += render_markdown_table(
+                headers,
+                frame,
                 {"平均会话时长(秒)": lambda x: f"{x:.2f}", "跳出率(%)": lambda x: f"{x:.2f}"}
             )
         else:
@@ -241,22 +326,13 @@ def get_ga4_summary(start_date_dt, end_date_dt):
         markdown_output.append(md_section)
 
         # 3. 会话深度：跳出率，加购数，结账数
-        logger.info("获取GA4数据: 总体跳出率、加购、结账")
-        overall_conversion_metrics = client.run_ga_report(
-            dimensions=[],
-            metrics=["sessions", "engagedSessions", "addToCarts", "checkouts"],
-            date_ranges=date_range
-        )
         md_section = "#### 3. 整体站点表现 (会话相关)\n"
-        if overall_conversion_metrics and "rows" in overall_conversion_metrics:
-            row = overall_conversion_metrics["rows"][0]
-            total_sessions = int(row["metricValues"][0]["value"])
-            engaged_sessions = int(row["metricValues"][1]["value"])
-            add_to_carts = int(row["metricValues"][2]["value"])
-            checkouts = int(row["metricValues"][3]["value"])
-
-            engagement_rate_overall = (engaged_sessions / total_sessions) if total_sessions > 0 else 0
-            bounce_rate_overall = (1 - engagement_rate_overall) * 100
+        frame = ga4_report_to_frame(overall_conversion_metrics)
+        if frame is not None:
+            row = frame.iloc[0]
+            add_to_carts = int(row["addToCarts"])
+            checkouts = int(row["checkouts"])
+            bounce_rate_overall = float(bounce_rate_percent(row["engagedSessions"], row["sessions"]))
             
             md_section += f"    - **总跳出率**: {bounce_rate_overall:.2f}%\n"
             md_section += f"    - **总加购数 (事件: addToCarts)**: {add_to_carts}\n"
@@ -266,17 +342,12 @@ def get_ga4_summary(start_date_dt, end_date_dt):
         markdown_output.append(md_section)
 
         # 4. 访问深度：访客数/访问量
-        logger.info("获取GA4数据: 访问深度 (总用户与会话)")
-        total_users_response = client.run_ga_report(
-            dimensions=[],
-            metrics=["activeUsers", "sessions"],
-            date_ranges=date_range
-        )
         md_section = "#### 4. 访问深度\n"
-        if total_users_response and "rows" in total_users_response:
-            row = total_users_response["rows"][0]
-            total_active_users = int(row["metricValues"][0]["value"])
-            total_sessions_for_depth = int(row["metricValues"][1]["value"])
+        frame = ga4_report_to_frame(total_users_response)
+        if frame is not None:
+            row = frame.iloc[0]
+            total_active_users = int(row["activeUsers"])
+            total_sessions_for_depth = int(row["sessions"])
             md_section += f"    - **总访客数 (活跃用户)**: {total_active_users}\n"
             md_section += f"    - **总访问量 (会话数)**: {total_sessions_for_depth}\n"
         else:
@@ -284,40 +355,21 @@ def get_ga4_summary(start_date_dt, end_date_dt):
         markdown_output.append(md_section)
 
         # 5. PC端移动端的：访客，跳出率，平均访问时长，加购数，结账数
-        logger.info("获取GA4数据: PC与移动端对比")
-        device_metrics_response = client.run_ga_report(
-            dimensions=["deviceCategory"],
-            metrics=["activeUsers", "sessions", "engagedSessions", "averageSessionDuration", "addToCarts", "checkouts"],
-            date_ranges=date_range,
-            limit=100
-        )
         md_section = "#### 5. PC端 vs 移动端表现\n"
-        if device_metrics_response and "rows" in device_metrics_response:
+        frame = ga4_report_to_frame(device_metrics_response)
+        if frame is not None:
             headers = ["设备类型", "活跃用户", "跳出率(%)", "平均会话时长(秒)", "加购数", "结账数"]
-            rows_data = []
-            for row in device_metrics_response["rows"]:
-                device_cat = row["dimensionValues"][0]["value"]
-                active_users_dev = int(row["metricValues"][0]["value"])
-                sessions_dev = int(row["metricValues"][1]["value"])
-                engaged_sessions_dev = int(row["metricValues"][2]["value"])
-                avg_session_duration_dev = float(row["metricValues"][3]["value"])
-                add_to_carts_dev = int(row["metricValues"][4]["value"])
-                checkouts_dev = int(row["metricValues"][5]["value"])
-
-                engagement_rate_dev = (engaged_sessions_dev / sessions_dev) if sessions_dev > 0 else 0
-                bounce_rate_dev = (1 - engagement_rate_dev) * 100
-                
-                rows_data.append({
-                    "设备类型": device_cat,
-                    "活跃用户": active_users_dev,
-                    "跳出率(%)": bounce_rate_dev,
-                    "平均会话时长(秒)": avg_session_duration_dev,
-                    "加购数": add_to_carts_dev,
-                    "结账数": checkouts_dev
-                })
-            md_section += format_report_data_to_markdown_table(
-                headers, 
-                rows_data,
+            frame["跳出率(%)"] = bounce_rate_percent(frame["engagedSessions"], frame["sessions"])
+            frame = frame.rename(columns={
+                "deviceCategory": "设备类型",
+                "activeUsers": "活跃用户",
+                "averageSessionDuration": "平均会话时长(秒)",
+                "addToCarts": "加购数",
+                "checkouts": "结账数"
+            })
+            md_section += render_markdown_table(
+                headers,
+                frame,
                 {"跳出率(%)": lambda x: f"{x:.2f}", "平均会话时长(秒)": lambda x: f"{x:.2f}"}
             )
         else:
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import jwt
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，退化为仅依赖原子替换保证文件完整
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+GA4_SCOPE = "https://www.googleapis.com/auth/analytics.readonly"
+GSC_SCOPE = "https://www.googleapis.com/auth/webmasters.readonly"
+TOKEN_LIFETIME_SECONDS = 3600 # JWT 断言申请的令牌有效期
+TOKEN_REFRESH_MARGIN_SECONDS = 300 # 距过期不足该秒数时提前刷新
+DEFAULT_DATA_STATE_DIR = "data_state"
+TOKEN_CACHE_FILE_NAME = "google_token_cache.json"
+
+_memory_tokens = {}
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def is_token_disk_cache_enabled():
+    """是否启用磁盘令牌缓存，可通过环境变量 GOOGLE_TOKEN_DISK_CACHE=false 关闭。"""
+    return os.getenv("GOOGLE_TOKEN_DISK_CACHE", "true").lower() in ("1", "true", "yes")
+
+
+def get_token_cache_path():
+    return os.path.join(os.getenv("DATA_STATE_DIR", DEFAULT_DATA_STATE_DIR), TOKEN_CACHE_FILE_NAME)
+
+
+def _cache_key(client_email, scope):
+    # 不以明文保存账号邮箱
+    return hashlib.sha256(f"{client_email}|{scope}".encode("utf-8")).hexdigest()
+
+
+def _is_fresh(entry):
+    return bool(entry) and entry.get("expires_at", 0) - TOKEN_REFRESH_MARGIN_SECONDS > time.time()
+
+
+def _key_lock(key):
+    with _key_locks_guard:
+        if key not in _key_locks:
+            _key_locks[key] = threading.Lock()
+        return _key_locks[key]
+
+
+class _TokenCacheFile:
+    """
+    磁盘令牌缓存。读写期间持有 `<缓存文件>.lock` 上的排他锁，多个进程同时运行时只有一个去换取令牌，
+    其余进程等待后直接读取；文件权限为 0600，写入采用临时文件 + 原子替换。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if fcntl:
+            self._lock_file = open(f"{self.path}.lock", "a")
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._lock_file:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取Google令牌缓存 {self.path} 失败，将重新获取令牌: {e}")
+            return {}
+
+    def write(self, entries):
+        now = time.time()
+        entries = {key: entry for key, entry in entries.items() if entry.get("expires_at", 0) > now}
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path) # 原子替换，避免中断时留下半个文件
+
+
+def _exchange_token(client_email, private_key, scope):
+    """签发 RS256 JWT 断言并换取访问令牌，返回 {"access_token", "expires_at"}。"""
+    now = int(time.time())
+    header = {
+        "alg": "RS256",
+        "typ": "JWT"
+    }
+
+    payload = {
+        "iss": client_email,
+        "sub": client_email,
+        "aud": GOOGLE_TOKEN_URL,
+        "iat": now,
+        "exp": now + TOKEN_LIFETIME_SECONDS,
+        "scope": scope
+    }
+    jwt_token = jwt.encode(payload, private_key, algorithm="RS256", headers=header)
+    response = requests.post(
+        GOOGLE_TOKEN_URL,
+        data={
+            "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+            "assertion": jwt_token
+        },
+        timeout=60
+    )
+    response.raise_for_status()
+    token_data = response.json()
+    return {"access_token": token_data["access_token"], "expires_at": now + token_data["expires_in"]}
+
+
+def get_service_account_token(client_email, private_key, scope, label="Google", key_env_name=None):
+    """
+    获取服务账户访问令牌，按 (账号, scope) 缓存。
+
+    先查进程内缓存，再查磁盘缓存 (DATA_STATE_DIR/google_token_cache.json)，都没有或即将过期
+    (不足 TOKEN_REFRESH_MARGIN_SECONDS) 时才签发 JWT 换取新令牌，并写回两级缓存。
+
+    Args:
+        client_email (str): 服务账户邮箱。
+        private_key (str): PEM 格式私钥 (换行符已还原)。
+        scope (str): OAuth scope。
+        label (str): 日志中的数据源名称，例如 "GA4"、"GSC"。
+        key_env_name (str, optional): 私钥所在的环境变量名，用于错误提示。
+
+    Raises:
+        ValueError: 账号或私钥未配置。
+        jwt.exceptions.InvalidKeyError / requests.exceptions.RequestException: 签名或换取令牌失败。
+    """
+    if not private_key or not client_email:
+        logger.error(f"{label}客户端邮件或私钥未配置。")
+        raise ValueError(f"{label}客户端邮件或私钥未配置。")
+
+    key = _cache_key(client_email, scope)
+    entry = _memory_tokens.get(key)
+    if _is_fresh(entry):
+        return entry["access_token"]
+
+    key_env_name = key_env_name or f"VITE_{label}_PRIVATE_KEY"
+    with _key_lock(key):
+        # 等锁期间可能已有其他线程刷新了令牌
+        entry = _memory_tokens.get(key)
+        if _is_fresh(entry):
+            return entry["access_token"]
+        try:
+            if is_token_disk_cache_enabled():
+                with _TokenCacheFile(get_token_cache_path()) as cache_file:
+                    entries = cache_file.read()
+                    entry = entries.get(key)
+                    if not _is_fresh(entry):
+                        entry = _exchange_token(client_email, private_key, scope)
+                        entries[key] = entry
+                        cache_file.write(entries)
+                    else:
+                        logger.debug(f"使用磁盘缓存的{label}访问令牌")
+            else:
+                entry = _exchange_token(client_email, private_key, scope)
+        except jwt.exceptions.InvalidKeyError as ike:
+            logger.error(f"{label} JWT无效密钥错误: {str(ike)} - 这通常意味着私钥格式无法被解析。请检查{key_env_name}环境变量。确保BEGIN/END标记存在且换行符正确。")
+            raise
+        except Exception as e:
+            logger.error(f"获取{label}访问令牌失败: {str(e)}")
+            if "Could not deserialize key data" in str(e) or "parse" in str(e).lower():
+                logger.error(f"详细错误提示：{label}私钥解析失败。请检查{key_env_name}环境变量中的私钥格式，确保BEGIN/END标记完整，并且换行符（\\n）正确无误。不要使用字面上的\\\\n。")
+            raise
+        _memory_tokens[key] = entry
+        return entry["access_token"]
@@ -1,39 +1,42 @@
 import os
-import json
-import time
-import jwt
+import threading
 import requests
+import requests.adapters
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import logging
+from connectors.google_auth import get_service_account_token, GSC_SCOPE
+from connectors.report_cache import ReportCache
+from connectors.paging import iter_pages, get_page_concurrency
+from connectors.markdown_tables import render_markdown_table
+from connectors.report_frames import gsc_report_to_frame
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
 
 logger = logging.getLogger(__name__)
 
+GSC_PAGE_SIZE = 25000 # searchAnalytics.query 单次请求的最大行数
+DEFAULT_GSC_MAX_CONCURRENCY = 4 # 同时进行的 GSC 查询数，与 Search Console 每用户的 QPS 配额相匹配
+GSC_REQUEST_TIMEOUT = 60 # GSC API 请求超时 (秒)
+GSC_FINALIZED_AFTER_DAYS = 3 # GSC 数据通常有 2-3 天延迟，之后不再变化，可永久缓存
+
 load_dotenv()
 
-def format_gsc_data_to_markdown_table(headers, rows_data, metric_formatters=None):
-    if not rows_data:
-        return "    - 无数据\n"
-    table = f"| {' | '.join(headers)} |\n"
-    table += f"|{'|'.join(['---'] * len(headers))}|\n"
-    for r_data in rows_data:
-        formatted_row = []
-        for header in headers:
-            value = r_data.get(header, 'N/A')
-            if metric_formatters and header in metric_formatters:
-                try:
-                    value = metric_formatters[header](value)
-                except Exception:
-                    pass 
-            formatted_row.append(str(value))
-        table += f"| {' | '.join(formatted_row)} |\n"
-    return table
+def get_gsc_max_concurrency():
+    """GSC 查询并发数，可通过环境变量 GSC_MAX_CONCURRENCY 覆盖。"""
+    try:
+        return max(1, int(os.getenv("GSC_MAX_CONCURRENCY", DEFAULT_GSC_MAX_CONCURRENCY)))
+    except ValueError:
+        logger.warning(f"GSC_MAX_CONCURRENCY环境变量值无效，将使用默认值: {DEFAULT_GSC_MAX_CONCURRENCY}")
+        return DEFAULT_GSC_MAX_CONCURRENCY
+
+def is_gsc_query_table_enabled():
+    """是否获取"热门搜索词"表格，可通过环境变量 GSC_INCLUDE_QUERY_TABLE=false 关闭。"""
+    return os.getenv("GSC_INCLUDE_QUERY_TABLE", "true").lower() in ("1", "true", "yes")
 
 class GSCClient:
     def __init__(self):
-        self.access_token = None
-        self.token_expiry = None
         self.site_url = os.getenv("VITE_GSC_SITE_URL")
         self.client_email = os.getenv("VITE_GSC_CLIENT_EMAIL")
         raw_private_key = os.getenv("VITE_GSC_PRIVATE_KEY", "")
@@ -48,61 +51,25 @@ class GSCClient:
             logger.warning("GSC私钥格式似乎不正确。请确保它包含完整的BEGIN/END标记并且换行符正确。")
 
         self.api_url = "https://www.googleapis.com/webmasters/v3/sites"
+        self.cache = ReportCache("gsc", GSC_FINALIZED_AFTER_DAYS)
+        self.max_concurrency = get_gsc_max_concurrency()
+        # 所有查询共用一个长连接会话，连接池大小与并发数一致
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("https://", adapter)
+        self._request_slots = threading.BoundedSemaphore(self.max_concurrency) # 总体概要的分页读取也计入并发上限
 
     def get_access_token(self):
-        """获取访问令牌"""
-        if self.access_token and self.token_expiry and time.time() < self.token_expiry:
-            return self.access_token
-
-        now = int(time.time())
-        header = {
-            "alg": "RS256",
-            "typ": "JWT"
-        }
-        
-        payload = {
-            "iss": self.client_email,
-            "sub": self.client_email,
-            "aud": "https://oauth2.googleapis.com/token",
-            "iat": now,
-            "exp": now + 3600,
-            "scope": "https://www.googleapis.com/auth/webmasters.readonly"
-        }
-
-        try:
-            if not self.private_key or not self.client_email:
-                logger.error("GSC客户端邮件或私钥未配置。")
-                raise ValueError("GSC客户端邮件或私钥未配置。")
-            jwt_token = jwt.encode(payload, self.private_key, algorithm="RS256", headers=header)
-            response = requests.post(
-                "https://oauth2.googleapis.com/token",
-                data={
-                    "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
-                    "assertion": jwt_token
-                }
-            )
-            response.raise_for_status()
-            token_data = response.json()
-            self.access_token = token_data["access_token"]
-            self.token_expiry = now + token_data["expires_in"]
-            return self.access_token
-        except jwt.exceptions.InvalidKeyError as ike:
-            logger.error(f"GSC JWT无效密钥错误: {str(ike)} - 这通常意味着私钥格式无法被解析。请检查VITE_GSC_PRIVATE_KEY环境变量。确保BEGIN/END标记存在且换行符正确。")
-            raise
-        except Exception as e:
-            logger.error(f"获取GSC访问令牌失败: {str(e)}")
-            if "Could not deserialize key data" in str(e) or "parse" in str(e).lower():
-                 logger.error("详细错误提示：GSC私钥解析失败。请检查VITE_GSC_PRIVATE_KEY环境变量中的私钥格式，确保BEGIN/END标记完整，并且换行符（\n）正确无误。不要使用字面上的\\n。")
-            raise
+        """获取访问令牌 (由 google_auth 统一缓存并在过期前刷新)"""
+        return get_service_account_token(self.client_email, self.private_key, GSC_SCOPE, label="GSC")
 
-    def query_search_analytics(self, start_date, end_date, dimensions, row_limit=10, search_type='web'):
+    def query_search_analytics(self, start_date, end_date, dimensions, row_limit=10, search_type='web', start_row=0):
         """运行GSC报告"""
         if not self.site_url:
             logger.error("GSC站点URL未配置。")
             return None
 
         try:
-            token = self.get_access_token()
             site_url_encoded = quote_plus(self.site_url)
             api_url = f"{self.api_url}/{site_url_encoded}/searchAnalytics/query"
             
@@ -113,21 +80,80 @@ class GSCClient:
                 'rowLimit': row_limit,
                 'searchType': search_type
             }
+            if start_row:
+                request_body['startRow'] = start_row
+            cache_key = ReportCache.make_key(site_url=self.site_url, query=request_body)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+            token = self.get_access_token()
 
-            response = requests.post(
-                api_url,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                },
-                json=request_body
-            )
+            with self._request_slots:
+                response = self.session.post(
+                    api_url,
+                    headers={
+                        "Authorization": f"Bearer {token}",
+                        "Content-Type": "application/json"
+                    },
+                    json=request_body,
+                    timeout=GSC_REQUEST_TIMEOUT
+                )
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+            self.cache.set(cache_key, result, end_date)
+            return result
         except Exception as e:
             logger.error(f"GSC API请求失败 (维度: {dimensions}): {e}", exc_info=True)
             return None
 
+    def run_queries(self, query_specs):
+        """
+        并发运行多个互不依赖的查询，同时进行的请求数不超过 GSC_MAX_CONCURRENCY。
+
+        Args:
+            query_specs (list): 每项为 query_search_analytics 的关键字参数。
+
+        Returns:
+            list: 与 query_specs 顺序一致的响应，失败的查询为 None。
+        """
+        if not query_specs:
+            return []
+        try:
+            self.get_access_token() # 并发前先获取令牌，避免多个线程同时换取
+        except Exception:
+            return [None] * len(query_specs)
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(query_specs))) as executor:
+            return list(executor.map(lambda spec: self.query_search_analytics(**spec), query_specs))
+
+    def iter_search_analytics_rows(self, start_date, end_date, dimensions, search_type='web', page_size=GSC_PAGE_SIZE, max_rows=None, concurrency=None):
+        """
+        按 startRow 分页读取全部行，逐行产出，不受单次请求 25000 行的限制。
+
+        GSC 不返回总行数，返回行数不足 page_size 的一页即为最后一页。concurrency > 1 时
+        (默认读取 REPORT_PAGE_CONCURRENCY) 预取后续页，末尾最多多请求 concurrency - 1 个空页。
+        某一页请求失败时记录错误并停止迭代。
+
+        Yields:
+            dict: GSC 响应中的 row ({"keys", "clicks", "impressions", "ctr", "position"})。
+        """
+        concurrency = concurrency or get_page_concurrency()
+
+        def fetch_page(start_row):
+            return self.query_search_analytics(start_date, end_date, dimensions, page_size, search_type, start_row)
+
+        fetched = 0
+        for page in iter_pages(fetch_page, count(0, page_size), concurrency):
+            if page is None:
+                logger.error(f"GSC 分页读取在 startRow={fetched} 处失败 (维度: {dimensions})")
+                return
+            rows = page.get('rows', [])
+            if max_rows is not None:
+                rows = rows[:max_rows - fetched]
+            yield from rows
+            fetched += len(rows)
+            if len(rows) < page_size or (max_rows is not None and fetched >= max_rows):
+                return
+
 def get_gsc_summary(start_date_dt, end_date_dt):
     if not (os.getenv("VITE_GSC_SITE_URL") and os.getenv("VITE_GSC_CLIENT_EMAIL") and os.getenv("VITE_GSC_PRIVATE_KEY")):
         logger.warning("GSC环境变量未完全配置。")
@@ -140,23 +166,32 @@ def get_gsc_summary(start_date_dt, end_date_dt):
         
         markdown_output = [f"### GSC 数据 ({start_date_str} to {end_date_str})\n"]
 
+        # 总体概要与各维度表格互不依赖，并发获取
+        include_query_table = is_gsc_query_table_enabled()
+        table_dimensions = ['query', 'page', 'country', 'device'] if include_query_table else ['page', 'country', 'device']
+        logger.info(f"获取GSC数据: 总体概要、按 {', '.join(table_dimensions)}")
+        # 不带维度的查询直接返回一行汇总指标 (与 GSC 后台一致，含匿名搜索词)，无需下载全部搜索词再求和
+        query_specs = [{"start_date": start_date_str, "end_date": end_date_str, "dimensions": [], "row_limit": 1}]
+        query_specs += [
+            {"start_date": start_date_str, "end_date": end_date_str, "dimensions": [dimension], "row_limit": 100}
+            for dimension in table_dimensions
+        ]
+        results = client.run_queries(query_specs)
+        totals_data = results[0]
+        table_data = dict(zip(table_dimensions, results[1:]))
+        query_data = table_data.get('query')
+        page_data = table_data['page']
+        country_data = table_data['country']
+        device_data = table_data['device']
+
         # 1. 总体概要指标
-        logger.info("获取GSC数据: 总体概要")
-        data_for_totals = client.query_search_analytics(start_date_str, end_date_str, dimensions=['query'], row_limit=25000)
-        
-        total_clicks = 0
-        total_impressions = 0
-        avg_ctr = 0
-        avg_position = 0
-
-        if data_for_totals and data_for_totals.get('rows'):
-            rows_for_totals = data_for_totals.get('rows', [])
-            total_clicks = sum(r.get('clicks', 0) for r in rows_for_totals)
-            total_impressions = sum(r.get('impressions', 0) for r in rows_for_totals)
-            if total_impressions > 0:
-                avg_ctr = sum(r.get('ctr', 0) * r.get('impressions', 0) for r in rows_for_totals) / total_impressions
-                avg_position = sum(r.get('position', 0) * r.get('impressions', 0) for r in rows_for_totals) / total_impressions
-            
+        if totals_data and totals_data.get('rows'):
+            totals_row = totals_data['rows'][0]
+            total_clicks = totals_row.get('clicks', 0)
+            total_impressions = totals_row.get('impressions', 0)
+            avg_ctr = totals_row.get('ctr', 0)
+            avg_position = totals_row.get('position', 0)
+
             markdown_output.append(f"- **总点击量**: {total_clicks}")
             markdown_output.append(f"- **总展示量**: {total_impressions}")
             markdown_output.append(f"- **平均点击率**: {avg_ctr*100:.2f}%")
@@ -169,81 +204,47 @@ def get_gsc_summary(start_date_dt, end_date_dt):
         metric_formatters_combined = {**metric_formatters_pct, **metric_formatters_pos}
 
         # 2. 按"搜索词" (Query) 的详细表格
-        logger.info("获取GSC数据: 按搜索词")
-        query_data = client.query_search_analytics(start_date_str, end_date_str, dimensions=['query'], row_limit=100)
         md_section = "#### 1. 热门搜索词 (前100)\n"
-        if query_data and query_data.get('rows'):
+        frame = gsc_report_to_frame(query_data, ['query'])
+        if frame is not None:
             headers = ["搜索词", "点击量", "展示量", "点击率(%)", "平均排名"]
-            rows_for_table = []
-            for row in query_data['rows']:
-                rows_for_table.append({
-                    "搜索词": row['keys'][0],
-                    "点击量": row.get('clicks', 0),
-                    "展示量": row.get('impressions', 0),
-                    "点击率(%)": row.get('ctr', 0),
-                    "平均排名": row.get('position', 0)
-                })
-            md_section += format_gsc_data_to_markdown_table(headers, rows_for_table, metric_formatters_combined)
+            frame = frame.rename(columns=dict(zip(['query', 'clicks', 'impressions', 'ctr', 'position'], headers)))
+            md_section += render_markdown_table(headers, frame, metric_formatters_combined)
+        elif not include_query_table:
+            md_section += "    - 未获取 (GSC_INCLUDE_QUERY_TABLE=false)\n"
         else:
             md_section += "    - 数据获取失败或无数据\n"
         markdown_output.append(md_section)
 
         # 3. 按"页面" (Page) 的详细表格
-        logger.info("获取GSC数据: 按页面")
-        page_data = client.query_search_analytics(start_date_str, end_date_str, dimensions=['page'], row_limit=100)
         md_section = "#### 2. 热门页面 (前100)\n"
-        if page_data and page_data.get('rows'):
+        frame = gsc_report_to_frame(page_data, ['page'])
+        if frame is not None:
             headers = ["页面URL", "点击量", "展示量", "点击率(%)", "平均排名"]
-            rows_for_table = []
-            for row in page_data['rows']:
-                rows_for_table.append({
-                    "页面URL": row['keys'][0],
-                    "点击量": row.get('clicks', 0),
-                    "展示量": row.get('impressions', 0),
-                    "点击率(%)": row.get('ctr', 0),
-                    "平均排名": row.get('position', 0)
-                })
-            md_section += format_gsc_data_to_markdown_table(headers, rows_for_table, metric_formatters_combined)
+            frame = frame.rename(columns=dict(zip(['page', 'clicks', 'impressions', 'ctr', 'position'], headers)))
+            md_section += render_markdown_table(headers, frame, metric_formatters_combined)
         else:
             md_section += "    - 数据获取失败或无数据\n"
         markdown_output.append(md_section)
 
         # 4. 按"国家" (Country) 的详细表格
-        logger.info("获取GSC数据: 按国家")
-        country_data = client.query_search_analytics(start_date_str, end_date_str, dimensions=['country'], row_limit=100)
         md_section = "#### 3. 主要国家 (前100)\n"
-        if country_data and country_data.get('rows'):
+        frame = gsc_report_to_frame(country_data, ['country'])
+        if frame is not None:
             headers = ["国家", "点击量", "展示量", "点击率(%)", "平均排名"]
-            rows_for_table = []
-            for row in country_data['rows']:
-                rows_for_table.append({
-                    "国家": row['keys'][0],
-                    "点击量": row.get('clicks', 0),
-                    "展示量": row.get('impressions', 0),
-                    "点击率(%)": row.get('ctr', 0),
-                    "平均排名": row.get('position', 0)
-                })
-            md_section += format_gsc_data_to_markdown_table(headers, rows_for_table, metric_formatters_combined)
+            frame = frame.rename(columns=dict(zip(['country', 'clicks', 'impressions', 'ctr', 'position'], headers)))
+            md_section += render_markdown_table(headers, frame, metric_formatters_combined)
         else:
             md_section += "    - 数据获取失败或无数据\n"
         markdown_output.append(md_section)
 
         # 5. 按"设备" (Device) 的详细表格
-        logger.info("获取GSC数据: 按设备")
-        device_data = client.query_search_analytics(start_date_str, end_date_str, dimensions=['device'], row_limit=100)
         md_section = "#### 4. 按设备类型\n"
-        if device_data and device_data.get('rows'):
+        frame = gsc_report_to_frame(device_data, ['device'])
+        if frame is not None:
             headers = ["设备类型", "点击量", "展示量", "点击率(%)", "平均排名"]
-            rows_for_table = []
-            for row in device_data['rows']:
-                rows_for_table.append({
-                    "设备类型": row['keys'][0],
-                    "点击量": row.get('clicks', 0),
-                    "展示量": row.get('impressions', 0),
-                    "点击率(%)": row.get('ctr', 0),
-                    "平均排名": row.get('position', 0)
-                })
-            md_section += format_gsc_data_to_markdown_table(headers, rows_for_table, metric_formatters_combined)
+            frame = frame.rename(columns=dict(zip(['device', 'clicks', 'impressions', 'ctr', 'position'], headers)))
+            md_section += render_markdown_table(headers, frame, metric_formatters_combined)
         else:
             md_section += "    - 数据获取失败或无数据\n"
         markdown_output.append(md_section)
@@ -0,0 +1,74 @@
+import logging
+from itertools import repeat
+
+logger = logging.getLogger(__name__)
+
+EMPTY_TABLE_MARKDOWN = "    - 无数据\n"
+MISSING_VALUE = "N/A"
+DEFAULT_BLOCK_ROWS = 1000 # 分块渲染的行数，流式写文件时内存占用与总行数无关
+
+
+def _as_list(column):
+    # DataFrame 列 / numpy 数组转为 Python 原生值，保证 str() 的输出与普通数值一致；list 直接使用，不复制
+    if isinstance(column, list):
+        return column
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+
+def _format_column(values, formatter):
+    """整列应用格式化函数；只有整列失败时才退回逐个单元格处理，失败的单元格保留原值。"""
+    if formatter is None:
+        return list(map(str, values))
+    try:
+        return list(map(str, map(formatter, values)))
+    except Exception:
+        pass
+    formatted = []
+    for value in values:
+        try:
+            value = formatter(value)
+        except Exception:
+            pass
+        formatted.append(str(value))
+    return formatted
+
+
+def iter_markdown_table(headers, columns, formatters=None, block_rows=DEFAULT_BLOCK_ROWS):
+    """
+    按块产出 Markdown 表格文本，每块至多 block_rows 行。
+
+    Args:
+        headers (list): 表头，同时是 columns 中的列名。
+        columns: {列名: 列}，可以是 dict 或 DataFrame；不存在的列输出 N/A。
+        formatters (dict, optional): {列名: 格式化函数}，每列只查找一次。
+    """
+    formatters = formatters or {}
+    data = [_as_list(columns[header]) if header in columns else None for header in headers]
+    row_count = max((len(values) for values in data if values is not None), default=0)
+    if row_count == 0:
+        yield EMPTY_TABLE_MARKDOWN
+        return
+    column_formatters = [formatters.get(header) for header in headers]
+
+    yield f"| {' | '.join(headers)} |\n|{'|'.join(['---'] * len(headers))}|\n"
+    for start in range(0, row_count, block_rows):
+        end = min(start + block_rows, row_count)
+        cells = [
+            _format_column(values[start:end], formatter) if values is not None else repeat(MISSING_VALUE, end - start)
+            for values, formatter in zip(data, column_formatters)
+        ]
+        yield "".join([f"| {' | '.join(row)} |\n" for row in zip(*cells)])
+
+
+def render_markdown_table(headers, columns, formatters=None):
+    """渲染完整的 Markdown 表格，没有数据时返回"无数据"提示。"""
+    return "".join(iter_markdown_table(headers, columns, formatters))
+
+
+def write_markdown_table(out, headers, columns, formatters=None, block_rows=DEFAULT_BLOCK_ROWS):
+    """把 Markdown 表格分块写入文件对象 out，适合十万行级别的报告。返回写入的字符数。"""
+    written = 0
+    for block in iter_markdown_table(headers, columns, formatters, block_rows):
+        out.write(block)
+        written += len(block)
+    return written
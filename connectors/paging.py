@@ -0,0 +1,48 @@
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_PAGE_CONCURRENCY = 1 # 分页报告同时请求的页数，1 表示逐页顺序请求
+
+
+def get_page_concurrency():
+    """分页并发数，可通过环境变量 REPORT_PAGE_CONCURRENCY 覆盖。"""
+    try:
+        return max(1, int(os.getenv("REPORT_PAGE_CONCURRENCY", DEFAULT_REPORT_PAGE_CONCURRENCY)))
+    except ValueError:
+        logger.warning(f"REPORT_PAGE_CONCURRENCY环境变量值无效，将使用默认值: {DEFAULT_REPORT_PAGE_CONCURRENCY}")
+        return DEFAULT_REPORT_PAGE_CONCURRENCY
+
+
+def iter_pages(fetch_page, offsets, concurrency=1):
+    """
+    按 offsets 顺序产出 fetch_page(offset) 的结果。
+
+    concurrency > 1 时最多预取 concurrency 页，每取走一页再提交下一页，内存占用与总页数无关。
+    offsets 可以是无限序列 (例如总行数未知时)，调用方停止迭代后尚未开始的请求会被取消。
+    """
+    offsets = iter(offsets)
+    if concurrency <= 1:
+        for offset in offsets:
+            yield fetch_page(offset)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        window = deque()
+        try:
+            for offset in offsets:
+                window.append(executor.submit(fetch_page, offset))
+                if len(window) >= concurrency:
+                    break
+            while window:
+                yield window.popleft().result()
+                # 调用方取走一页后再补充预取，停止迭代时不会多提交请求
+                offset = next(offsets, None)
+                if offset is not None:
+                    window.append(executor.submit(fetch_page, offset))
+        finally:
+            for future in window:
+                future.cancel()
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_STATE_DIR = "data_state"
+REPORT_CACHE_DIR_NAME = "report_cache"
+DEFAULT_REPORT_CACHE_MAX_MB = 200 # 缓存目录总大小上限，超出时按最近最少使用淘汰
+DEFAULT_REPORT_CACHE_RECENT_TTL_SECONDS = 3600 # 尚未定稿日期的数据缓存时长
+REPORT_CACHE_EVICT_TO_RATIO = 0.9 # 淘汰到上限的该比例以下，避免每次写入都触发淘汰
+
+
+def is_report_cache_enabled():
+    """是否启用报告响应缓存，可通过环境变量 REPORT_CACHE_ENABLED=false 关闭。"""
+    return os.getenv("REPORT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _get_env_number(env_name, default):
+    try:
+        return max(0, float(os.getenv(env_name, default)))
+    except ValueError:
+        logger.warning(f"{env_name}环境变量值无效，将使用默认值: {default}")
+        return default
+
+
+class ReportCache:
+    """
+    GA4/GSC 报告响应的磁盘缓存，以请求参数的哈希为键 (内容寻址)。
+
+    - 请求的结束日期早于 today - finalized_after_days 时数据已定稿，永久缓存；
+    - 包含近期日期的响应只缓存 REPORT_CACHE_RECENT_TTL_SECONDS 秒；
+    - 目录总大小超过 REPORT_CACHE_MAX_MB 时按最近访问时间淘汰最旧的条目。
+    """
+
+    def __init__(self, namespace, finalized_after_days, directory=None, max_bytes=None, recent_ttl=None):
+        self.finalized_after_days = finalized_after_days
+        self.directory = directory or os.path.join(
+            os.getenv("DATA_STATE_DIR", DEFAULT_DATA_STATE_DIR), REPORT_CACHE_DIR_NAME, namespace
+        )
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            _get_env_number("REPORT_CACHE_MAX_MB", DEFAULT_REPORT_CACHE_MAX_MB) * 1024 * 1024
+        )
+        self.recent_ttl = recent_ttl if recent_ttl is not None else _get_env_number(
+            "REPORT_CACHE_RECENT_TTL_SECONDS", DEFAULT_REPORT_CACHE_RECENT_TTL_SECONDS
+        )
+        self.enabled = is_report_cache_enabled()
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @staticmethod
+    def make_key(**parts):
+        """由请求参数 (站点/媒体资源、维度、指标、日期范围、行数等) 计算缓存键。"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def is_finalized(self, end_date):
+        """end_date (YYYY-MM-DD) 是否已过数据定稿延迟。"""
+        try:
+            end_day = datetime.strptime(end_date, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            return False
+        return end_day <= (datetime.now() - timedelta(days=self.finalized_after_days)).date()
+
+    def get(self, key):
+        """返回缓存的响应，未命中或已过期时返回 None。"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取报告缓存 {path} 失败，将重新请求: {e}")
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at < time.time():
+            return None
+        try:
+            os.utime(path) # 记录最近访问时间，供淘汰使用
+        except OSError:
+            pass
+        return entry.get("response")
+
+    def set(self, key, response, end_date):
+        """写入响应；end_date 已定稿时永久有效，否则在 recent_ttl 秒后过期。"""
+        if not self.enabled or response is None:
+            return
+        finalized = self.is_finalized(end_date)
+        if not finalized and self.recent_ttl <= 0:
+            return
+        entry = {
+            "expires_at": None if finalized else time.time() + self.recent_ttl,
+            "response": response,
+        }
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path) # 原子替换，避免并发读到半个文件
+            self._account(os.path.getsize(path) - old_size)
+        except OSError as e:
+            logger.warning(f"写入报告缓存 {path} 失败: {e}")
+
+    def _scan(self):
+        """返回 [(最近访问时间, 大小, 路径)]。"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _account(self, delta):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += delta
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * REPORT_CACHE_EVICT_TO_RATIO
+        evicted = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        self._total_bytes = total
+        logger.info(f"报告缓存超过 {self.max_bytes} 字节，已淘汰 {evicted} 个最久未使用的条目")
@@ -0,0 +1,84 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+GA4_INTEGER_METRIC_TYPES = ("TYPE_INTEGER",) # 其余 GA4 指标类型 (FLOAT/SECONDS/CURRENCY 等) 按浮点数解码
+GSC_INTEGER_METRICS = ("clicks", "impressions")
+GSC_FLOAT_METRICS = ("ctr", "position")
+
+
+def _column(values, dtype):
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError):
+        # 个别值无法解析时 (例如空字符串) 整列退化为逐值解析，无法解析的记为 NaN
+        return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy()
+
+
+def ga4_rows_to_frame(rows, dimension_names, metric_headers):
+    """
+    把 GA4 的行按列解码为 DataFrame：维度列为字符串，指标列按 metricHeaders 中的类型转换，
+    TYPE_INTEGER 为 int64，其余为 float64。rows 可以是 GA4Client.iter_report_rows 的生成器。
+
+    Args:
+        rows (iterable): GA4 响应中的 row ({"dimensionValues", "metricValues"})。
+        dimension_names (list): 维度名，与 dimensionValues 顺序一致。
+        metric_headers (list): GA4 响应中的 metricHeaders ({"name", "type"})。
+    """
+    dimension_values = [[] for _ in dimension_names]
+    metric_values = [[] for _ in metric_headers]
+    for row in rows:
+        for values, cell in zip(dimension_values, row.get("dimensionValues", [])):
+            values.append(cell.get("value"))
+        for values, cell in zip(metric_values, row.get("metricValues", [])):
+            values.append(cell.get("value"))
+
+    columns = {name: np.array(values, dtype=object) for name, values in zip(dimension_names, dimension_values)}
+    for header, values in zip(metric_headers, metric_values):
+        dtype = np.int64 if header.get("type") in GA4_INTEGER_METRIC_TYPES else np.float64
+        columns[header["name"]] = _column(values, dtype)
+    return pd.DataFrame(columns)
+
+
+def ga4_report_to_frame(report):
+    """把单个 GA4 报告响应解码为 DataFrame，列名为维度名和指标名。报告为空或请求失败时返回 None。"""
+    if not report or "rows" not in report:
+        return None
+    dimension_names = [header["name"] for header in report.get("dimensionHeaders", [])]
+    return ga4_rows_to_frame(report["rows"], dimension_names, report.get("metricHeaders", []))
+
+
+def gsc_rows_to_frame(rows, dimensions):
+    """
+    把 GSC 的行按列解码为 DataFrame：每个维度一列 (来自 keys)，clicks/impressions 为 int64，
+    ctr/position 为 float64。rows 可以是 GSCClient.iter_search_analytics_rows 的生成器。
+    """
+    key_values = [[] for _ in dimensions]
+    metric_values = {name: [] for name in GSC_INTEGER_METRICS + GSC_FLOAT_METRICS}
+    for row in rows:
+        for values, key in zip(key_values, row.get("keys", [])):
+            values.append(key)
+        for name, values in metric_values.items():
+            values.append(row.get(name, 0))
+
+    columns = {name: np.array(values, dtype=object) for name, values in zip(dimensions, key_values)}
+    for name, values in metric_values.items():
+        columns[name] = _column(values, np.int64 if name in GSC_INTEGER_METRICS else np.float64)
+    return pd.DataFrame(columns)
+
+
+def gsc_report_to_frame(response, dimensions):
+    """把单个 GSC 查询响应解码为 DataFrame。响应为空或请求失败时返回 None。"""
+    if not response or not response.get("rows"):
+        return None
+    return gsc_rows_to_frame(response["rows"], dimensions)
+
+
+def bounce_rate_percent(engaged, total):
+    """由互动会话数和会话数 (标量或列) 计算跳出率百分比，会话数为 0 时互动率按 0 计。"""
+    engaged = np.asarray(engaged, dtype=np.float64)
+    total = np.asarray(total, dtype=np.float64)
+    engagement_rate = np.divide(engaged, total, out=np.zeros_like(engaged), where=total > 0)
+    return (1 - engagement_rate) * 100
@@ -1,5 +1,13 @@
 import os
+import json
+import time
+import random
+import hashlib
 import logging
+import threading
+import requests
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from woocommerce import API
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
@@ -8,16 +16,616 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def get_woo_orders_raw_data(start_date_dt, end_date_dt):
+WOO_PER_PAGE = 100 # 根据API限制和性能考虑调整
+WOO_MAX_PAGES = 200 # 最大200页 (200 * 100 = 20000订单)，防止无限循环或过多请求
+DEFAULT_WOO_FETCH_WORKERS = 1 # 默认串行分页，与原有行为一致
+WOO_ORDER_STATUSES = ("processing", "completed")
+WOO_WATERMARK_OVERLAP_SECONDS = 60 # 增量同步时水位线向前回退的秒数
+DEFAULT_DATA_STATE_DIR = "data_state" # 本地持久化状态 (水位线等) 的默认目录
+DEFAULT_WOO_SHARD_TARGET_ORDERS = 1000 # 分片模式下单个窗口的目标订单数 (10页)
+WOO_SHARD_MIN_WINDOW = timedelta(minutes=1) # 分片窗口的最小长度
+WOO_SHARD_WINDOW_OVERLAP = timedelta(seconds=1) # 相邻窗口的重叠时长，after/before 都不包含边界时刻本身
+DEFAULT_WOO_CHECKPOINT_TTL_HOURS = 48 # 超过该时长未更新的断点文件视为过期并删除
+DEFAULT_WOO_PAGE_MAX_RETRIES = 4 # 单页请求失败后的默认重试次数
+WOO_RETRY_BASE_DELAY = 1.0 # 重试退避基数 (秒)
+WOO_RETRY_MAX_DELAY = 30.0 # 单次重试等待上限 (秒)
+
+# 增量同步合并订单时依赖的字段，使用 _fields 投影时总会自动带上
+WOO_SYNC_REQUIRED_FIELDS = ("id", "status", "date_created", "date_modified_gmt")
+# 采集流程 (摘要、详细报告、逐单推送) 实际使用的订单字段，作为 REST _fields 投影发送
+# meta_data 只能整体请求：WordPress 的 _fields 嵌套路径按键名过滤，meta_data.key 会把列表条目全部滤掉，
+# 也无法按元数据键名筛选，不相关的条目在 WooOrder.from_api 解码时丢弃 (见 benchmarks/bench_woo_order_fields.py)
+WOO_ORDER_FIELDS = (
+    "id", "status", "currency", "total",
+    "date_created", "date_created_gmt", "date_modified_gmt",
+    "payment_method_title", "billing", "line_items", "meta_data",
+)
+
+
+WooLineItem = namedtuple("WooLineItem", ["name", "sku", "quantity", "total"])
+
+
+class WooOrder:
     """
-    获取WooCommerce在指定日期范围内的所有原始订单数据。
-    
-    Args:
-        start_date_dt (datetime): 开始日期
-        end_date_dt (datetime): 结束日期
+    紧凑订单记录，只保留采集流程用到的字段。
+
+    使用 __slots__ 避免每个实例的 __dict__；meta_data 只保留UTM/来源相关的条目和订单备注，
+    其余 (通常很大的) 插件元数据在解码时即被丢弃。
+    """
+    __slots__ = (
+        "id", "status", "currency", "total",
+        "date_created", "date_created_gmt", "date_modified_gmt",
+        "payment_method_title",
+        "billing_first_name", "billing_last_name", "billing_email", "billing_country",
+        "line_items", "meta_data",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_api(cls, order):
+        """从WooCommerce API返回的订单字典解码。"""
+        billing = order.get("billing") or {}
+        return cls(
+            id=order.get("id"),
+            status=order.get("status"),
+            currency=order.get("currency"),
+            total=order.get("total"),
+            date_created=order.get("date_created"),
+            date_created_gmt=order.get("date_created_gmt"),
+            date_modified_gmt=order.get("date_modified_gmt"),
+            payment_method_title=order.get("payment_method_title"),
+            billing_first_name=billing.get("first_name"),
+            billing_last_name=billing.get("last_name"),
+            billing_email=billing.get("email"),
+            billing_country=billing.get("country"),
+            line_items=tuple(
+                WooLineItem(li.get("name"), li.get("sku"), li.get("quantity"), li.get("total"))
+                for li in order.get("line_items", [])
+            ),
+            meta_data=tuple(
+                {"key": meta["key"], "value": meta.get("value")}
+                for meta in order.get("meta_data", [])
+                if isinstance(meta, dict) and _is_relevant_meta_key(meta.get("key"))
+            ),
+        )
+
+    def __repr__(self):
+        return f"WooOrder(id={self.id!r}, status={self.status!r}, total={self.total!r} {self.currency!r})"
+
+
+def _is_relevant_meta_key(key):
+    """订单元数据中只有UTM/来源参数和订单备注会被采集流程读取。"""
+    if not isinstance(key, str):
+        return False
+    key = key.lower()
+    return "utm" in key or "referer" in key or key == "_order_comments"
+
+
+class WooAPIError(Exception):
+    """WooCommerce API返回错误响应时抛出。retryable 为 True 表示临时错误 (429/5xx等)。"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def get_woo_fetch_workers():
+    """从环境变量 WOO_FETCH_WORKERS 读取并发分页的线程数，无效时回退为默认值。"""
+    try:
+        workers = int(os.getenv("WOO_FETCH_WORKERS", DEFAULT_WOO_FETCH_WORKERS))
+    except ValueError:
+        logger.warning(f"WOO_FETCH_WORKERS环境变量值无效，将使用默认值: {DEFAULT_WOO_FETCH_WORKERS}")
+        workers = DEFAULT_WOO_FETCH_WORKERS
+    return max(1, workers)
+
+
+def get_woo_shard_target_orders():
+    """分片模式下单个窗口的目标订单数 (环境变量 WOO_SHARD_TARGET_ORDERS)，超过则继续细分窗口。"""
+    try:
+        target = int(os.getenv("WOO_SHARD_TARGET_ORDERS", DEFAULT_WOO_SHARD_TARGET_ORDERS))
+    except ValueError:
+        logger.warning(f"WOO_SHARD_TARGET_ORDERS环境变量值无效，将使用默认值: {DEFAULT_WOO_SHARD_TARGET_ORDERS}")
+        target = DEFAULT_WOO_SHARD_TARGET_ORDERS
+    return max(WOO_PER_PAGE, target)
+
+
+def get_woo_page_max_retries():
+    """单页请求失败后的最大重试次数 (环境变量 WOO_PAGE_MAX_RETRIES)。"""
+    try:
+        retries = int(os.getenv("WOO_PAGE_MAX_RETRIES", DEFAULT_WOO_PAGE_MAX_RETRIES))
+    except ValueError:
+        logger.warning(f"WOO_PAGE_MAX_RETRIES环境变量值无效，将使用默认值: {DEFAULT_WOO_PAGE_MAX_RETRIES}")
+        retries = DEFAULT_WOO_PAGE_MAX_RETRIES
+    return max(0, retries)
+
+
+def get_woo_checkpoint_ttl_hours():
+    """断点文件的保留时长 (环境变量 WOO_CHECKPOINT_TTL_HOURS，小时)。"""
+    try:
+        ttl = float(os.getenv("WOO_CHECKPOINT_TTL_HOURS", DEFAULT_WOO_CHECKPOINT_TTL_HOURS))
+    except ValueError:
+        logger.warning(f"WOO_CHECKPOINT_TTL_HOURS环境变量值无效，将使用默认值: {DEFAULT_WOO_CHECKPOINT_TTL_HOURS}")
+        ttl = DEFAULT_WOO_CHECKPOINT_TTL_HOURS
+    return max(0.0, ttl)
+
+
+def get_data_state_dir():
+    """本地状态目录，可通过环境变量 DATA_STATE_DIR 覆盖。"""
+    return os.getenv("DATA_STATE_DIR", DEFAULT_DATA_STATE_DIR)
+
+
+class WooFetchCheckpoint:
+    """
+    断点续传文件 (JSON Lines)。每获取完一页 (含分片窗口内的页) 就追加一行记录，
+    内容为该页的订单和分页响应头；中断后以相同参数重新运行时，已完成的页直接从文件读取。
+    文件首行记录首次运行的精确时间范围，续传时沿用该范围，页面键才能与之前的记录对应。
+    全部获取完成后文件被删除。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pages = {}
+        self.bounds = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # 中断时可能留下不完整的最后一行
+                    if "bounds" in record:
+                        self.bounds = tuple(record["bounds"])
+                        continue
+                    self._pages[record["key"]] = (record["orders"], record["total_pages"], record["total_count"])
+            logger.info(f"从断点文件 {path} 恢复 {len(self._pages)} 个已完成的页面。")
+
+    def bind_bounds(self, after, before):
+        """返回本次运行应使用的 (after, before)：续传时沿用断点文件中的范围，否则记录传入的范围。"""
+        with self._lock:
+            if self.bounds is None:
+                self.bounds = (after, before)
+                self._append({"bounds": [after, before]})
+            return self.bounds
+
+    def _append(self, record):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def page_key(params, page):
+        return "|".join(str(params.get(name, "")) for name in ("after", "before", "modified_after")) + f"|{page}"
+
+    def get(self, params, page):
+        return self._pages.get(self.page_key(params, page))
+
+    def record(self, params, page, result):
+        key = self.page_key(params, page)
+        with self._lock:
+            self._append({"key": key, "orders": result[0], "total_pages": result[1], "total_count": result[2]})
+
+    def complete(self):
+        with self._lock:
+            self._pages.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _woo_checkpoint_path(store_url, base_params, start_dt, end_dt_exclusive, incremental, sharded):
+    """
+    断点文件由站点、请求参数和按天截断的日期范围确定。after/before 来自 datetime.now() 时
+    每次运行都不同，因此不参与计算；同一天内以相同日期范围重跑即可复用。
+    """
+    stable_params = {name: value for name, value in base_params.items() if name not in ("after", "before")}
+    run_key = json.dumps(
+        [store_url, stable_params, start_dt.date().isoformat(), end_dt_exclusive.date().isoformat(), bool(incremental), bool(sharded)],
+        sort_keys=True
+    )
+    return os.path.join(get_data_state_dir(), f"woo_checkpoint_{hashlib.sha1(run_key.encode('utf-8')).hexdigest()[:12]}.jsonl")
+
+
+def _prune_stale_checkpoints(ttl_hours):
+    """删除 DATA_STATE_DIR 下超过 ttl_hours 未更新的断点文件 (失败且未重跑的运行留下的)。"""
+    state_dir = get_data_state_dir()
+    if not os.path.isdir(state_dir):
+        return 0
+    cutoff = time.time() - ttl_hours * 3600
+    removed = 0
+    for name in os.listdir(state_dir):
+        if not (name.startswith("woo_checkpoint_") and name.endswith(".jsonl")):
+            continue
+        path = os.path.join(state_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"删除过期断点文件 {path} 失败: {e}")
+    if removed:
+        logger.info(f"已删除 {removed} 个超过 {ttl_hours:g} 小时的过期WooCommerce断点文件。")
+    return removed
+
+
+def _retry_delay(attempt):
+    """带抖动的指数退避 (full jitter)：在 [0, min(上限, 基数 * 2^attempt)] 内随机取值。"""
+    return random.uniform(0, min(WOO_RETRY_MAX_DELAY, WOO_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def _request_orders_page(wcapi, base_params, page):
+    """
+    发送单页请求 (不重试)。
+
+    Raises:
+        WooAPIError: API返回错误代码时；retryable 属性标明是否值得重试。
+        requests.exceptions.RequestException: 网络请求失败时。
+    """
+    logger.debug(f"正在获取订单第 {page} 页...")
+    response = wcapi.get("orders", params={**base_params, "page": page})
+
+    status_code = getattr(response, "status_code", 200)
+    if status_code == 429 or status_code >= 500:
+        raise WooAPIError(f"(页 {page}) HTTP {status_code} - 使用的URL: {wcapi.url}", retryable=True)
+
+    # 检查响应头获取总页数 (更可靠的分页方式)
+    total_pages = int(response.headers.get('X-WP-TotalPages', 0))
+    total_count = int(response.headers.get('X-WP-Total', 0))
+    try:
+        current_page_orders = response.json()
+    except ValueError as e:
+        # 网关/缓存层偶尔返回非JSON的错误页，按临时错误处理
+        raise WooAPIError(f"(页 {page}) 响应不是有效的JSON: {e}", retryable=True)
+
+    if isinstance(current_page_orders, dict) and current_page_orders.get("code"):
+        api_code = current_page_orders.get('code')
+        api_message = current_page_orders.get('message', '未知API错误')
+        if api_code == "rest_no_route":
+            api_message += " 请检查您的VITE_WOO_API_URL是否正确指向您的WordPress站点根目录，并确保WooCommerce REST API已启用且固定链接设置为非朴素模式。"
+        raise WooAPIError(f"(页 {page}) {api_message} (代码: {api_code}) - 使用的URL: {wcapi.url}")
+
+    return current_page_orders, total_pages, total_count
+
+
+def _fetch_orders_page(wcapi, base_params, page, checkpoint=None):
+    """
+    获取单页订单。网络异常、429/5xx 和非JSON响应会按带抖动的指数退避重试，
+    最多重试 WOO_PAGE_MAX_RETRIES 次；提供 checkpoint 时优先读取/记录断点。
+
+    Returns:
+        tuple: (当前页订单列表, 响应头中的总页数 X-WP-TotalPages, 总订单数 X-WP-Total)，
+            响应头缺失时对应值为0。
+
+    Raises:
+        WooAPIError: API返回错误代码时。
+        requests.exceptions.RequestException: 网络请求失败时。
+    """
+    if checkpoint is not None:
+        cached = checkpoint.get(base_params, page)
+        if cached is not None:
+            logger.debug(f"第 {page} 页订单从断点文件读取。")
+            return cached
+
+    max_retries = get_woo_page_max_retries()
+    attempt = 0
+    while True:
+        try:
+            result = _request_orders_page(wcapi, base_params, page)
+            break
+        except (WooAPIError, requests.exceptions.RequestException) as e:
+            retryable = getattr(e, "retryable", True)
+            if not retryable or attempt >= max_retries:
+                raise
+            delay = _retry_delay(attempt)
+            attempt += 1
+            logger.warning(f"获取订单第 {page} 页失败 ({e})，{delay:.1f} 秒后进行第 {attempt}/{max_retries} 次重试...")
+            time.sleep(delay)
+
+    if checkpoint is not None:
+        checkpoint.record(base_params, page, result)
+    return result
+
+
+def _iter_order_pages(wcapi, base_params, max_workers, checkpoint=None):
+    """
+    按 base_params 逐页获取订单，每次产出一页订单列表。
+
+    第一页请求返回 X-WP-TotalPages 后，如果 max_workers 大于1，剩余页面将通过
+    有界线程池并发获取，并按页码顺序产出。同时在途的页面最多为 max_workers 的两倍，
+    因此内存占用与总页数无关。
+
+    Raises:
+        WooAPIError, requests.exceptions.RequestException: 任意一页失败时。
+    """
+    fetched_count = 0
+    page = 1
+    per_page = base_params["per_page"]
+
+    while True:
+        current_page_orders, total_pages, _ = _fetch_orders_page(wcapi, base_params, page, checkpoint)
+
+        if not current_page_orders: # 如果当前页没有订单
+            logger.info("当前页没有订单，停止分页。")
+            return
+        
+        fetched_count += len(current_page_orders)
+        logger.info(f"成功获取第 {page} 页订单，共 {len(current_page_orders)} 条。累计订单: {fetched_count}.")
+        yield current_page_orders
+
+        if total_pages > 0: # 使用响应头中的总页数
+            if page >= total_pages:
+                logger.info(f"已达到总页数 {total_pages}，停止分页。")
+                return
+            if max_workers > 1:
+                # 已知总页数，剩余页面交给有界线程池并发获取，按页码顺序产出
+                last_page = min(total_pages, WOO_MAX_PAGES)
+                if total_pages > WOO_MAX_PAGES:
+                    logger.warning(f"已达到最大分页限制 ({WOO_MAX_PAGES}页)，停止获取更多订单。")
+                logger.info(f"使用 {max_workers} 个线程并发获取第 {page + 1} 到 {last_page} 页订单...")
+                for fetched_page, page_orders in _fetch_pages_concurrently(wcapi, base_params, range(page + 1, last_page + 1), max_workers, checkpoint):
+                    fetched_count += len(page_orders)
+                    logger.info(f"成功获取第 {fetched_page} 页订单，共 {len(page_orders)} 条。累计订单: {fetched_count}.")
+                    yield page_orders
+                return
+        elif len(current_page_orders) < per_page: # 备用逻辑：如果返回的订单数少于请求数
+            logger.info("返回的订单数少于每页请求数，假设已是最后一页。")
+            return
         
+        page += 1
+        # 为防止无限循环或过多请求，可以设置一个最大页数限制
+        if page > WOO_MAX_PAGES:
+            logger.warning(f"已达到最大分页限制 ({WOO_MAX_PAGES}页)，停止获取更多订单。")
+            return
+
+
+def _fetch_pages_concurrently(wcapi, base_params, pages, max_workers, checkpoint=None):
+    """以滑动窗口方式并发获取 pages 中的各页，按页码顺序产出 (页码, 订单列表)。"""
+    pending = deque()
+    page_iter = iter(pages)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for page in page_iter:
+                pending.append((page, executor.submit(_fetch_orders_page, wcapi, base_params, page, checkpoint)))
+                if len(pending) >= max_workers * 2:
+                    break
+            while pending:
+                page, future = pending.popleft()
+                page_orders = future.result()[0]
+                next_page = next(page_iter, None)
+                if next_page is not None:
+                    pending.append((next_page, executor.submit(_fetch_orders_page, wcapi, base_params, next_page, checkpoint)))
+                yield page, page_orders
+        finally:
+            # 出错或调用方提前停止迭代时，取消尚未开始的请求
+            for _, future in pending:
+                future.cancel()
+
+
+def _split_window(window_start, window_end, parts):
+    """
+    把 [window_start, window_end) 平均切成 parts 段，每段不短于 WOO_SHARD_MIN_WINDOW。
+
+    WooCommerce 的 after 和 before 都不包含边界时刻，恰好在分界点创建的订单不属于任何一段，
+    因此除第一段外，每段的起点向前重叠 WOO_SHARD_WINDOW_OVERLAP；重复的订单在合并时按 id 去重。
+    """
+    span = window_end - window_start
+    parts = max(1, min(parts, int(span / WOO_SHARD_MIN_WINDOW)))
+    step = span / parts
+    bounds = [window_start + step * i for i in range(parts)] + [window_end]
+    return [(start - WOO_SHARD_WINDOW_OVERLAP if i else start, end) for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+def _fetch_window(wcapi, base_params, window, target_orders, checkpoint=None):
+    """
+    获取单个日期窗口内的订单。
+
+    先请求第一页，如果 X-WP-Total 超过 target_orders 且窗口还能再切分，则返回
+    ("split", 子窗口列表)，不再深翻页；否则串行取完剩余页，返回 ("orders", 订单列表)。
+    """
+    window_start, window_end = window
+    window_params = {**base_params, "after": window_start.isoformat(), "before": window_end.isoformat()}
+    first_page_orders, total_pages, total_count = _fetch_orders_page(wcapi, window_params, 1, checkpoint)
+
+    if total_count > target_orders and window_end - window_start > WOO_SHARD_MIN_WINDOW:
+        parts = -(-total_count // target_orders) # 向上取整
+        sub_windows = _split_window(window_start, window_end, parts)
+        if len(sub_windows) > 1:
+            logger.info(f"窗口 {window_params['after']} ~ {window_params['before']} 共 {total_count} 条订单，拆分为 {len(sub_windows)} 个子窗口。")
+            return "split", sub_windows
+
+    window_orders = list(first_page_orders)
+    for page in range(2, min(total_pages, WOO_MAX_PAGES) + 1):
+        window_orders.extend(_fetch_orders_page(wcapi, window_params, page, checkpoint)[0])
+    if total_pages > WOO_MAX_PAGES:
+        logger.warning(f"窗口 {window_params['after']} ~ {window_params['before']} 已达到最大分页限制 ({WOO_MAX_PAGES}页)，该窗口的订单被截断。")
+    return "orders", window_orders
+
+
+def _iter_sharded_order_pages(wcapi, base_params, start_dt, end_dt_exclusive, max_workers, target_orders=None, checkpoint=None):
+    """
+    分片模式: 将 [start_dt, end_dt_exclusive) 按天切成窗口并发获取，每个窗口根据第一页
+    返回的 X-WP-Total 自适应细分 (直到小时/分钟级)，因此不受200页上限影响，也避免深分页。
+
+    窗口按时间顺序产出 (每个窗口产出一个订单列表)，在途窗口数量有上限。相邻窗口在边界处
+    重叠，已产出过的订单按 id 去重。
+
+    Raises:
+        WooAPIError, requests.exceptions.RequestException: 任意窗口失败时。
+    """
+    if target_orders is None:
+        target_orders = get_woo_shard_target_orders()
+    windows = deque(_split_window(start_dt, end_dt_exclusive, -(-(end_dt_exclusive - start_dt) // timedelta(days=1))))
+    logger.info(f"分片获取WooCommerce订单: 初始 {len(windows)} 个窗口，每个窗口目标不超过 {target_orders} 条订单，线程数 {max_workers}。")
+    pending = deque()
+    fetched_count = 0
+    seen_ids = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(window):
+            return window, executor.submit(_fetch_window, wcapi, base_params, window, target_orders, checkpoint)
+
+        try:
+            while windows or pending:
+                while windows and len(pending) < max_workers * 2:
+                    pending.append(submit(windows.popleft()))
+                window, future = pending.popleft()
+                kind, payload = future.result()
+                if kind == "split":
+                    # 子窗口必须先于后续窗口产出，放到队首保持时间顺序
+                    for sub_window in reversed(payload):
+                        pending.appendleft(submit(sub_window))
+                    continue
+                window_orders = []
+                for order in payload:
+                    order_id = order.get("id")
+                    if order_id is not None:
+                        if order_id in seen_ids:
+                            continue # 相邻窗口重叠部分已产出过
+                        seen_ids.add(order_id)
+                    window_orders.append(order)
+                payload = window_orders
+                fetched_count += len(payload)
+                logger.info(f"窗口 {window[0].isoformat()} ~ {window[1].isoformat()} 获取 {len(payload)} 条订单。累计订单: {fetched_count}.")
+                if payload:
+                    yield payload
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def _iter_pages(wcapi, base_params, max_workers, sharded, start_dt=None, end_dt_exclusive=None, checkpoint=None):
+    """根据是否分片选择分页方式，逐页 (或逐窗口) 产出订单列表。"""
+    if sharded:
+        return _iter_sharded_order_pages(wcapi, base_params, start_dt, end_dt_exclusive, max_workers, checkpoint=checkpoint)
+    return _iter_order_pages(wcapi, base_params, max_workers, checkpoint)
+
+
+def _fetch_all_orders(wcapi, base_params, max_workers, sharded=False, start_dt=None, end_dt_exclusive=None, checkpoint=None):
+    """按 base_params 获取全部订单并合并为一个列表。"""
+    all_orders = []
+    for page_orders in _iter_pages(wcapi, base_params, max_workers, sharded, start_dt, end_dt_exclusive, checkpoint):
+        all_orders.extend(page_orders)
+    return all_orders
+
+
+def _woo_sync_state_path(store_url, fields_param=None):
+    """每个店铺 (及 _fields 投影) 一个状态文件，文件名由站点URL和投影参数的哈希区分。"""
+    state_key_source = store_url if not fields_param else f"{store_url}|{fields_param}"
+    store_key = hashlib.sha1(state_key_source.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(get_data_state_dir(), f"woo_sync_state_{store_key}.json")
+
+
+def _load_woo_sync_state(state_path):
+    if not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取WooCommerce增量同步状态文件 {state_path} 失败，将执行完整拉取: {e}")
+        return {}
+
+
+def _save_woo_sync_state(state_path, state):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path) # 原子替换，避免中断时留下半个文件
+
+
+def _merge_orders_by_modified(orders_by_id, changed_orders, statuses):
+    """
+    按订单 id 将变更订单合并进本地状态，仅当 date_modified_gmt 不早于本地版本时覆盖。
+    状态已不在 statuses 中的订单 (例如被取消) 会从本地状态中移除。
+
     Returns:
-        list: 包含原始订单数据的列表 (每个订单是一个字典), 或者在失败时返回空列表。
+        str: 本批变更订单中最大的 date_modified_gmt，无变更时为空字符串。
+    """
+    max_modified = ""
+    for order in changed_orders:
+        order_key = str(order.get("id"))
+        modified = order.get("date_modified_gmt") or ""
+        max_modified = max(max_modified, modified)
+        existing = orders_by_id.get(order_key)
+        if existing is not None and modified < (existing.get("date_modified_gmt") or ""):
+            continue
+        if order.get("status") in statuses:
+            orders_by_id[order_key] = order
+        else:
+            orders_by_id.pop(order_key, None)
+    return max_modified
+
+
+def _sync_woo_orders_incremental(wcapi, store_url, base_params, statuses, max_workers, sharded=False, start_dt=None, end_dt_exclusive=None, checkpoint=None):
+    """
+    增量同步: 使用持久化的 modified_after 水位线只拉取上次运行后变更的订单，
+    合并进本地状态后返回 [after, before) 窗口内的订单 (按创建时间升序)。
+
+    没有水位线，或请求的窗口起点早于本地状态覆盖的起点时，回退为完整拉取
+    (sharded 为 True 时完整拉取使用分片模式)。
+    """
+    state_path = _woo_sync_state_path(store_url, base_params.get("_fields"))
+    state = _load_woo_sync_state(state_path)
+    window_start = base_params["after"]
+    window_end = base_params["before"]
+    watermark = state.get("watermark")
+
+    if watermark and state.get("window_start") and window_start >= state["window_start"]:
+        orders_by_id = state.get("orders", {})
+        # 水位线回退一小段时间，同一秒内修改的订单不会因边界被漏掉；按 id 合并是幂等的
+        modified_after = (datetime.fromisoformat(watermark) - timedelta(seconds=WOO_WATERMARK_OVERLAP_SECONDS)).isoformat()
+        logger.info(f"WooCommerce增量同步: 获取 {modified_after} (GMT) 之后修改的订单...")
+        changed_orders = _fetch_all_orders(
+            wcapi,
+            {
+                "modified_after": modified_after,
+                "dates_are_gmt": "true",
+                "per_page": base_params["per_page"],
+                "status": "any", # 不过滤状态，才能感知订单被取消/退款等变化
+                "orderby": "id",
+                "order": "asc",
+                **({"_fields": base_params["_fields"]} if "_fields" in base_params else {})
+            },
+            max_workers,
+            checkpoint=checkpoint
+        )
+        logger.info(f"WooCommerce增量同步: 共 {len(changed_orders)} 条变更订单。")
+    else:
+        orders_by_id = {}
+        logger.info("WooCommerce增量同步: 未找到可用的水位线或请求窗口超出本地状态范围，执行完整拉取。")
+        changed_orders = _fetch_all_orders(wcapi, base_params, max_workers, sharded, start_dt, end_dt_exclusive, checkpoint)
+
+    max_modified = _merge_orders_by_modified(orders_by_id, changed_orders, statuses)
+
+    # 丢弃窗口起点之前创建的订单，避免状态文件无限增长
+    orders_by_id = {
+        order_key: order for order_key, order in orders_by_id.items()
+        if (order.get("date_created") or "") >= window_start
+    }
+    _save_woo_sync_state(state_path, {
+        "store_url": store_url,
+        "watermark": max(watermark or "", max_modified) or None,
+        "window_start": window_start,
+        "orders": orders_by_id,
+    })
+    logger.info(f"WooCommerce增量同步状态已保存到: {state_path}")
+
+    window_orders = [
+        order for order in orders_by_id.values()
+        if (order.get("date_created") or "") < window_end
+    ]
+    window_orders.sort(key=lambda order: (order.get("date_created") or "", order.get("id") or 0))
+    return window_orders
+
+
+def _build_woo_api():
+    """
+    根据环境变量创建WooCommerce API客户端。
+
+    Returns:
+        tuple: (API实例, 调整后的站点基础URL)，配置无效时为 (None, None)。
     """
     store_url_env = os.getenv("VITE_WOO_API_URL")
     consumer_key = os.getenv("VITE_WOO_CONSUMER_KEY")
@@ -27,12 +635,12 @@ def get_woo_orders_raw_data(start_date_dt, end_date_dt):
 
     if not all([store_url_env, consumer_key, consumer_secret]):
         logger.error("WooCommerce API凭据未完全配置。请检查VITE_WOO_API_URL, VITE_WOO_CONSUMER_KEY, 和 VITE_WOO_CONSUMER_SECRET环境变量。")
-        return [] # 返回空列表表示失败或无数据
+        return None, None
 
     store_url = store_url_env
     if not store_url.startswith(("http://", "https://")):
          logger.error(f"WooCommerce API URL '{store_url}' 格式不正确，应以http://或https://开头。")
-         return []
+         return None, None
 
     if "/wp-json/" in store_url:
         store_url = store_url.split("/wp-json/")[0]
@@ -49,10 +657,49 @@ def get_woo_orders_raw_data(start_date_dt, end_date_dt):
         version="wc/v3",
         timeout=60 # 增加超时时间以应对大量数据
     )
+    return wcapi, store_url
 
-    all_orders = []
-    page = 1
-    per_page = 100 # 根据API限制和性能考虑调整
+
+def iter_woo_orders(start_date_dt, end_date_dt, max_workers=None, incremental=None, fields=None, as_records=False, sharded=None, resumable=None):
+    """
+    逐页产出WooCommerce在指定日期范围内的原始订单 (每个订单是一个字典)。
+
+    调用方按流式方式消费时，内存中只保留大约一页订单 (增量模式下本地状态除外)。
+    
+    Args:
+        start_date_dt (datetime): 开始日期
+        end_date_dt (datetime): 结束日期
+        max_workers (int, optional): 并发获取分页的最大线程数。默认读取环境变量
+            WOO_FETCH_WORKERS (未配置时为1，即串行获取)。
+        incremental (bool, optional): 是否使用基于 modified_after 水位线的增量同步。
+            默认读取环境变量 WOO_INCREMENTAL_SYNC (未配置时为关闭)。
+        fields (iterable, optional): 只请求这些顶层字段 (REST _fields 投影)，例如
+            WOO_ORDER_FIELDS。默认为 None，返回完整订单对象。
+        as_records (bool): 为 True 时产出紧凑的 WooOrder 记录而不是字典。
+        sharded (bool, optional): 是否按日期窗口分片并发获取 (自适应细分窗口，不受200页上限
+            限制)。默认读取环境变量 WOO_SHARDED_FETCH (未配置时为关闭)。
+        resumable (bool, optional): 是否记录断点文件，使中断后以相同参数重跑时跳过已完成的
+            页面/窗口。默认读取环境变量 WOO_CHECKPOINT (未配置时为关闭)。
+
+    Yields:
+        dict | WooOrder: 单个订单。
+
+    Raises:
+        WooAPIError: 配置无效或API返回错误时。
+        requests.exceptions.RequestException: 网络请求失败时。
+    """
+    if max_workers is None:
+        max_workers = get_woo_fetch_workers()
+    if incremental is None:
+        incremental = os.getenv("WOO_INCREMENTAL_SYNC", "false").lower() in ("1", "true", "yes")
+    if sharded is None:
+        sharded = os.getenv("WOO_SHARDED_FETCH", "false").lower() in ("1", "true", "yes")
+    if resumable is None:
+        resumable = os.getenv("WOO_CHECKPOINT", "false").lower() in ("1", "true", "yes")
+
+    wcapi, store_url = _build_woo_api()
+    if wcapi is None:
+        raise WooAPIError("WooCommerce API配置无效，无法获取订单。")
 
     # WooCommerce 日期需要ISO 8601格式
     start_date_iso = start_date_dt.isoformat()
@@ -60,67 +707,85 @@ def get_woo_orders_raw_data(start_date_dt, end_date_dt):
     # Or, if WooCommerce 'before' is exclusive, use start of next day.
     # Let's assume start_date_dt and end_date_dt define an inclusive range desired by user.
     # WC 'before' is exclusive. To include orders on end_date_dt, use (end_date_dt + 1 day).
-    end_date_exclusive_iso = (end_date_dt + timedelta(days=1)).isoformat()
+    end_date_exclusive_dt = end_date_dt + timedelta(days=1)
+    end_date_exclusive_iso = end_date_exclusive_dt.isoformat()
 
 
     logger.info(f"从WooCommerce获取订单数据，时间范围: {start_date_iso} (inclusive) 到 {end_date_exclusive_iso} (exclusive)")
 
-    while True:
-        try:
-            logger.debug(f"正在获取订单第 {page} 页...")
-            response = wcapi.get(
-                "orders",
-                params={
-                    "after": start_date_iso,
-                    "before": end_date_exclusive_iso, 
-                    "per_page": per_page, 
-                    "page": page,
-                    "status": "processing,completed", # 保持状态过滤
-                    "orderby": "date", # 确保订单有序，便于分页
-                    "order": "asc"
-                }
-            )
-            
-            # 检查响应头获取总页数 (更可靠的分页方式)
-            total_pages = int(response.headers.get('X-WP-TotalPages', 0))
-            current_page_orders = response.json()
-
-            if isinstance(current_page_orders, dict) and current_page_orders.get("code"):
-                api_code = current_page_orders.get('code')
-                api_message = current_page_orders.get('message', '未知API错误')
-                logger.error(f"WooCommerce API请求失败 (页 {page}): {api_message} (代码: {api_code}) - 使用的URL: {wcapi.url}")
-                if api_code == "rest_no_route":
-                     api_message += " 请检查您的VITE_WOO_API_URL是否正确指向您的WordPress站点根目录，并确保WooCommerce REST API已启用且固定链接设置为非朴素模式。"
-                # 如果一页失败，可以选择停止或跳过；这里我们停止
-                return [] # 返回空列表表示处理中出错
-
-            if not current_page_orders: # 如果当前页没有订单
-                logger.info("当前页没有订单，停止分页。")
-                break
-            
-            all_orders.extend(current_page_orders)
-            logger.info(f"成功获取第 {page} 页订单，共 {len(current_page_orders)} 条。累计订单: {len(all_orders)}.")
-
-            if total_pages > 0: # 使用响应头中的总页数
-                if page >= total_pages:
-                    logger.info(f"已达到总页数 {total_pages}，停止分页。")
-                    break
-            elif len(current_page_orders) < per_page: # 备用逻辑：如果返回的订单数少于请求数
-                logger.info("返回的订单数少于每页请求数，假设已是最后一页。")
-                break
-            
-            page += 1
-            # 为防止无限循环或过多请求，可以设置一个最大页数限制
-            if page > 200: # 例如，最大200页 (200 * 100 = 20000订单)
-                logger.warning("已达到最大分页限制 (200页)，停止获取更多订单。")
-                break
-
-        except requests.exceptions.RequestException as req_e:
-            logger.error(f"WooCommerce API网络请求时发生异常 (页 {page}): {str(req_e)}")
-            return [] # 网络问题也返回空列表
-        except Exception as e:
-            logger.error(f"处理WooCommerce订单数据时发生未知异常 (页 {page}): {str(e)}", exc_info=True)
-            return [] # 其他未知错误也返回空列表
+    statuses = WOO_ORDER_STATUSES
+    base_params = {
+        "after": start_date_iso,
+        "before": end_date_exclusive_iso, 
+        "per_page": WOO_PER_PAGE, 
+        "status": ",".join(statuses), # 保持状态过滤
+        "orderby": "date", # 确保订单有序，便于分页
+        "order": "asc"
+    }
+    if fields:
+        projected_fields = list(dict.fromkeys(fields))
+        if incremental:
+            projected_fields += [f for f in WOO_SYNC_REQUIRED_FIELDS if f not in projected_fields]
+        base_params["_fields"] = ",".join(projected_fields)
+        logger.info(f"使用字段投影 _fields={base_params['_fields']}")
+
+    decode = WooOrder.from_api if as_records else None
+    checkpoint = None
+    if resumable:
+        _prune_stale_checkpoints(get_woo_checkpoint_ttl_hours())
+        checkpoint = WooFetchCheckpoint(_woo_checkpoint_path(store_url, base_params, start_date_dt, end_date_exclusive_dt, incremental, sharded))
+        after, before = checkpoint.bind_bounds(start_date_iso, end_date_exclusive_iso)
+        if (after, before) != (start_date_iso, end_date_exclusive_iso):
+            logger.info(f"沿用断点文件中的时间范围: {after} 到 {before}")
+            base_params.update({"after": after, "before": before})
+            start_date_dt, end_date_exclusive_dt = datetime.fromisoformat(after), datetime.fromisoformat(before)
+
+    if incremental:
+        window_orders = _sync_woo_orders_incremental(
+            wcapi, store_url, base_params, statuses, max_workers,
+            sharded, start_date_dt, end_date_exclusive_dt, checkpoint
+        )
+        if checkpoint is not None:
+            checkpoint.complete() # 结果已合并进增量状态文件，断点不再需要
+        for offset in range(0, len(window_orders), WOO_PER_PAGE):
+            page_orders = window_orders[offset:offset + WOO_PER_PAGE]
+            yield from (map(decode, page_orders) if decode else page_orders)
+        return
+
+    for page_orders in _iter_pages(wcapi, base_params, max_workers, sharded, start_date_dt, end_date_exclusive_dt, checkpoint):
+        yield from (map(decode, page_orders) if decode else page_orders)
+    if checkpoint is not None:
+        checkpoint.complete()
+
+
+def get_woo_orders_raw_data(start_date_dt, end_date_dt, max_workers=None, incremental=None, fields=None, sharded=None, resumable=None):
+    """
+    获取WooCommerce在指定日期范围内的所有原始订单数据。
+    
+    Args:
+        start_date_dt (datetime): 开始日期
+        end_date_dt (datetime): 结束日期
+        max_workers (int, optional): 并发获取分页的最大线程数，见 iter_woo_orders。
+        incremental (bool, optional): 是否使用增量同步，见 iter_woo_orders。
+        fields (iterable, optional): 作为 REST _fields 投影发送的字段列表，见 iter_woo_orders。
+        sharded (bool, optional): 是否按日期窗口分片获取，见 iter_woo_orders。
+        resumable (bool, optional): 是否记录断点以便中断后续传，见 iter_woo_orders。
+        
+    Returns:
+        list: 包含原始订单数据的列表 (每个订单是一个字典), 或者在失败时返回空列表。
+    """
+    try:
+        all_orders = list(iter_woo_orders(start_date_dt, end_date_dt, max_workers=max_workers, incremental=incremental, fields=fields, sharded=sharded, resumable=resumable))
+    except WooAPIError as api_e:
+        # 如果一页失败，可以选择停止或跳过；这里我们停止
+        logger.error(f"WooCommerce API请求失败: {api_e}")
+        return [] # 返回空列表表示处理中出错
+    except requests.exceptions.RequestException as req_e:
+        logger.error(f"WooCommerce API网络请求时发生异常: {str(req_e)}")
+        return [] # 网络问题也返回空列表
+    except Exception as e:
+        logger.error(f"处理WooCommerce订单数据时发生未知异常: {str(e)}", exc_info=True)
+        return [] # 其他未知错误也返回空列表
 
     logger.info(f"成功获取所有WooCommerce订单，总计: {len(all_orders)} 条。")
     return all_orders
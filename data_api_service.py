@@ -2,7 +2,11 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS # 用于处理跨域请求
 import os
 from dotenv import load_dotenv
+import time
+import threading
+from contextlib import closing
 import mysql.connector
+import mysql.connector.pooling
 from datetime import datetime, timedelta, date # 确保导入 date
 from decimal import Decimal # 用于处理数据库中的DECIMAL类型
 import json # 用于处理JSON数据，例如meta_data
@@ -21,22 +25,80 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+DEFAULT_DB_POOL_SIZE = 10 # 连接池大小，0 表示不使用连接池 (每个请求新建连接)
+MAX_DB_POOL_SIZE = 32 # mysql.connector 连接池的上限
+DB_POOL_WAIT_SECONDS = 5.0 # 连接池耗尽时等待空闲连接的最长时间
+DB_POOL_RETRY_INTERVAL = 0.02
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool_size():
+    """连接池大小，可通过环境变量 DB_POOL_SIZE 覆盖 (0 关闭连接池，最大 32)。"""
+    try:
+        return min(MAX_DB_POOL_SIZE, max(0, int(os.getenv("DB_POOL_SIZE", DEFAULT_DB_POOL_SIZE))))
+    except ValueError:
+        app.logger.warning(f"DB_POOL_SIZE环境变量值无效，将使用默认值: {DEFAULT_DB_POOL_SIZE}")
+        return DEFAULT_DB_POOL_SIZE
+
+def _db_connect_args():
+    return {
+        "host": DB_HOST,
+        "port": int(DB_PORT), # 确保端口是整数
+        "database": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+    }
+
+def _get_db_pool():
+    """首次使用时创建连接池。归还的连接会重置会话，避免会话状态在请求之间泄漏。"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name="data_api",
+                    pool_size=get_db_pool_size(),
+                    pool_reset_session=True,
+                    **_db_connect_args()
+                )
+    return _db_pool
+
 # --- 辅助函数：获取数据库连接 ---
 def get_db_connection():
+    """
+    获取数据库连接。默认从连接池取出 (连接池取出时会 ping 检查连接，失效则自动重连)，
+    调用 close() 即归还连接池；连接池耗尽时最多等待 DB_POOL_WAIT_SECONDS 秒。
+    DB_POOL_SIZE=0 时每次新建连接。
+    """
     try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            port=int(DB_PORT), # 确保端口是整数
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        # print("数据库连接成功！") # 可以在调试时取消注释
+        if get_db_pool_size() == 0:
+            return mysql.connector.connect(**_db_connect_args())
+        pool = _get_db_pool()
+        deadline = time.monotonic() + DB_POOL_WAIT_SECONDS
+        while True:
+            try:
+                conn = pool.get_connection()
+                break
+            except mysql.connector.errors.PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(DB_POOL_RETRY_INTERVAL)
         return conn
     except mysql.connector.Error as err:
         app.logger.error(f"数据库连接失败: {err}") # 使用 app.logger 记录错误
         raise # 重新抛出异常，让上层处理
 
+def fetch_all(sql, params=()):
+    """用服务端预处理游标执行固定查询并返回全部行 (字典列表)，游标用完即关闭，连接归还连接池。"""
+    conn = get_db_connection()
+    try:
+        with closing(conn.cursor(prepared=True, dictionary=True)) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
 # --- 辅助函数：序列化特殊数据类型以便JSON转换 ---
 def custom_json_serializer(obj):
     if isinstance(obj, (datetime, date)):
@@ -48,8 +110,7 @@ def custom_json_serializer(obj):
 # --- API 端点 ---
 @app.route('/get_data', methods=['POST'])
 def get_data_endpoint():
-    conn = None
-    cursor = None
+    data_type = None
     try:
         payload = request.json
         if not payload:
@@ -79,9 +140,6 @@ def get_data_endpoint():
             return jsonify({"error": "无效的日期格式。请使用 YYYY-MM-DD 格式。"}), 400
 
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True) # dictionary=True 使fetchall返回字典列表
-
         # --------------------------------------------------------------------
         # 示例：从您的数据库获取 WooCommerce 订单数据
         # --------------------------------------------------------------------
@@ -99,12 +157,11 @@ def get_data_endpoint():
                 WHERE DATE(date_created_gmt) >= %s AND DATE(date_created_gmt) <= %s 
                       AND status = %s
                 ORDER BY date_created_gmt DESC
-                LIMIT %s;
+                LIMIT %s
             """
             query_params_tuple = (start_date_obj, end_date_obj, status_filter, limit_filter)
             
-            cursor.execute(sql_query, query_params_tuple)
-            orders_from_db = cursor.fetchall()
+            orders_from_db = fetch_all(sql_query, query_params_tuple)
             result_data = {"orders": orders_from_db}
         
         # --------------------------------------------------------------------
@@ -118,12 +175,11 @@ def get_data_endpoint():
             sql_query = """
                 SELECT item_id, order_id, product_id, product_name, quantity, total, sku, meta_data
                 FROM woocommerce_order_items
-                WHERE order_id = %s;
+                WHERE order_id = %s
             """
             query_params_tuple = (int(order_id_filter),) # 确保order_id是整数
             
-            cursor.execute(sql_query, query_params_tuple)
-            items_from_db = cursor.fetchall()
+            items_from_db = fetch_all(sql_query, query_params_tuple)
             result_data = {"order_id": order_id_filter, "items": items_from_db}
 
         # --------------------------------------------------------------------
@@ -134,11 +190,10 @@ def get_data_endpoint():
                 SELECT report_date, active_users, sessions, engagement_rate, conversions_total, total_revenue
                 FROM ga4_daily_overview
                 WHERE report_date >= %s AND report_date <= %s
-                ORDER BY report_date DESC;
+                ORDER BY report_date DESC
             """
             query_params_tuple = (start_date_obj, end_date_obj)
-            cursor.execute(sql_query, query_params_tuple)
-            overview_data = cursor.fetchall()
+            overview_data = fetch_all(sql_query, query_params_tuple)
             result_data = {"ga4_daily_overview": overview_data}
 
         # --------------------------------------------------------------------
@@ -162,19 +217,14 @@ def get_data_endpoint():
     except Exception as e:
         app.logger.error(f"处理 /get_data 请求时发生内部错误: {str(e)}", exc_info=True)
         return jsonify({"error": "发生内部服务器错误", "details": str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected(): # 检查连接是否仍然打开
-            conn.close()
-            # print("数据库连接已关闭。") # 调试时取消注释
+
+def ga4_range_response(sql):
+    """执行按 start_date/end_date 查询参数过滤的 GA4 固定查询并返回 JSON。"""
+    data = fetch_all(sql, (request.args.get('start_date'), request.args.get('end_date')))
+    return jsonify(data)
 
 @app.route('/get_ga4_pages', methods=['GET'])
 def get_ga4_pages():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     sql = """
         SELECT report_date, page_path, avg_time_on_page, bounce_rate
         FROM ga4_page_metrics
@@ -182,18 +232,10 @@ def get_ga4_pages():
         ORDER BY report_date DESC, avg_time_on_page DESC
         LIMIT 100
     """
-    cursor.execute(sql, (start_date, end_date))
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(data)
+    return ga4_range_response(sql)
 
 @app.route('/get_ga4_channels', methods=['GET'])
 def get_ga4_channels():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     sql = """
         SELECT report_date, channel, visitors, avg_engagement_time
         FROM ga4_traffic_channels
@@ -201,18 +243,10 @@ def get_ga4_channels():
         ORDER BY report_date DESC, visitors DESC
         LIMIT 100
     """
-    cursor.execute(sql, (start_date, end_date))
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(data)
+    return ga4_range_response(sql)
 
 @app.route('/get_ga4_devices', methods=['GET'])
 def get_ga4_devices():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     sql = """
         SELECT report_date, device_type, visitors, bounce_rate, avg_visit_time, add_to_cart, checkout
         FROM ga4_device_metrics
@@ -220,18 +254,10 @@ def get_ga4_devices():
         ORDER BY report_date DESC, visitors DESC
         LIMIT 100
     """
-    cursor.execute(sql, (start_date, end_date))
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(data)
+    return ga4_range_response(sql)
 
 @app.route('/get_ga4_sessions', methods=['GET'])
 def get_ga4_sessions():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     sql = """
         SELECT report_date, session_depth, bounce_rate, add_to_cart, checkout
         FROM ga4_session_depth
@@ -239,18 +265,10 @@ def get_ga4_sessions():
         ORDER BY report_date DESC, session_depth DESC
         LIMIT 100
     """
-    cursor.execute(sql, (start_date, end_date))
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(data)
+    return ga4_range_response(sql)
 
 @app.route('/get_ga4_visit_depth', methods=['GET'])
 def get_ga4_visit_depth():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     sql = """
         SELECT report_date, visitors, visits
         FROM ga4_visit_depth
@@ -258,11 +276,7 @@ def get_ga4_visit_depth():
         ORDER BY report_date DESC
         LIMIT 100
     """
-    cursor.execute(sql, (start_date, end_date))
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(data)
+    return ga4_range_response(sql)
 
 if __name__ == '__main__':
     # 确保您的 .env 文件已配置，并且MySQL服务正在本地运行
@@ -0,0 +1,289 @@
+import os
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import argparse
+import json
+from contextlib import closing
+from dotenv import load_dotenv
+
+from fastgpt_updater import (
+    upload_documents, sync_documents, prune_sources, get_sync_mode, get_push_batch_limits, get_env_int,
+    DEFAULT_UPLOAD_MAX_IN_FLIGHT, SYNC_MODE_REPLACE, STATUS_UNATTRIBUTED
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_STATE_DIR = "data_state"
+OUTBOX_FILE_NAME = "fastgpt_outbox.sqlite3"
+DEFAULT_OUTBOX_MAX_ATTEMPTS = 8 # 超过该次数仍失败的文档标记为 dead，不再自动重试
+OUTBOX_RETRY_BASE_DELAY = 30.0 # 失败后首次重试的基础等待秒数
+OUTBOX_RETRY_MAX_DELAY = 3600.0 # 重试等待上限 (秒)
+DEFAULT_OUTBOX_CLAIM_SECONDS = 600 # 投递进程领取文档后的租约时长，进程中途退出时文档在租约到期后重新可投递
+DEFAULT_OUTBOX_DRAIN_INTERVAL = 60 # --loop 模式下两次投递之间的间隔 (秒)
+
+STATUS_PENDING = "pending"
+STATUS_DEAD = "dead"
+
+
+def get_outbox_path():
+    """发件箱数据库路径，位于 DATA_STATE_DIR 下。"""
+    return os.path.join(os.getenv("DATA_STATE_DIR", DEFAULT_DATA_STATE_DIR), OUTBOX_FILE_NAME)
+
+
+def _retry_delay(attempts):
+    """第 attempts 次失败后的等待时间：带抖动的指数退避。"""
+    delay = min(OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETRY_BASE_DELAY * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class FastGPTOutbox:
+    """
+    FastGPT 待推送文档的持久化发件箱 (SQLite)。
+
+    采集阶段只把文档写入发件箱，由 drain() 或 `python fastgpt_outbox.py drain` 负责推送。
+    推送成功的文档从发件箱删除；失败的文档累计重试次数并按指数退避安排下次投递，
+    超过最大次数后标记为 dead，保留在库中以便排查。replace 模式下删除过期来源的请求
+    也记录在发件箱 (prune_requests 表)，在投递时执行，采集流程本身不访问 FastGPT。
+    """
+
+    def __init__(self, path=None, max_attempts=None, claim_seconds=None):
+        self.path = path or get_outbox_path()
+        self.max_attempts = max_attempts or get_env_int("FASTGPT_OUTBOX_MAX_ATTEMPTS", DEFAULT_OUTBOX_MAX_ATTEMPTS)
+        self.claim_seconds = claim_seconds or get_env_int("FASTGPT_OUTBOX_CLAIM_SECONDS", DEFAULT_OUTBOX_CLAIM_SECONDS)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source_name TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    UNIQUE (source_name, content_hash)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS prune_requests (
+                    prefix TEXT PRIMARY KEY,
+                    keep_names TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self):
+        # 每次操作使用独立连接，采集线程和主线程可以同时写入
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def enqueue(self, documents):
+        """
+        写入待推送文档 ({"file_name", "content"})。同名且内容相同的文档只保留一份，
+        同名的旧版本若尚未推送则被新版本取代。
+
+        Returns:
+            int: 新写入的文档数。
+        """
+        now = time.time()
+        rows = [
+            (doc["file_name"], doc["content"], hashlib.sha256(doc["content"].encode("utf-8")).hexdigest(), now, now)
+            for doc in documents
+        ]
+        if not rows:
+            return 0
+        with closing(self._connect()) as conn, conn:
+            before = conn.total_changes
+            conn.executemany(
+                "DELETE FROM outbox WHERE source_name = ? AND content_hash != ? AND status = ?",
+                [(row[0], row[2], STATUS_PENDING) for row in rows]
+            )
+            superseded = conn.total_changes - before
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (source_name, content, content_hash, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            return conn.total_changes - before - superseded
+
+    def enqueue_prune(self, prefix, keep_names):
+        """记录删除请求：投递时删除以 prefix 开头、但不在 keep_names 中的已同步数据。同一前缀只保留最新的请求。"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO prune_requests (prefix, keep_names, created_at) VALUES (?, ?, ?)",
+                (prefix, json.dumps(sorted(keep_names), ensure_ascii=False), time.time())
+            )
+
+    def _claim_prune_request(self):
+        """取出并删除一个删除请求 [(prefix, keep_names)]，同时运行的 drain 不会执行同一个请求。"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT prefix, keep_names FROM prune_requests ORDER BY created_at LIMIT 1").fetchone()
+                if row:
+                    conn.execute("DELETE FROM prune_requests WHERE prefix = ?", (row[0],))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _run_prune_requests(self, api_key, base_url, kb_id, deadline=None):
+        deleted = 0
+        while deadline is None or time.monotonic() < deadline:
+            request = self._claim_prune_request()
+            if request is None:
+                break
+            prefix, keep_names = request
+            try:
+                deleted += prune_sources(api_key, base_url, kb_id, prefix, keep_names)
+            except Exception:
+                self.enqueue_prune(prefix, keep_names) # 意外失败时放回，留待下次投递
+                raise
+        return deleted
+
+    def claim(self, limit):
+        """
+        领取已到投递时间的待推送文档 [(id, attempts, document)]，按写入顺序。
+
+        在同一个 BEGIN IMMEDIATE 事务中选出文档并把 next_attempt_at 推迟 claim_seconds 秒，
+        同时运行的多个 drain (例如主流程和 `drain --loop`) 不会领取到同一批文档；
+        领取后进程退出的文档在租约到期后重新可投递。
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, attempts, source_name, content FROM outbox WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                    (STATUS_PENDING, now, limit)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE outbox SET next_attempt_at = ? WHERE id = ?", [(now + self.claim_seconds, row[0]) for row in rows]
+                )
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        return [(row_id, attempts, {"file_name": source_name, "content": content}) for row_id, attempts, source_name, content in rows]
+
+    def record_results(self, entries, results):
+        """
+        根据推送结果更新发件箱：成功删除，失败按退避重新排期或标记为 dead。
+        无法确定是否已插入的文档 (unattributed) 直接标记为 dead，避免重试造成重复数据，可人工核对后 requeue-dead。
+        """
+        now = time.time()
+        done, retry, dead = [], [], []
+        for (row_id, attempts, _), result in zip(entries, results):
+            if result["success"]:
+                done.append((row_id,))
+            elif attempts + 1 >= self.max_attempts or result["status"] == STATUS_UNATTRIBUTED:
+                dead.append((STATUS_DEAD, result["message"], row_id))
+            else:
+                retry.append((now + _retry_delay(attempts + 1), result["message"], row_id))
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", done)
+            conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?", retry
+            )
+            conn.executemany("UPDATE outbox SET attempts = attempts + 1, status = ?, last_error = ? WHERE id = ?", dead)
+        for _, error, row_id in dead:
+            logger.error(f"发件箱文档 id={row_id} 推送失败且不再自动重试，标记为 dead: {error}")
+        return len(done), len(retry), len(dead)
+
+    def stats(self):
+        """返回 {"pending": n, "due": n, "dead": n}。"""
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            due = conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = ? AND next_attempt_at <= ?", (STATUS_PENDING, time.time())
+            ).fetchone()[0]
+        return {"pending": counts.get(STATUS_PENDING, 0), "due": due, "dead": counts.get(STATUS_DEAD, 0)}
+
+    def requeue_dead(self):
+        """把 dead 文档重新放回待推送队列 (重试次数清零)。"""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_DEAD)
+            ).rowcount
+
+    def drain(self, api_key, base_url, kb_id, time_budget=None):
+        """
+        推送所有已到期的文档，直到发件箱没有到期文档或超过 time_budget 秒。
+
+        Returns:
+            dict: {"pushed": 成功数, "retry": 待重试数, "dead": 新增 dead 数, "pruned": 删除的过期数据数}。
+
+        文档推送完成后，在剩余时间内执行 replace 模式的删除请求。
+        """
+        started_at = time.monotonic()
+        batch_size, _ = get_push_batch_limits()
+        claim_size = batch_size * max(1, get_env_int("FASTGPT_MAX_IN_FLIGHT", DEFAULT_UPLOAD_MAX_IN_FLIGHT))
+        # replace 模式下按来源键更新已有数据，append 模式下直接新增
+        push = sync_documents if get_sync_mode() == SYNC_MODE_REPLACE else upload_documents
+        totals = {"pushed": 0, "retry": 0, "dead": 0, "pruned": 0}
+        while time_budget is None or time.monotonic() - started_at < time_budget:
+            entries = self.claim(claim_size)
+            if not entries:
+                break
+            results = push(api_key, base_url, kb_id, [document for _, _, document in entries])
+            pushed, retry, dead = self.record_results(entries, results)
+            totals["pushed"] += pushed
+            totals["retry"] += retry
+            totals["dead"] += dead
+        else:
+            logger.warning(f"发件箱投递超过时间预算 {time_budget} 秒，剩余文档留待下次投递")
+        deadline = None if time_budget is None else started_at + time_budget
+        totals["pruned"] = self._run_prune_requests(api_key, base_url, kb_id, deadline)
+        logger.info(f"发件箱投递完成: 成功 {totals['pushed']}, 待重试 {totals['retry']}, 新增失败 {totals['dead']}, 删除过期数据 {totals['pruned']}")
+        return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FastGPT 发件箱：投递采集阶段写入的待推送文档")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    drain_parser = subparsers.add_parser("drain", help="推送已到期的文档")
+    drain_parser.add_argument("--loop", action="store_true", help="持续运行，定期投递 (后台 worker 模式)")
+    drain_parser.add_argument("--interval", type=float, default=DEFAULT_OUTBOX_DRAIN_INTERVAL, help="--loop 模式下的投递间隔秒数")
+    drain_parser.add_argument("--budget", type=float, default=None, help="单次投递的时间预算秒数 (默认不限)")
+    subparsers.add_parser("stats", help="查看发件箱状态")
+    subparsers.add_parser("requeue-dead", help="将 dead 文档重新放回待推送队列")
+    args = parser.parse_args()
+
+    outbox = FastGPTOutbox()
+    if args.command == "stats":
+        print(outbox.stats())
+        return
+    if args.command == "requeue-dead":
+        logger.info(f"已重新排队 {outbox.requeue_dead()} 个 dead 文档")
+        return
+
+    fastgpt_api_key = os.getenv("FASTGPT_API_KEY")
+    fastgpt_base_url = os.getenv("FASTGPT_BASE_URL")
+    fastgpt_kb_id = os.getenv("FASTGPT_KB_ID")
+    if not all([fastgpt_api_key, fastgpt_base_url, fastgpt_kb_id]):
+        logger.error("缺少 FASTGPT_API_KEY / FASTGPT_BASE_URL / FASTGPT_KB_ID 环境变量，无法投递。")
+        return
+
+    while True:
+        outbox.drain(fastgpt_api_key, fastgpt_base_url, fastgpt_kb_id, time_budget=args.budget)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -1,5 +1,12 @@
 import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from datetime import datetime
 import requests
+import requests.adapters
 import logging
 from enum import Enum
 
@@ -34,44 +41,40 @@ class UpdateMode(Enum):
     CHUNK = "chunk"         # 切片模式，适用于需要精确控制文本块的场景
     CUSTOM = "custom"       # 自定义模式，允许更灵活的数据结构，但通常更复杂
 
-def update_fastgpt_kb_with_content(
-    api_key: str,
-    base_url: str,
-    kb_id: str,
-    file_name: str, # 用于FastGPT记录的文件名，不一定是实际本地文件名
-    content: str,
-    mode: str = UpdateMode.INDEX.value, # 默认为索引模式
-    prompt: str = "", # 可选，某些模式下可能用到
-    metadata: dict = None # 可选，元数据
-):
-    """
-    使用提供的内容更新FastGPT知识库。
+DEFAULT_PUSH_BATCH_SIZE = 50 # 每次 pushData 请求最多包含的文档数
+DEFAULT_PUSH_BATCH_MAX_CHARS = 200000 # 每次 pushData 请求内容总字符数上限
+PUSH_DATA_API_PATH = "/api/core/dataset/data/pushData"
+DATA_UPDATE_API_PATH = "/api/core/dataset/data/update"
+DATA_DELETE_API_PATH = "/api/core/dataset/data/delete"
+DATA_LIST_API_PATH = "/api/core/dataset/data/v2/list"
+DATA_LIST_PAGE_SIZE = 30 # 按内容查找数据ID时每次列出的条数
+SOURCE_SEARCH_TEXT_CHARS = 50 # 本地保存用于查找数据ID的内容前缀长度
+DEFAULT_HTTP_POOL_SIZE = 10 # FastGPTClient 连接池保持的最大连接数
+DEFAULT_UPLOAD_RATE_LIMIT = 1.0 # 异步上传默认每秒请求数
+DEFAULT_UPLOAD_MAX_IN_FLIGHT = 2 # 异步上传默认同时在途请求数
+DEFAULT_UPLOAD_MAX_RETRIES = 3 # 限流/过载时单个批次的最大重试次数
+MIN_UPLOAD_RATE_LIMIT = 0.1 # 自适应降速的下限 (次/秒)
+UPLOAD_RATE_INCREASE_RATIO = 0.1 # 每次成功后速率回升的幅度 (相对于配置速率)
+DEFAULT_DATA_STATE_DIR = "data_state" # 与采集器共用的本地状态目录
+UPLOADED_STATUSES = ("inserted", "repeat", "accepted") # 视为内容已在知识库中的推送结果
+STATUS_UNATTRIBUTED = "unattributed" # 批次部分插入、无法确定是否已插入的条目：记为失败但不重试，以免重复插入
+SYNC_MODE_APPEND = "append"
+SYNC_MODE_REPLACE = "replace"
 
-    Args:
-        api_key (str): FastGPT API密钥。
-        base_url (str): FastGPT实例的基础URL (例如: https://fastgpt.yourdomain.com)。
-        kb_id (str): 要更新的知识库ID。
-        file_name (str): 在FastGPT中显示的文件名。
-        content (str): 要推送到知识库的文本内容。
-        mode (str): 更新模式 ('index', 'chunk', 'custom')。
-        prompt (str, optional): 提示信息，某些模式下使用。默认为 ""。
-        metadata (dict, optional): 附加的元数据。默认为 None。
 
-    Returns:
-        bool: 更新是否成功。
-    """
-    if not all([api_key, base_url, kb_id, file_name, content]):
-        logger.error("FastGPT更新参数不完整。")
-        return False
+def build_push_data_url(base_url: str) -> str:
+    """根据 FASTGPT_BASE_URL 拼接 pushData 端点，兼容 base_url 是否以 /api 结尾。"""
+    return build_api_url(base_url, PUSH_DATA_API_PATH)
+
 
+def build_api_url(base_url: str, target_api_path: str) -> str:
+    """根据 FASTGPT_BASE_URL 拼接任意 /api/... 端点，兼容 base_url 是否以 /api 结尾。"""
     # 确保 base_url 不以 / 结尾
     if base_url.endswith('/'):
         base_url = base_url[:-1]
     
     # 如果 base_url 包含了 /api，而目标端点也以 /api 开头，需要避免重复
-    # 正确的API端点: /api/core/dataset/data/pushData
-    target_api_path = "/api/core/dataset/data/pushData"
-    
+    # 例如正确的API端点: /api/core/dataset/data/pushData
     if base_url.endswith('/api') and target_api_path.startswith('/api'):
         # base_url已经是 https://.../api，目标是 /api/core...
         # 我们需要移除 base_url 末尾的 /api，或者移除 target_api_path 开头的 /api
@@ -97,115 +100,856 @@ def update_fastgpt_kb_with_content(
         else:
             api_url = f"{base_url}{target_api_path}"
         logger.warning(f"FastGPT base_url 和 target_api_path 的组合可能不标准: base_url='{base_url}', target_api_path='{target_api_path}', 拼接结果='{api_url}'")
+    return api_url
 
 
-    # 根据不同的模式构建API URL和请求体
-    # FastGPT 的 OpenAPI v1 文档中，推送数据的端点是 /api/openapi/v1/kb/pushData # 旧注释，保留参考
-    # 更新：根据用户提供的文档 https://doc.tryfastgpt.ai/docs/development/openapi/dataset/
-    # 正确的API端点是 /api/core/dataset/data/push
-    # api_url = f"{base_url}/api/openapi/v1/kb/pushData" # 旧代码，已替换
+def get_env_int(env_name, default):
+    try:
+        return int(os.getenv(env_name, default))
+    except ValueError:
+        logger.warning(f"{env_name}环境变量值无效，将使用默认值: {default}")
+        return default
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
-    # 读取 collectionId
-    collection_id = os.getenv("FASTGPT_COLLECTION_ID")
-    if not collection_id:
-        logger.error("未检测到环境变量 FASTGPT_COLLECTION_ID")
-        return False
+def get_env_float(env_name, default):
+    try:
+        value = float(os.getenv(env_name, default))
+    except ValueError:
+        logger.warning(f"{env_name}环境变量值无效，将使用默认值: {default}")
+        return default
+    return value if value > 0 else default
 
-    # Payload for POST /api/core/dataset/data/push
-    # kb_id from args maps to datasetId
-    # file_name from args maps to sourceName
-    data_payload = {
-        "collectionId": collection_id,
-        "trainingType": "chunk",
-        "data": [
-            {
-                "q": content,
-                "a": "",  # Auxiliary content, can be empty
-                "sourceName": file_name, # Name of the source file
-            }
-        ],
-        # "mode": mode, 
-        # prompt is optional for this endpoint based on docs, 
-        # but including it if provided, FastGPT might ignore if not applicable
-        "prompt": prompt 
-    }
-    
-    # The 'prompt' field was part of the old API structure /api/openapi/v1/kb/pushData.
-    # For /api/core/dataset/data/push, the documentation shows 'prompt' as an optional top-level field.
-    # 'metadata' is not explicitly listed as a top-level field for /api/core/dataset/data/push.
-    # If metadata is needed, it might go inside each data object or be handled differently.
-    # For now, keeping it simple based on primary fields.
-
-    # logger.info(f"向FastGPT推送数据: URL={api_url}, KB_ID={kb_id}, 文件名={file_name}, 模式={mode}")
-    # Corrected log to reflect datasetId
-    logger.info(f"向FastGPT推送数据: URL={api_url}, Dataset_ID={kb_id}, 文件名={file_name}, 模式={mode}")
-    logger.debug(f"FastGPT请求体 (部分内容): {{datasetId: '{kb_id}', data: [{{q: '{content[:100]}...'}}], mode: '{mode}'}}") # Corrected log key
 
+def get_push_batch_limits():
+    """从环境变量 FASTGPT_PUSH_BATCH_SIZE / FASTGPT_PUSH_BATCH_MAX_CHARS 读取批量推送上限。"""
+    return (max(1, get_env_int("FASTGPT_PUSH_BATCH_SIZE", DEFAULT_PUSH_BATCH_SIZE)),
+            max(1, get_env_int("FASTGPT_PUSH_BATCH_MAX_CHARS", DEFAULT_PUSH_BATCH_MAX_CHARS)))
+
+
+def iter_document_batches(documents, max_items, max_chars):
+    """
+    将文档按数量和内容总字符数打包成批次。单个超过 max_chars 的文档独占一个批次。
+
+    Args:
+        documents (iterable): 每项为 {"file_name": ..., "content": ...}。
+    """
+    batch = []
+    batch_chars = 0
+    for document in documents:
+        doc_chars = len(document["content"])
+        if batch and (len(batch) >= max_items or batch_chars + doc_chars > max_chars):
+            yield batch
+            batch = []
+            batch_chars = 0
+        batch.append(document)
+        batch_chars += doc_chars
+    if batch:
+        yield batch
+
+
+def _match_batch_item(batch, entry, taken):
+    """在批次中找到 FastGPT 返回的失败条目对应的文档下标 (按 sourceName，其次按 q)。"""
+    if not isinstance(entry, dict):
+        return None
+    for key, doc_key in (("sourceName", "file_name"), ("q", "content")):
+        value = entry.get(key)
+        if value is None:
+            continue
+        for idx, document in enumerate(batch):
+            if idx not in taken and document[doc_key] == value:
+                return idx
+    return None
+
+
+def _parse_push_response(batch, response_data):
+    """
+    将一次 pushData 响应拆解为批次内每个文档的结果。
+
+    FastGPT 返回 {"insertLen": n, ...}，部分版本还会在 overToken / repeat / error 中列出
+    未插入的条目，用来把失败定位到具体文档；repeat 表示内容已存在，按成功处理。
+    明确被拒绝的条目 (overToken / error) 记为失败并重试；整批均未插入/更新时，未列出的条目
+    全部记为 invalid 失败并重试。批次部分插入但没有列出失败条目时，只有
+    len(batch) - insertLen - updateLen - 已列出条目数 个条目无法确定结果：按批次顺序把未列出条目中
+    末尾的这些条目记为 unattributed (success=False)，由发件箱直接标记为 dead 而不重试，其余记为插入成功。
+    """
+    def results_for_all(success, status, message):
+        return [{"file_name": doc["file_name"], "success": success, "status": status, "message": message} for doc in batch]
+
+    if response_data.get("code") != 200 or not response_data.get("data"):
+        return results_for_all(False, "error", f"FastGPT API未返回成功的响应代码或数据结构: {response_data}")
+
+    push_result = response_data["data"]
+    if isinstance(push_result, str) or (isinstance(push_result, dict) and push_result.get("id")):
+        # 旧版本API成功时直接返回数据ID
+        return results_for_all(True, "inserted", "")
+    if not isinstance(push_result, dict):
+        return results_for_all(False, "error", f"无法识别的FastGPT响应: {response_data}")
+
+    insert_len = push_result.get('insertLen', 0) or 0
+    update_len = push_result.get('updateLen', 0) or 0
+    invalid_len = push_result.get('invalidLen', 0) or 0
+
+    failed = {}
+    for reason in ("overToken", "error", "repeat"):
+        for entry in push_result.get(reason) or []:
+            idx = _match_batch_item(batch, entry, failed)
+            if idx is not None:
+                failed[idx] = reason
+
+    if insert_len == 0 and update_len == 0 and invalid_len == 0 and not failed:
+        logger.info("FastGPT 推送了0条有效数据或未返回明确的数据ID，但API调用成功。可能是重复或空内容，或API版本差异。")
+        return results_for_all(True, "accepted", "")
+
+    unlisted = [idx for idx in range(len(batch)) if idx not in failed]
+    if insert_len + update_len == 0:
+        rejected, unattributed = set(unlisted), set()
+    else:
+        unattributed_count = max(0, len(batch) - insert_len - update_len - len(failed))
+        rejected, unattributed = set(), set(unlisted[len(unlisted) - unattributed_count:] if unattributed_count else [])
+
+    results = []
+    for idx, document in enumerate(batch):
+        reason = failed.get(idx)
+        if reason == "repeat":
+            results.append({"file_name": document["file_name"], "success": True, "status": "repeat", "message": "内容已存在"})
+        elif reason:
+            results.append({"file_name": document["file_name"], "success": False, "status": reason, "message": f"FastGPT拒绝该条数据 ({reason})"})
+        elif idx in rejected:
+            results.append({
+                "file_name": document["file_name"], "success": False, "status": "invalid",
+                "message": f"FastGPT未插入该批次任何数据 (批次 {len(batch)}，无效 {invalid_len})"
+            })
+        elif idx in unattributed:
+            results.append({
+                "file_name": document["file_name"], "success": False, "status": STATUS_UNATTRIBUTED,
+                "message": f"批次插入 {insert_len}/{len(batch)}，无效 {invalid_len}，无法确定该条是否已插入"
+            })
+        else:
+            results.append({"file_name": document["file_name"], "success": True, "status": "inserted", "message": ""})
+    if unattributed:
+        logger.warning(f"FastGPT批次插入 {insert_len}/{len(batch)} 条且未列出失败条目，{len(unattributed)} 条结果无法确定，记为 {STATUS_UNATTRIBUTED}，不自动重试")
+    logger.info(f"FastGPT数据推送结果: 插入 {insert_len}, 更新 {update_len}, 无效 {invalid_len}, 批次大小 {len(batch)}")
+    return results
+
+
+def _parse_retry_after(response):
+    """解析 Retry-After 响应头 (秒)，无法解析时返回 0。"""
     try:
-        response = requests.post(api_url, headers=headers, json=data_payload, timeout=60) # Using data_payload
-        response.raise_for_status()  # 如果HTTP状态码是4xx或5xx，则抛出异常
-        
-        response_data = response.json()
-        logger.info(f"FastGPT API完整响应: {response_data}")
-        logger.info(f"FastGPT API响应: {response_data}")
-        
-        # 检查响应中是否有指示成功的字段，例如 id 或其他特定于API的成功代码
-        # FastGPT pushData API成功时通常会返回插入/更新的数据条数或ID
-        # 例如：{"code":200,"message":"请求成功","data":{"insertLen":1,"updateLen":0,"invalidLen":0}}
-        if response_data.get("code") == 200 and isinstance(response_data.get("data"), dict):
-            push_result = response_data["data"]
-            # 新的API响应格式可能不同，例如:
-            # {"code":200,"message":"ok","data":{"id":"xxxxxxxx","status":"parsing","sourceId":"xxxx"}}
-            # 或者 {"code":200,"message":"ok","data":{"message":"xxxxx","dataId":"xxxxx"}}
-            # 或者成功时直接是 {"code":200,"message":"ok","data": "xxxxx"} (data是字符串ID)
-            # 或者 {"code":200, "message":"ok", "data": {"id": "...", "status": "parsing"}}
-
-            # 通用成功判断：code == 200 并且 data 字段存在且不为空
-            if response_data.get("data"): # 只要data字段存在且非空，就认为API调用是成功的
-                insert_len = push_result.get('insertLen', 0) if isinstance(push_result, dict) else 0
-                update_len = push_result.get('updateLen', 0) if isinstance(push_result, dict) else 0
-                invalid_len = push_result.get('invalidLen', 0) if isinstance(push_result, dict) else 0
-                data_id = push_result.get('id') if isinstance(push_result, dict) else (push_result if isinstance(push_result, str) else None)
-
-                if data_id:
-                     logger.info(f"FastGPT数据推送成功，数据ID: {data_id}, 状态: {push_result.get('status', '未知') if isinstance(push_result, dict) else '未知'}")
-                     return True
-                elif insert_len > 0 or update_len > 0:
-                    logger.info(f"FastGPT数据推送结果: 插入 {insert_len}, 更新 {update_len}, 无效 {invalid_len}")
-                    if invalid_len > 0:
-                         logger.warning(f"FastGPT推送时存在无效数据，无效条数: {invalid_len}")
-                    return True
-                elif insert_len == 0 and update_len == 0 and invalid_len == 0 and not data_id:
-                     logger.info("FastGPT 推送了0条有效数据或未返回明确的数据ID，但API调用成功。可能是重复或空内容，或API版本差异。")
-                     return True # 行为上没有出错，但可能需要关注具体响应
-                else:
-                    logger.error(f"FastGPT推送数据后未识别到成功标志，响应: {response_data}")
-                    return False
-            else: # data 字段为空或不存在
-                logger.error(f"FastGPT API返回成功代码，但 'data' 字段为空或不存在。响应: {response_data}")
-                return False
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except (TypeError, ValueError, AttributeError):
+        return 0.0
+
+
+def is_upload_dedup_enabled():
+    """是否跳过内容未变化的文档，可通过环境变量 FASTGPT_UPLOAD_DEDUP=false 关闭。"""
+    return os.getenv("FASTGPT_UPLOAD_DEDUP", "true").lower() in ("1", "true", "yes")
+
+
+class UploadIndex:
+    """
+    已上传内容的本地索引，按内容哈希记录推送成功的文档及其 sourceName。
+
+    append 模式下以内容哈希为键，因此文件名中带有生成时间戳的报告分块，只要内容逐字节相同也会被跳过。
+    replace 模式下 sourceName 是稳定的来源键，以 (sourceName, 内容哈希) 为键，内容相同的不同来源分别上传。
+    索引保存在 DATA_STATE_DIR 下，按 FastGPT 地址和集合区分，写入采用临时文件 + 原子替换。
+    """
+
+    def __init__(self, path, by_source=False):
+        self.path = path
+        self.by_source = by_source
+        self._lock = threading.Lock()
+        self._entries = _load_state_entries(path, "FastGPT上传索引")
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def key(self, document):
+        content_hash = self.content_hash(document["content"])
+        return f"{document['file_name']}|{content_hash}" if self.by_source else content_hash
+
+    def is_uploaded(self, document):
+        with self._lock:
+            return self.key(document) in self._entries
+
+    def record(self, documents, results):
+        """记录推送成功的文档 (documents 与 results 一一对应)，并写回磁盘。"""
+        uploaded_at = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            for document, result in zip(documents, results):
+                if result["success"] and result["status"] in UPLOADED_STATUSES:
+                    self._entries[self.key(document)] = {
+                        "sourceName": document["file_name"],
+                        "uploaded_at": uploaded_at,
+                    }
+            _save_state_entries(self.path, self._entries)
+
+
+def _state_file_path(prefix, base_url, collection_id):
+    """DATA_STATE_DIR 下按 FastGPT 地址和集合区分的状态文件路径。"""
+    scope = hashlib.sha1(f"{base_url.rstrip('/')}|{collection_id}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.getenv("DATA_STATE_DIR", DEFAULT_DATA_STATE_DIR), f"{prefix}_{scope}.json")
+
+
+def _load_state_entries(path, label):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("entries", {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取{label} {path} 失败，将按空状态处理: {e}")
+        return {}
+
+
+def _save_state_entries(path, entries):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"entries": entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, path) # 原子替换，避免中断时留下半个文件
+
+
+_upload_indexes = {}
+_upload_indexes_lock = threading.Lock()
+
+
+def get_upload_index(base_url, collection_id):
+    """返回 (base_url, collection_id) 对应的上传索引，同一进程内共享同一个实例；replace 模式下按来源区分。"""
+    path = _state_file_path("fastgpt_upload_index", base_url, collection_id)
+    by_source = get_sync_mode() == SYNC_MODE_REPLACE
+    with _upload_indexes_lock:
+        if (path, by_source) not in _upload_indexes:
+            _upload_indexes[(path, by_source)] = UploadIndex(path, by_source=by_source)
+        return _upload_indexes[(path, by_source)]
+
+
+def _unchanged_result(document):
+    return {"file_name": document["file_name"], "success": True, "status": "unchanged", "message": "内容未变化，已跳过"}
+
+
+def _merge_skipped_results(results, skipped):
+    """把跳过的文档结果 [(原始下标, 结果)] 按原始顺序插回推送结果中。"""
+    for position, result in skipped:
+        results.insert(position, result)
+    return results
+
+
+def _iter_changed_documents(documents, index, skipped):
+    """过滤掉已上传过的文档，跳过的文档以 (原始下标, 结果) 追加到 skipped。"""
+    for position, document in enumerate(documents):
+        if index.is_uploaded(document):
+            skipped.append((position, _unchanged_result(document)))
         else:
-            logger.error(f"FastGPT API未返回成功的响应代码或数据结构。响应: {response_data}")
-            return False
-            
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"FastGPT API请求失败: HTTP {e.response.status_code}")
-        # 记录更详细的响应内容，帮助调试404等问题
-        response_text = ""
+            yield document
+
+
+class FastGPTAPIError(Exception):
+    pass
+
+
+class FastGPTClient:
+    """
+    可复用的 FastGPT 数据接口客户端。
+
+    创建时一次性解析各端点URL、读取 FASTGPT_COLLECTION_ID 并准备请求头，所有请求通过同一个
+    requests.Session 发出，连接池 (FASTGPT_HTTP_POOL_SIZE) 保持长连接，避免每个文档重复建立 TCP+TLS 连接。
+    Session 可在多个线程间共享，供异步上传器在线程池中并发使用。
+    """
+
+    def __init__(self, api_key: str, base_url: str, kb_id: str, collection_id: str = None, pool_size: int = None):
+        if not all([api_key, base_url, kb_id]):
+            raise ValueError("FastGPT更新参数不完整。")
+        collection_id = collection_id or os.getenv("FASTGPT_COLLECTION_ID")
+        if not collection_id:
+            raise ValueError("未检测到环境变量 FASTGPT_COLLECTION_ID")
+
+        self.base_url = base_url
+        self.kb_id = kb_id
+        self.collection_id = collection_id
+        self.push_url = build_push_data_url(base_url)
+        self.update_url = build_api_url(base_url, DATA_UPDATE_API_PATH)
+        self.delete_url = build_api_url(base_url, DATA_DELETE_API_PATH)
+        self.list_url = build_api_url(base_url, DATA_LIST_API_PATH)
+
+        pool_size = pool_size or max(1, get_env_int("FASTGPT_HTTP_POOL_SIZE", DEFAULT_HTTP_POOL_SIZE))
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def upload_index(self):
+        return get_upload_index(self.base_url, self.collection_id)
+
+    @property
+    def sync_state(self):
+        return get_source_sync_state(self.base_url, self.collection_id)
+
+    def push_batch(self, batch, prompt: str = ""):
+        """
+        发送一个 pushData 批次。
+
+        Returns:
+            tuple: (批次内每个文档的结果, throttle_delay)。服务端限流或过载 (429/5xx、超时、连接错误) 时
+                throttle_delay 为建议的等待秒数 (来自 Retry-After，没有则为 0)，否则为 None。
+        """
+        data_payload = {
+            "collectionId": self.collection_id,
+            "trainingType": "chunk",
+            "data": [
+                {
+                    "q": document["content"],
+                    "a": "",  # Auxiliary content, can be empty
+                    "sourceName": document["file_name"], # Name of the source file
+                }
+                for document in batch
+            ],
+            "prompt": prompt
+        }
+        throttle_delay = None
+        try:
+            response = self.session.post(self.push_url, json=data_payload, timeout=60)
+            response.raise_for_status()  # 如果HTTP状态码是4xx或5xx，则抛出异常
+            response_data = response.json()
+            logger.info(f"FastGPT API响应: {response_data}")
+            return _parse_push_response(batch, response_data), None
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"FastGPT API请求失败: HTTP {e.response.status_code}")
+            # 记录更详细的响应内容，帮助调试404等问题
+            response_text = ""
+            try:
+                response_text = e.response.text
+            except Exception:
+                response_text = "无法获取响应文本"
+            logger.error(f"响应内容: {response_text[:1000]}") # 限制长度避免日志过大
+            message = f"HTTP {e.response.status_code}"
+            if e.response.status_code == 429 or e.response.status_code >= 500:
+                throttle_delay = _parse_retry_after(e.response)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            logger.error(f"FastGPT API请求超时或连接失败: {str(e)}")
+            message = str(e)
+            throttle_delay = 0.0
+        except Exception as e:
+            logger.error(f"更新FastGPT知识库时发生未知错误: {str(e)}", exc_info=True)
+            message = str(e)
+        return [{"file_name": doc["file_name"], "success": False, "status": "error", "message": message} for doc in batch], throttle_delay
+
+    def push(
+        self,
+        documents,
+        max_items: int = None,
+        max_chars: int = None,
+        prompt: str = "",
+        interval_seconds: float = 0,
+        dedup: bool = None
+    ):
+        """
+        批量推送文档，每次 pushData 请求包含多条数据。参数和返回值同 push_documents_to_fastgpt。
+        """
+        documents = list(documents)
+        default_items, default_chars = get_push_batch_limits()
+        max_items = max_items or default_items
+        max_chars = max_chars or default_chars
+
+        index = self.upload_index if (is_upload_dedup_enabled() if dedup is None else dedup) else None
+        skipped = []
+        if index:
+            documents = list(_iter_changed_documents(documents, index, skipped))
+            if skipped:
+                logger.info(f"跳过 {len(skipped)} 个内容未变化的文档")
+
+        results = []
+        for batch_idx, batch in enumerate(iter_document_batches(documents, max_items, max_chars)):
+            if batch_idx and interval_seconds:
+                time.sleep(interval_seconds)
+            logger.info(f"向FastGPT批量推送数据: URL={self.push_url}, Dataset_ID={self.kb_id}, 批次 {batch_idx + 1}, 文档数 {len(batch)}")
+            batch_results = self.push_batch(batch, prompt)[0]
+            for result in batch_results:
+                if not result["success"]:
+                    logger.error(f"FastGPT推送失败: 文件名={result['file_name']}, 状态={result['status']}, 原因={result['message']}")
+            if index:
+                index.record(batch, batch_results)
+            results.extend(batch_results)
+        return _merge_skipped_results(results, skipped)
+
+    def push_one(self, file_name: str, content: str, prompt: str = "", dedup: bool = None):
+        """推送单个文档，返回该文档的结果。"""
+        return self.push([{"file_name": file_name, "content": content}], prompt=prompt, dedup=dedup)[0]
+
+    def call(self, method, url, payload=None, params=None):
+        """调用 FastGPT 数据接口，返回响应中的 data 字段；失败时抛出 FastGPTAPIError。"""
         try:
-            response_text = e.response.text
-        except Exception:
-            response_text = "无法获取响应文本"
-        logger.error(f"响应内容: {response_text[:1000]}") # 限制长度避免日志过大
+            response = self.session.request(method, url, json=payload, params=params, timeout=60)
+            response.raise_for_status()
+            response_data = response.json()
+        except requests.exceptions.HTTPError as e:
+            raise FastGPTAPIError(f"HTTP {e.response.status_code}: {e.response.text[:500]}") from e
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise FastGPTAPIError(str(e)) from e
+        if response_data.get("code") != 200:
+            raise FastGPTAPIError(f"FastGPT API未返回成功的响应代码: {response_data}")
+        return response_data.get("data")
+
+    def update_data(self, data_id, q, a=""):
+        return self.call("PUT", self.update_url, payload={"dataId": data_id, "q": q, "a": a})
+
+    def delete_data(self, data_id):
+        return self.call("DELETE", self.delete_url, params={"id": data_id})
+
+    def list_data(self, search_text="", offset=0, page_size=DATA_LIST_PAGE_SIZE):
+        """列出集合中的数据，返回 {"list": [...], "total": n}。"""
+        return self.call("POST", self.list_url, payload={
+            "collectionId": self.collection_id,
+            "offset": offset,
+            "pageSize": page_size,
+            "searchText": search_text,
+        }) or {}
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_fastgpt_client(api_key: str, base_url: str, kb_id: str):
+    """
+    返回共享的 FastGPTClient，同一组配置在进程内只创建一次。
+
+    Raises:
+        ValueError: 参数不完整或未配置 FASTGPT_COLLECTION_ID。
+    """
+    key = (api_key, base_url, kb_id, os.getenv("FASTGPT_COLLECTION_ID"))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = FastGPTClient(api_key, base_url, kb_id)
+        return _clients[key]
+
+
+def _get_client_or_error(api_key, base_url, kb_id):
+    """返回 (client, None)；配置不完整时记录日志并返回 (None, 错误信息)。"""
+    try:
+        return get_fastgpt_client(api_key, base_url, kb_id), None
+    except ValueError as e:
+        logger.error(str(e))
+        return None, str(e)
+
+
+def _error_results(documents, message):
+    return [{"file_name": doc.get("file_name"), "success": False, "status": "error", "message": message} for doc in documents]
+
+
+def push_documents_to_fastgpt(
+    api_key: str,
+    base_url: str,
+    kb_id: str,
+    documents,
+    max_items: int = None,
+    max_chars: int = None,
+    prompt: str = "",
+    interval_seconds: float = 0,
+    dedup: bool = None
+):
+    """
+    批量推送文档到FastGPT知识库，每次 pushData 请求包含多条数据。
+
+    Args:
+        api_key (str): FastGPT API密钥。
+        base_url (str): FastGPT实例的基础URL。
+        kb_id (str): 知识库ID (仅用于日志，数据写入 FASTGPT_COLLECTION_ID 集合)。
+        documents (iterable): 每项为 {"file_name": 在FastGPT中显示的文件名, "content": 文本内容}。
+        max_items (int, optional): 每批最多文档数，默认读取 FASTGPT_PUSH_BATCH_SIZE。
+        max_chars (int, optional): 每批内容总字符数上限，默认读取 FASTGPT_PUSH_BATCH_MAX_CHARS。
+        prompt (str, optional): 提示信息。
+        interval_seconds (float): 两个批次请求之间的等待时间，用于避免接口限流。
+        dedup (bool, optional): 是否跳过内容已上传过的文档，默认读取 FASTGPT_UPLOAD_DEDUP。
+
+    Returns:
+        list: 与输入顺序一致的结果列表，每项为
+            {"file_name", "success": bool, "status": inserted/repeat/accepted/unchanged/overToken/error/invalid/unattributed, "message"}。
+    """
+    documents = list(documents)
+    if not documents:
+        return []
+    client, error = _get_client_or_error(api_key, base_url, kb_id)
+    if not client:
+        return _error_results(documents, error)
+    return client.push(documents, max_items=max_items, max_chars=max_chars, prompt=prompt,
+                       interval_seconds=interval_seconds, dedup=dedup)
+
+
+class TokenBucket:
+    """
+    asyncio 令牌桶限速器。rate 为每秒补充的令牌数，capacity 为允许的突发请求数。
+    rate 可在运行中调整，用于根据服务端反馈自适应降速/提速。
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+
+class AsyncFastGPTUploader:
+    """
+    基于 asyncio 的 FastGPT 批量上传器。
+
+    - 令牌桶控制每秒请求数 (FASTGPT_RATE_LIMIT)，信号量控制同时在途请求数 (FASTGPT_MAX_IN_FLIGHT)。
+    - 收到 429/5xx/超时时速率减半 (遵循 Retry-After) 并重试该批次，成功后逐步恢复 (AIMD)，
+      使上传吞吐量跟随服务端实际承受能力。
+    - HTTP 请求通过共享的 FastGPTClient (requests.Session 连接池) 在线程池中执行，不引入新的依赖。
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        kb_id: str,
+        rate: float = None,
+        max_in_flight: int = None,
+        max_retries: int = None,
+        max_items: int = None,
+        max_chars: int = None,
+        prompt: str = "",
+        dedup: bool = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.kb_id = kb_id
+        self.max_rate = rate or get_env_float("FASTGPT_RATE_LIMIT", DEFAULT_UPLOAD_RATE_LIMIT)
+        self.min_rate = min(MIN_UPLOAD_RATE_LIMIT, self.max_rate)
+        self.max_in_flight = max(1, max_in_flight or get_env_int("FASTGPT_MAX_IN_FLIGHT", DEFAULT_UPLOAD_MAX_IN_FLIGHT))
+        self.max_retries = max_retries if max_retries is not None else get_env_int("FASTGPT_MAX_RETRIES", DEFAULT_UPLOAD_MAX_RETRIES)
+        default_items, default_chars = get_push_batch_limits()
+        self.max_items = max_items or default_items
+        self.max_chars = max_chars or default_chars
+        self.prompt = prompt
+        self.dedup = is_upload_dedup_enabled() if dedup is None else dedup
+
+    def _on_throttled(self, bucket, delay):
+        new_rate = max(self.min_rate, bucket.rate / 2)
+        if new_rate < bucket.rate:
+            logger.warning(f"FastGPT 服务端限流或过载，上传速率降低为 {new_rate:.2f} 次/秒")
+        bucket.set_rate(new_rate)
+        return max(delay, 1 / new_rate)
+
+    def _on_success(self, bucket):
+        if bucket.rate < self.max_rate:
+            bucket.set_rate(min(self.max_rate, bucket.rate + self.max_rate * UPLOAD_RATE_INCREASE_RATIO))
+
+    async def _upload_batch(self, loop, bucket, client, batch):
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            results, throttle_delay = await loop.run_in_executor(None, client.push_batch, batch, self.prompt)
+            if throttle_delay is None:
+                self._on_success(bucket)
+                return results
+            delay = self._on_throttled(bucket, throttle_delay)
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.error(f"FastGPT 批次重试 {self.max_retries} 次后仍失败，放弃该批次 ({len(batch)} 条)")
+                return results
+            logger.info(f"{delay:.1f} 秒后重试 FastGPT 批次 (第 {attempt}/{self.max_retries} 次重试)")
+            await asyncio.sleep(delay)
+
+    async def upload(self, documents):
+        """
+        上传文档，返回与输入顺序一致的结果列表 (格式同 push_documents_to_fastgpt)。
+        documents 可以是生成器：只有在有空闲的在途名额时才会读取下一个批次。
+        """
+        client, error = _get_client_or_error(self.api_key, self.base_url, self.kb_id)
+        if not client:
+            return _error_results(documents, error)
+
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(self.max_rate)
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks = []
+        index = client.upload_index if self.dedup else None
+        skipped = []
+        if index:
+            documents = _iter_changed_documents(documents, index, skipped)
+
+        async def run(batch):
+            try:
+                batch_results = await self._upload_batch(loop, bucket, client, batch)
+                if index:
+                    await loop.run_in_executor(None, index.record, batch, batch_results)
+                return batch_results
+            finally:
+                slots.release()
+
+        for batch in iter_document_batches(documents, self.max_items, self.max_chars):
+            await slots.acquire()
+            logger.info(f"向FastGPT批量推送数据: URL={client.push_url}, Dataset_ID={self.kb_id}, 批次 {len(tasks) + 1}, 文档数 {len(batch)}")
+            tasks.append(asyncio.ensure_future(run(batch)))
+
+        results = []
+        for batch_results in await asyncio.gather(*tasks):
+            for result in batch_results:
+                if not result["success"]:
+                    logger.error(f"FastGPT推送失败: 文件名={result['file_name']}, 状态={result['status']}, 原因={result['message']}")
+            results.extend(batch_results)
+        if skipped:
+            logger.info(f"跳过 {len(skipped)} 个内容未变化的文档")
+        return _merge_skipped_results(results, skipped)
+
+
+def upload_documents(api_key: str, base_url: str, kb_id: str, documents, **kwargs):
+    """AsyncFastGPTUploader 的同步入口，供非 asyncio 代码调用。kwargs 透传给 AsyncFastGPTUploader。"""
+    uploader = AsyncFastGPTUploader(api_key, base_url, kb_id, **kwargs)
+    return asyncio.run(uploader.upload(documents))
+
+
+def get_sync_mode():
+    """
+    FastGPT 同步模式 (环境变量 FASTGPT_SYNC_MODE)：
+    append (默认) 每次推送都新增数据；replace 按稳定的 sourceName 更新已有数据、删除过期数据。
+    """
+    mode = os.getenv("FASTGPT_SYNC_MODE", SYNC_MODE_APPEND).lower()
+    if mode not in (SYNC_MODE_APPEND, SYNC_MODE_REPLACE):
+        logger.warning(f"FASTGPT_SYNC_MODE环境变量值无效，将使用默认值: {SYNC_MODE_APPEND}")
+        return SYNC_MODE_APPEND
+    return mode
+
+
+class SourceSyncState:
+    """
+    replace 模式下 sourceName -> 远端数据的本地映射：{"data_id", "hash", "search"}。
+
+    pushData 不返回新数据的ID，data_id 在需要更新/删除时再通过 v2/list 按内容查找并回填；
+    search 保存内容前缀，用作查找时的 searchText。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = _load_state_entries(path, "FastGPT同步状态")
+
+    def get(self, source_name):
+        with self._lock:
+            entry = self._entries.get(source_name)
+            return dict(entry) if entry else None
+
+    def source_names(self):
+        with self._lock:
+            return list(self._entries)
+
+    def set(self, source_name, content, data_id=None):
+        with self._lock:
+            self._entries[source_name] = {
+                "data_id": data_id,
+                "hash": UploadIndex.content_hash(content),
+                "search": content[:SOURCE_SEARCH_TEXT_CHARS],
+            }
+            _save_state_entries(self.path, self._entries)
+
+    def set_data_id(self, source_name, data_id):
+        with self._lock:
+            if source_name in self._entries:
+                self._entries[source_name]["data_id"] = data_id
+                _save_state_entries(self.path, self._entries)
+
+    def remove(self, source_name):
+        with self._lock:
+            if self._entries.pop(source_name, None) is not None:
+                _save_state_entries(self.path, self._entries)
+
+
+_sync_states = {}
+_sync_states_lock = threading.Lock()
+
+
+def get_source_sync_state(base_url, collection_id):
+    """返回 (base_url, collection_id) 对应的同步状态，同一进程内共享同一个实例。"""
+    path = _state_file_path("fastgpt_sources", base_url, collection_id)
+    with _sync_states_lock:
+        if path not in _sync_states:
+            _sync_states[path] = SourceSyncState(path)
+        return _sync_states[path]
+
+
+def _resolve_data_id(client, state, source_name):
+    """
+    返回 source_name 对应的远端数据ID，本地没有时按内容前缀列出并以内容哈希匹配。
+
+    内容前缀相同的数据可能有多页，按 offset/total 翻页直到找到或全部检查完。
+    """
+    entry = state.get(source_name)
+    if not entry:
+        return None
+    if entry.get("data_id"):
+        return entry["data_id"]
+    offset = 0
+    while True:
+        page = client.list_data(search_text=entry.get("search", ""), offset=offset)
+        items = page.get("list") or []
+        for item in items:
+            if UploadIndex.content_hash(item.get("q", "")) == entry["hash"]:
+                state.set_data_id(source_name, item["_id"])
+                return item["_id"]
+        offset += len(items)
+        total = page.get("total")
+        if not items or (total is not None and offset >= total) or (total is None and len(items) < DATA_LIST_PAGE_SIZE):
+            return None
+
+
+def sync_documents(api_key: str, base_url: str, kb_id: str, documents, prompt: str = ""):
+    """
+    replace 模式推送：以 file_name 作为稳定的来源键。
+
+    - 内容与上次同步相同的文档跳过 (status=unchanged)；
+    - 已同步过但内容变化的文档调用 data/update 原地更新 (status=updated)，找不到远端数据时改为重新推送；
+    - 新文档通过 pushData 批量推送。
+
+    Returns:
+        list: 与输入顺序一致的结果列表，格式同 push_documents_to_fastgpt。
+    """
+    documents = list(documents)
+    client, error = _get_client_or_error(api_key, base_url, kb_id)
+    if not client:
+        return _error_results(documents, error)
+    state = client.sync_state
+
+    results = [None] * len(documents)
+    new_positions = []
+    for position, document in enumerate(documents):
+        entry = state.get(document["file_name"])
+        if entry is None:
+            new_positions.append(position)
+            continue
+        if entry["hash"] == UploadIndex.content_hash(document["content"]):
+            results[position] = _unchanged_result(document)
+            continue
+        try:
+            data_id = _resolve_data_id(client, state, document["file_name"])
+            if not data_id:
+                logger.warning(f"未找到 {document['file_name']} 对应的FastGPT数据，将重新推送")
+                new_positions.append(position)
+                continue
+            client.update_data(data_id, document["content"])
+            state.set(document["file_name"], document["content"], data_id)
+            results[position] = {"file_name": document["file_name"], "success": True, "status": "updated", "message": ""}
+        except FastGPTAPIError as e:
+            logger.error(f"更新FastGPT数据失败: 文件名={document['file_name']}, 原因={e}")
+            results[position] = {"file_name": document["file_name"], "success": False, "status": "error", "message": str(e)}
+
+    new_documents = [documents[position] for position in new_positions]
+    for position, document, result in zip(new_positions, new_documents, upload_documents(api_key, base_url, kb_id, new_documents, prompt=prompt, dedup=False)):
+        if result["success"]:
+            state.set(document["file_name"], document["content"])
+        results[position] = result
+    return results
+
+
+def prune_sources(api_key: str, base_url: str, kb_id: str, prefix: str, keep_names):
+    """
+    replace 模式下删除以 prefix 开头、但不在 keep_names 中的已同步数据 (例如报告分块数减少后多出的旧分块)。
+
+    Returns:
+        int: 删除的数据条数。
+    """
+    client, _ = _get_client_or_error(api_key, base_url, kb_id)
+    if not client:
+        return 0
+    state = client.sync_state
+    keep_names = set(keep_names)
+    deleted = 0
+    for source_name in state.source_names():
+        if not source_name.startswith(prefix) or source_name in keep_names:
+            continue
+        try:
+            data_id = _resolve_data_id(client, state, source_name)
+            if data_id:
+                client.delete_data(data_id)
+                deleted += 1
+            else:
+                logger.warning(f"未找到过期来源 {source_name} 对应的FastGPT数据，仅移除本地记录")
+            state.remove(source_name)
+        except FastGPTAPIError as e:
+            logger.error(f"删除FastGPT过期数据失败: 来源={source_name}, 原因={e}")
+    if deleted:
+        logger.info(f"已删除 {deleted} 条以 {prefix} 开头的过期FastGPT数据")
+    return deleted
+
+
+def update_fastgpt_kb_with_content(
+    api_key: str,
+    base_url: str,
+    kb_id: str,
+    file_name: str, # 用于FastGPT记录的文件名，不一定是实际本地文件名
+    content: str,
+    mode: str = UpdateMode.INDEX.value, # 默认为索引模式
+    prompt: str = "", # 可选，某些模式下可能用到
+    metadata: dict = None, # 可选，元数据
+    skip_unchanged: bool = None # 可选，跳过内容已上传过的文档，默认读取 FASTGPT_UPLOAD_DEDUP
+):
+    """
+    使用提供的内容更新FastGPT知识库。
+
+    Args:
+        api_key (str): FastGPT API密钥。
+        base_url (str): FastGPT实例的基础URL (例如: https://fastgpt.yourdomain.com)。
+        kb_id (str): 要更新的知识库ID。
+        file_name (str): 在FastGPT中显示的文件名。
+        content (str): 要推送到知识库的文本内容。
+        mode (str): 更新模式 ('index', 'chunk', 'custom')。
+        prompt (str, optional): 提示信息，某些模式下使用。默认为 ""。
+        metadata (dict, optional): 附加的元数据。默认为 None。
+        skip_unchanged (bool, optional): 内容与已上传版本相同时跳过推送 (视为成功)。
+
+    Returns:
+        bool: 更新是否成功。
+    """
+    if not all([api_key, base_url, kb_id, file_name, content]):
+        logger.error("FastGPT更新参数不完整。")
         return False
-    except Exception as e:
-        logger.error(f"更新FastGPT知识库时发生未知错误: {str(e)}", exc_info=True)
+
+    logger.info(f"向FastGPT推送数据: Dataset_ID={kb_id}, 文件名={file_name}, 模式={mode}")
+    logger.debug(f"FastGPT请求体 (部分内容): {{datasetId: '{kb_id}', data: [{{q: '{content[:100]}...'}}], mode: '{mode}'}}") # Corrected log key
+
+    if get_sync_mode() == SYNC_MODE_REPLACE:
+        # replace 模式下 file_name 即来源键，已存在的数据原地更新
+        results = sync_documents(api_key, base_url, kb_id, [{"file_name": file_name, "content": content}], prompt=prompt)
+        return bool(results) and results[0]["success"]
+
+    client, _ = _get_client_or_error(api_key, base_url, kb_id)
+    if not client:
         return False
+    return client.push_one(file_name, content, prompt=prompt, dedup=skip_unchanged)["success"]
 
 if __name__ == '__main__':
     # 测试代码 (需要配置相关的环境变量)
@@ -0,0 +1,195 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_TARGET_CHARS = 4000 # 每个知识库分块的目标字符数
+
+_HEADING_RE = re.compile(r'^(#{1,6})\s+\S')
+
+
+def get_chunk_target_chars():
+    """分块目标字符数，可通过环境变量 FASTGPT_CHUNK_TARGET_CHARS 覆盖。"""
+    try:
+        value = int(os.getenv("FASTGPT_CHUNK_TARGET_CHARS", DEFAULT_CHUNK_TARGET_CHARS))
+    except ValueError:
+        logger.warning(f"FASTGPT_CHUNK_TARGET_CHARS环境变量值无效，将使用默认值: {DEFAULT_CHUNK_TARGET_CHARS}")
+        return DEFAULT_CHUNK_TARGET_CHARS
+    return max(200, value)
+
+
+def _split_sections(markdown):
+    """
+    按标题把 Markdown 拆成段落，每段记录完整的标题路径 (上级标题 + 本级标题)。
+
+    Returns:
+        list: [(heading_path, body_lines)]，heading_path 为标题行列表，第一段可能没有标题。
+    """
+    sections = []
+    path = []
+    body = []
+    for line in markdown.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            if path or any(l.strip() for l in body):
+                sections.append((list(path), body))
+            level = len(match.group(1))
+            path = [h for h in path if len(_HEADING_RE.match(h).group(1)) < level] + [line.strip()]
+            body = []
+        else:
+            body.append(line)
+    if path or any(l.strip() for l in body):
+        sections.append((list(path), body))
+    return sections
+
+
+def _split_blocks(body_lines):
+    """把段落正文拆成块：连续的表格行为一个块，其余按空行分隔。"""
+    blocks = []
+    current = []
+    in_table = False
+    for line in body_lines:
+        is_table_line = line.lstrip().startswith("|")
+        if current and (not line.strip() or is_table_line != in_table):
+            blocks.append(current)
+            current = []
+        if line.strip():
+            current.append(line)
+            in_table = is_table_line
+    if current:
+        blocks.append(current)
+    return ["\n".join(block) for block in blocks]
+
+
+def _split_table(block, max_chars):
+    """按行切分过大的表格，每一片都重复表头和分隔行。"""
+    lines = block.split("\n")
+    if len(lines) < 3:
+        return [block]
+    header = "\n".join(lines[:2])
+    pieces = []
+    rows = []
+    size = len(header)
+    for row in lines[2:]:
+        if rows and size + len(row) + 1 > max_chars:
+            pieces.append("\n".join([header] + rows))
+            rows = []
+            size = len(header)
+        rows.append(row)
+        size += len(row) + 1
+    if rows:
+        pieces.append("\n".join([header] + rows))
+    return pieces
+
+
+def _split_text(block, max_chars):
+    """按行切分过长的普通文本块，单行超长时按字符截断。"""
+    pieces = []
+    current = ""
+    for line in block.split("\n"):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _common_prefix_len(path, other):
+    """两个标题路径从根开始相同的层数。"""
+    length = 0
+    for heading, other_heading in zip(path, other):
+        if heading != other_heading:
+            break
+        length += 1
+    return length
+
+
+def chunk_markdown(markdown, target_chars=None):
+    """
+    把 Markdown 报告切成大小均匀的知识库分块。
+
+    - 相邻的小段落合并到同一分块，直到接近 target_chars；
+    - 超过目标大小的表格按行切分，每片重复表头；
+    - 每个分块以所属段落的标题路径开头，切分后的续块同样带上标题，保证上下文完整。
+
+    Args:
+        markdown (str): Markdown 文本。
+        target_chars (int, optional): 目标字符数，默认读取 FASTGPT_CHUNK_TARGET_CHARS。
+
+    Returns:
+        list: 分块文本列表。
+    """
+    target_chars = target_chars or get_chunk_target_chars()
+    chunks = []
+    current = []
+    current_size = 0
+    current_path = [] # 当前分块最后写入的标题路径
+
+    def flush():
+        nonlocal current, current_size
+        if current:
+            chunks.append("\n\n".join(current))
+        current = []
+        current_size = 0
+        current_path.clear()
+
+    def add(part, path):
+        nonlocal current_size
+        current.append(part)
+        current_size += len(part) + 2
+        current_path[:] = path
+
+    for path, body_lines in _split_sections(markdown):
+        blocks = _split_blocks(body_lines)
+        section_text = "\n\n".join(path[-1:] + blocks)
+        if not section_text:
+            continue
+        context = path[:-1]
+
+        # 整段放得下：拼到当前分块，上级标题只补上与上一段路径不同的部分
+        if current:
+            whole = "\n\n".join(context[_common_prefix_len(current_path, context):] + [section_text])
+            if current_size + len(whole) <= target_chars:
+                add(whole, path)
+                continue
+        full_section = "\n\n".join(context + [section_text])
+        if len(full_section) <= target_chars:
+            flush()
+            add(full_section, path)
+            continue
+
+        # 段落本身过大：逐块填充，每个新分块以完整的标题路径开头
+        heading_text = "\n".join(path)
+        body_limit = max(1, target_chars - len(heading_text) - 2)
+        pieces = []
+        for block in blocks:
+            if len(block) <= body_limit:
+                pieces.append(block)
+            elif block.lstrip().startswith("|"):
+                pieces.extend(_split_table(block, body_limit))
+            else:
+                pieces.extend(_split_text(block, body_limit))
+        if current:
+            missing_headings = "\n".join(path[_common_prefix_len(current_path, context):])
+            if pieces and current_size + len(missing_headings) + len(pieces[0]) + 4 <= target_chars:
+                if missing_headings:
+                    add(missing_headings, path)
+            else:
+                flush()
+        for piece in pieces:
+            if current and current_size + len(piece) + 2 > target_chars:
+                flush()
+            if not current and heading_text:
+                add(heading_text, path)
+            add(piece, path)
+    flush()
+    return chunks
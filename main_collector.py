@@ -5,13 +5,16 @@ from dotenv import load_dotenv
 from collections import defaultdict
 import json # Para posible depuración de datos complejos
 import time
-import re
+import threading
+import sqlite3
+import requests
 
-from connectors.woo_data import get_woo_orders_raw_data
+from connectors.woo_data import iter_woo_orders, WooAPIError, WooOrder, WOO_ORDER_FIELDS
 from connectors.ga4_data import get_ga4_summary
 from connectors.gsc_data import get_gsc_summary
-from fastgpt_updater import update_fastgpt_kb_with_content
-# import mysql.connector # 已注释
+from fastgpt_updater import get_push_batch_limits, get_sync_mode, SYNC_MODE_REPLACE
+from fastgpt_outbox import FastGPTOutbox
+from kb_chunker import chunk_markdown
 
 # 配置日志
 logging.basicConfig(
@@ -25,45 +28,8 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# def insert_ga4_traffic_channels(channel_data_list, report_date): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def insert_ga4_page_metrics(page_data_list, report_date): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def insert_ga4_session_depth(session_data_list, report_date): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def insert_ga4_visit_depth(visit_data, report_date): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def insert_ga4_device_metrics(device_data_list, report_date): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def clean_ga4_channels(raw_ga4_data): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def clean_ga4_pages(raw_ga4_data): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def clean_ga4_sessions(raw_ga4_data): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def clean_ga4_visit_depth(raw_ga4_data): # 已注释
-#     # ... (整个函数体)
-#     pass
-
-# def clean_ga4_devices(raw_ga4_data): # 已注释
-#     # ... (整个函数体)
-#     pass
+DEFAULT_OUTBOX_DRAIN_SECONDS = 0 # 采集结束后投递发件箱的默认时间预算 (秒)，默认不投递，由独立的 drain 进程推送
+SUMMARY_SOURCE_PREFIX = "main_summary_" # 主报告汇总分块在FastGPT中的来源名前缀
 
 COMMON_UTM_KEYS = [
     'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
@@ -107,76 +73,340 @@ def extract_utm_from_meta(meta_data_list):
             cleaned_utm[plain_key] = value
     return cleaned_utm
 
-def process_and_format_woo_data_to_markdown(raw_orders_list, start_date_dt, end_date_dt):
-    if not raw_orders_list:
-        logger.info("没有收到WooCommerce订单进行处理.")
-        return {"details_md": "### WooCommerce 订单详情 (警告)\n- 未收到任何订单数据。"}
-
-    all_processed_orders_for_detail_md = []
-    for order in raw_orders_list:
-        if not isinstance(order, dict):
-            logger.warning(f"在raw_orders_list中发现非字典项: {order}")
-            continue
-        
-        billing_info = order.get('billing', {})
-        customer_country = billing_info.get('country', '未知')
-        utm_params = extract_utm_from_meta(order.get('meta_data', []))
+def process_woo_order(order):
+    """提取单个订单 (WooOrder 记录或原始字典) 中报告需要的字段 (含UTM参数)。"""
+    if isinstance(order, dict):
+        order = WooOrder.from_api(order)
+    customer_country = '未知' if order.billing_country is None else order.billing_country
+    utm_params = extract_utm_from_meta(list(order.meta_data))
+    
+    return {
+        'id': order.id,
+        'date_created': order.date_created_gmt,
+        'status': order.status,
+        'total': order.total,
+        'currency': order.currency,
+        'customer_email': order.billing_email,
+        'customer_country': customer_country,
+        'payment_method': order.payment_method_title,
+        'line_items': [{'name': li.name, 'sku': li.sku, 'quantity': li.quantity, 'total': li.total} for li in order.line_items],
+        'utm_params': utm_params
+    }
+
+def format_processed_order_detail_md(p_order):
+    """生成单个订单在详细报告中的Markdown段落。"""
+    details_md_parts = [f"\n---\n**订单ID**: {p_order['id']}"]
+    details_md_parts.append(f"- **日期**: {p_order['date_created']}")
+    details_md_parts.append(f"- **状态**: {p_order['status']}")
+    details_md_parts.append(f"- **订单总额**: {p_order['total']} {p_order['currency']}")
+    details_md_parts.append(f"- **客户邮箱**: {p_order['customer_email']}")
+    details_md_parts.append(f"- **客户国家**: {p_order['customer_country']}")
+    details_md_parts.append(f"- **支付方式**: {p_order['payment_method']}")
+    
+    details_md_parts.append("  **订单商品:**")
+    if p_order['line_items']:
+        for item in p_order['line_items']:
+            details_md_parts.append(f"    - {item['name']} (SKU: {item['sku']}) - 数量: {item['quantity']}, 总计: {item['total']}")
+    else:
+        details_md_parts.append("    - 无商品信息.")
         
-        processed_order_info = {
-            'id': order.get('id'),
-            'date_created': order.get('date_created_gmt'),
-            'status': order.get('status'),
-            'total': order.get('total'),
-            'currency': order.get('currency'),
-            'customer_email': billing_info.get('email'),
-            'customer_country': customer_country,
-            'payment_method': order.get('payment_method_title'),
-            'line_items': [{'name': li.get('name'), 'sku': li.get('sku'), 'quantity': li.get('quantity'), 'total': li.get('total')} for li in order.get('line_items', [])],
-            'utm_params': utm_params
-        }
-        all_processed_orders_for_detail_md.append(processed_order_info)
-
-    details_md_parts = [f"### WooCommerce 订单详情 ({start_date_dt.strftime('%Y-%m-%d')} 到 {end_date_dt.strftime('%Y-%m-%d')})\n"]
-    if not all_processed_orders_for_detail_md:
-        details_md_parts.append("- 在此期间没有需要报告的订单详情.")
+    details_md_parts.append("  **UTM参数:**")
+    if p_order['utm_params']:
+        for key, value in p_order['utm_params'].items():
+            details_md_parts.append(f"    - {key}: {value}")
     else:
-        for p_order in all_processed_orders_for_detail_md:
-            details_md_parts.append(f"\n---\n**订单ID**: {p_order['id']}")
-            details_md_parts.append(f"- **日期**: {p_order['date_created']}")
-            details_md_parts.append(f"- **状态**: {p_order['status']}")
-            details_md_parts.append(f"- **订单总额**: {p_order['total']} {p_order['currency']}")
-            details_md_parts.append(f"- **客户邮箱**: {p_order['customer_email']}")
-            details_md_parts.append(f"- **客户国家**: {p_order['customer_country']}")
-            details_md_parts.append(f"- **支付方式**: {p_order['payment_method']}")
-            
-            details_md_parts.append("  **订单商品:**")
-            if p_order['line_items']:
-                for item in p_order['line_items']:
-                    details_md_parts.append(f"    - {item['name']} (SKU: {item['sku']}) - 数量: {item['quantity']}, 总计: {item['total']}")
-            else:
-                details_md_parts.append("    - 无商品信息.")
-                
-            details_md_parts.append("  **UTM参数:**")
-            if p_order['utm_params']:
-                for key, value in p_order['utm_params'].items():
-                    details_md_parts.append(f"    - {key}: {value}")
-            else:
-                details_md_parts.append("    - 未找到UTM参数.")
-            
-    details_md = "\n".join(details_md_parts)
-    
-    # 生成主报告的摘要部分
+        details_md_parts.append("    - 未找到UTM参数.")
+    return "\n".join(details_md_parts)
+
+def _or_na(value):
+    return 'N/A' if value is None else value
+
+def format_woo_order_push_md(order):
+    """生成推送到FastGPT的单条订单Markdown内容 (接受 WooOrder 记录或原始字典)。"""
+    if isinstance(order, dict):
+        order = WooOrder.from_api(order)
+    items_info = []
+    for item in order.line_items:
+        items_info.append(f"{_or_na(item.name)} (SKU: {_or_na(item.sku)})")
+    items_str = "<br>".join(items_info)
+    customer_info = []
+    if any(v is not None for v in (order.billing_first_name, order.billing_last_name, order.billing_email)):
+        customer_info.append(f"{order.billing_first_name or ''} {order.billing_last_name or ''}")
+        if order.billing_email:
+            customer_info.append(order.billing_email)
+    customer_str = "<br>".join(customer_info) if customer_info else "N/A"
+    notes = []
+    for note in order.meta_data:
+        if note.get('key') == '_order_comments':
+            notes.append(note.get('value', ''))
+    notes_str = "<br>".join(notes) if notes else "N/A"
+    return (
+        f"### WooCommerce 订单\n"
+        f"- 订单ID: {_or_na(order.id)}\n"
+        f"- 日期: {_or_na(order.date_created)}\n"
+        f"- 状态: {_or_na(order.status)}\n"
+        f"- 客户: {customer_str}\n"
+        f"- 商品: {items_str}\n"
+        f"- 数量: {sum(item.quantity or 0 for item in order.line_items)}\n"
+        f"- 总金额: {_or_na(order.total)}\n"
+        f"- 币种: {_or_na(order.currency)}\n"
+        f"- 支付方式: {_or_na(order.payment_method_title)}\n"
+        f"- 备注: {notes_str}\n"
+    )
+
+def format_woo_details_header_md(start_date_dt, end_date_dt):
+    return f"### WooCommerce 订单详情 ({start_date_dt.strftime('%Y-%m-%d')} 到 {end_date_dt.strftime('%Y-%m-%d')})\n"
+
+def format_woo_summary_md(order_count, usd_total_amount):
+    """生成主报告中的WooCommerce摘要部分。"""
     summary_md_for_main_report = "### WooCommerce 数据\n"
-    if not all_processed_orders_for_detail_md:
+    if not order_count:
         summary_md_for_main_report += "- 未处理任何订单数据。\n"
     else:
-        summary_md_for_main_report += f"- 总订单数: {len(all_processed_orders_for_detail_md)}\n"
-        # 统计USD订单总额
-        usd_total_amount = sum(float(order['total']) for order in all_processed_orders_for_detail_md if order['currency'] == 'USD')
+        summary_md_for_main_report += f"- 总订单数: {order_count}\n"
         summary_md_for_main_report += f"- 总销售额(USD): {usd_total_amount:.2f} USD\n"
         summary_md_for_main_report += "- 详细订单数据已生成在单独的文件中。\n"
-        
-    return {"summary_md": summary_md_for_main_report, "details_md": details_md}
+    return summary_md_for_main_report
+
+def stream_woo_orders_to_markdown(orders, start_date_dt, end_date_dt, detail_file, on_order=None, stop_event=None):
+    """
+    流式处理订单: 每个订单的详情Markdown直接写入 detail_file，摘要只累计订单数和金额，
+    因此内存中只保留当前订单，与日期范围大小无关。
+
+    Args:
+        orders (iterable): WooOrder 记录或原始订单字典的可迭代对象 (例如 iter_woo_orders 的返回值)。
+        start_date_dt (datetime): 开始日期
+        end_date_dt (datetime): 结束日期
+        detail_file: 以文本模式打开的详细报告文件。
+        on_order (callable, optional): 每个订单处理后调用 on_order(order)，用于逐单推送。
+        stop_event (threading.Event, optional): 被设置时 (例如数据源超时) 停止消费订单流。
+
+    Returns:
+        dict: {"order_count": 订单数, "summary_md": 主报告摘要Markdown}
+    """
+    detail_file.write(format_woo_details_header_md(start_date_dt, end_date_dt))
+    order_count = 0
+    usd_total_amount = 0.0
+    for order in orders:
+        if stop_event is not None and stop_event.is_set():
+            logger.warning(f"WooCommerce订单流被中止，已处理 {order_count} 条订单。")
+            break
+        if not isinstance(order, (WooOrder, dict)):
+            logger.warning(f"在订单流中发现无法识别的订单项: {order}")
+            continue
+        p_order = process_woo_order(order)
+        detail_file.write("\n" + format_processed_order_detail_md(p_order))
+        order_count += 1
+        if p_order['currency'] == 'USD':
+            usd_total_amount += float(p_order['total'])
+        if on_order:
+            on_order(order)
+
+    if not order_count:
+        detail_file.write("\n- 在此期间没有需要报告的订单详情.")
+    return {"order_count": order_count, "summary_md": format_woo_summary_md(order_count, usd_total_amount)}
+
+def ensure_export_dir(export_dir):
+    """确保导出目录存在，返回目录是否可用。"""
+    if not os.path.exists(export_dir):
+        try:
+            os.makedirs(export_dir)
+            logger.info(f"创建目录: {export_dir}")
+        except OSError as e:
+            logger.error(f"创建目录 {export_dir} 失败: {e}")
+    return os.path.exists(export_dir)
+
+def _tee_orders_to_db(raw_orders, db_writer):
+    """把原始订单交给入库写入器，再以 WooOrder 记录交给报告流程。"""
+    for order in raw_orders:
+        db_writer.add(order)
+        yield WooOrder.from_api(order)
+
+def collect_woo_section(start_date_dt, end_date_dt, export_dir, report_generation_time_str, on_order=None, stop_event=None):
+    """
+    WooCommerce数据源 (流式处理: 边获取边写详细报告并逐单回调)，返回主报告中的Markdown段落。
+
+    WOO_DB_SYNC 开启时同一个订单流同时写入 MySQL 订单表 (入库需要完整订单，因此不使用 _fields 投影)，
+    入库与报告共用该数据源的超时。
+    """
+    logger.info(f"获取WooCommerce数据 (从 {start_date_dt.strftime('%Y-%m-%d')} 到 {end_date_dt.strftime('%Y-%m-%d')})...")
+    if not ensure_export_dir(export_dir):
+        logger.error("El directorio de exportación no existe y no pudo ser creado. No se guardará ni subirá el informe detallado de WooCommerce.")
+        return "### WooCommerce 数据 (警告)\n- 未能获取原始订单数据。"
+
+    woo_detail_filename = f"woo_orders_detail_{report_generation_time_str}.md"
+    woo_detail_filepath = os.path.join(export_dir, woo_detail_filename)
+    woo_result = None
+    db_writer = None
+    if os.getenv("WOO_DB_SYNC", "false").lower() in ("1", "true", "yes"):
+        # 仅在开启时导入，未安装 mysql-connector-python 时不影响报告生成
+        from mysql_loader import WooOrderWriter
+        db_writer = WooOrderWriter()
+    try:
+        with open(woo_detail_filepath, "w", encoding="utf-8") as detail_file:
+            logger.info("开始流式处理WooCommerce订单...")
+            if db_writer is not None:
+                orders = _tee_orders_to_db(iter_woo_orders(start_date_dt, end_date_dt), db_writer)
+            else:
+                orders = iter_woo_orders(start_date_dt, end_date_dt, fields=WOO_ORDER_FIELDS, as_records=True)
+            woo_result = stream_woo_orders_to_markdown(
+                orders,
+                start_date_dt,
+                end_date_dt,
+                detail_file,
+                on_order=on_order,
+                stop_event=stop_event
+            )
+    except WooAPIError as api_e:
+        logger.error(f"WooCommerce API请求失败: {api_e}")
+    except requests.exceptions.RequestException as req_e:
+        logger.error(f"WooCommerce API网络请求时发生异常: {str(req_e)}")
+    except IOError as e:
+        logger.error(f"Error al guardar o procesar el informe detallado de WooCommerce: {e}")
+    finally:
+        if db_writer is not None:
+            db_writer.close()
+
+    if woo_result and woo_result["order_count"]:
+        logger.info(f"WooCommerce数据处理完成，共 {woo_result['order_count']} 条订单。详细报告已保存到: {woo_detail_filepath}")
+        return woo_result["summary_md"]
+    logger.warning("未能获取WooCommerce原始订单数据或返回空列表。")
+    return "### WooCommerce 数据 (警告)\n- 未能获取原始订单数据。"
+
+def collect_ga4_section(start_date_dt, end_date_dt):
+    """GA4数据源，返回主报告中的Markdown段落。"""
+    logger.info(f"获取GA4数据 (从 {start_date_dt.strftime('%Y-%m-%d')} 到 {end_date_dt.strftime('%Y-%m-%d')})...")
+    ga4_summary_md = get_ga4_summary(start_date_dt, end_date_dt)
+    if ga4_summary_md and "(错误)" not in ga4_summary_md and "(警告)" not in ga4_summary_md:
+        logger.info("GA4 Markdown摘要获取完成。")
+        return ga4_summary_md
+    elif ga4_summary_md: # Incluir si es mensaje de error/advertencia
+        logger.warning(f"获取GA4数据时返回警告或错误: {ga4_summary_md}")
+        return ga4_summary_md
+    logger.warning("GA4数据获取返回空。")
+    return "### GA4 数据 (警告)\n- 未返回任何数据。"
+
+def compute_gsc_date_range(end_date_dt, data_collection_days):
+    """GSC数据有约2天延迟，日期范围整体向前平移。"""
+    gsc_end_date_dt = end_date_dt - timedelta(days=2) 
+    gsc_start_date_dt = gsc_end_date_dt - timedelta(days=data_collection_days) # Asegurar la misma duración que otros conectores, pero desfasado
+    # Corregir si el rango es inválido debido al desfase
+    if gsc_start_date_dt > gsc_end_date_dt:
+        gsc_start_date_dt = gsc_end_date_dt - timedelta(days=max(0, data_collection_days-2)) # Evitar duración negativa
+        if gsc_start_date_dt > gsc_end_date_dt: # Si aún es problemático, ajustar a un solo día
+             gsc_start_date_dt = gsc_end_date_dt
+    return gsc_start_date_dt, gsc_end_date_dt
+
+def collect_gsc_section(end_date_dt, data_collection_days):
+    """GSC数据源，返回主报告中的Markdown段落。"""
+    logger.info(f"获取GSC数据...")
+    gsc_start_date_dt, gsc_end_date_dt = compute_gsc_date_range(end_date_dt, data_collection_days)
+    logger.info(f"Ajustando rango de fechas para GSC: {gsc_start_date_dt.strftime('%Y-%m-%d')} a {gsc_end_date_dt.strftime('%Y-%m-%d')}")
+    gsc_summary_md = get_gsc_summary(gsc_start_date_dt, gsc_end_date_dt)
+    if gsc_summary_md and "(错误)" not in gsc_summary_md and "(警告)" not in gsc_summary_md:
+        logger.info("GSC Markdown摘要获取完成。")
+        return gsc_summary_md
+    elif gsc_summary_md:
+        logger.warning(f"获取GSC数据时返回警告或错误: {gsc_summary_md}")
+        return gsc_summary_md
+    logger.warning("GSC数据获取返回空。")
+    return "### GSC 数据 (警告)\n- 未返回任何数据。"
+
+def get_source_timeout(env_prefix):
+    """
+    读取数据源的超时时间 (秒)：优先 {env_prefix}_SOURCE_TIMEOUT_SECONDS，其次 SOURCE_TIMEOUT_SECONDS。
+    未配置或不大于0时返回 None，表示不设截止时间。
+    """
+    raw_value = os.getenv(f"{env_prefix}_SOURCE_TIMEOUT_SECONDS") or os.getenv("SOURCE_TIMEOUT_SECONDS")
+    if not raw_value:
+        return None
+    try:
+        timeout = float(raw_value)
+    except ValueError:
+        logger.warning(f"{env_prefix}数据源超时配置无效: {raw_value}，将不设置超时。")
+        return None
+    return timeout if timeout > 0 else None
+
+def _start_source_thread(source):
+    """在守护线程中运行数据源；超时的线程不会阻止进程退出。"""
+    result = {}
+
+    def run_source():
+        try:
+            result["md"] = source["func"]()
+        except Exception as e:
+            logger.error(f"{source['name']} 数据源执行时发生未知异常: {e}", exc_info=True)
+            result["md"] = f"### {source['name']} 数据 (错误)\n- 获取数据失败: {e}\n"
+
+    thread = threading.Thread(target=run_source, name=f"source-{source['name']}", daemon=True)
+    thread.start()
+    return thread, result
+
+def _wait_source(source, thread, result, started_at):
+    timeout = source.get("timeout")
+    remaining = None if timeout is None else max(0.0, started_at + timeout - time.monotonic())
+    thread.join(remaining)
+    if thread.is_alive():
+        logger.error(f"{source['name']} 数据源超过 {timeout:g} 秒未完成，本次报告将跳过该数据源。")
+        if source.get("stop_event") is not None:
+            source["stop_event"].set()
+        return f"### {source['name']} 数据 (警告)\n- 数据获取超时 (超过 {timeout:g} 秒)，本次报告未包含该数据源。"
+    return result.get("md")
+
+def run_data_sources(sources, concurrent=False):
+    """
+    运行各数据源并按 sources 的顺序返回它们的Markdown段落。
+
+    Args:
+        sources (list): 每项为 dict，包含 name (报告中的数据源名)、func (无参可调用对象，返回Markdown)、
+            timeout (秒，None 表示不限)，以及可选的 stop_event (超时时被设置，通知数据源尽快停止)。
+        concurrent (bool): 为 True 时所有数据源同时开始，总耗时约等于最慢的数据源；
+            否则依次运行。两种模式下超时的数据源都会以 "(警告)" 段落代替。
+    """
+    if concurrent:
+        started_at = time.monotonic()
+        running = [(source, *_start_source_thread(source)) for source in sources]
+        return [_wait_source(source, thread, result, started_at) for source, thread, result in running]
+
+    sections = []
+    for source in sources:
+        started_at = time.monotonic()
+        thread, result = _start_source_thread(source)
+        sections.append(_wait_source(source, thread, result, started_at))
+    return sections
+
+def run_ga4_db_ingest(start_date_dt, end_date_dt):
+    """
+    GA4_DB_INGEST 开启时按天写入 ga4_* 数据表。作为报告生成之后的独立阶段运行，
+    不占用 GA4 数据源的超时时间；超时由 GA4_DB_INGEST_SOURCE_TIMEOUT_SECONDS (或 SOURCE_TIMEOUT_SECONDS) 控制。
+    """
+    if os.getenv("GA4_DB_INGEST", "false").lower() not in ("1", "true", "yes"):
+        return
+
+    def ingest():
+        # 仅在开启时导入，未安装 mysql-connector-python 时不影响报告生成
+        from mysql_loader import ingest_ga4_to_mysql
+        ingest_ga4_to_mysql(start_date_dt, end_date_dt)
+
+    run_data_sources([{"name": "GA4入库", "func": ingest, "timeout": get_source_timeout("GA4_DB_INGEST")}])
+
+def enqueue_documents(outbox, documents, label):
+    """把文档写入 FastGPT 发件箱，由发件箱负责推送和失败重试。返回新写入的文档数。"""
+    try:
+        added = outbox.enqueue(documents)
+    except sqlite3.Error as e:
+        logger.error(f"{label}写入FastGPT发件箱失败: {e}")
+        return 0
+    logger.info(f"{label}已写入FastGPT发件箱: 新增 {added}/{len(documents)}")
+    return added
+
+def get_outbox_drain_budget():
+    """采集结束后投递发件箱的时间预算 (秒)，FASTGPT_OUTBOX_DRAIN_SECONDS=0 表示只写入发件箱，交给独立的 drain 进程推送。"""
+    try:
+        return max(0.0, float(os.getenv("FASTGPT_OUTBOX_DRAIN_SECONDS", DEFAULT_OUTBOX_DRAIN_SECONDS)))
+    except ValueError:
+        logger.warning(f"FASTGPT_OUTBOX_DRAIN_SECONDS环境变量值无效，将使用默认值: {DEFAULT_OUTBOX_DRAIN_SECONDS}")
+        return float(DEFAULT_OUTBOX_DRAIN_SECONDS)
 
 def main():
     logger.info("开始数据收集和 Markdown 报告生成...")
@@ -217,66 +447,54 @@ def main():
     report_generation_time_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     current_date_for_report_title = end_date_dt.strftime("%Y-%m-%d") # 通常报告是关于截止到某天的数据
 
-    all_markdown_for_main_report = [] # Cambiado de all_markdown_summaries
-    woo_detailed_report_md = ""
-
-    # 1. WooCommerce 数据
-    logger.info(f"获取WooCommerce数据 (从 {start_date_dt.strftime('%Y-%m-%d')} 到 {end_date_dt.strftime('%Y-%m-%d')})...")
-    raw_woo_orders = get_woo_orders_raw_data(start_date_dt, end_date_dt)
-    
-    all_processed_orders_for_detail_md = []  # 初始化变量
-    
-    if raw_woo_orders:
-        logger.info(f"成功获取 {len(raw_woo_orders)} 条原始WooCommerce订单。开始处理和格式化...")
-        woo_processed_data = process_and_format_woo_data_to_markdown(raw_woo_orders, start_date_dt, end_date_dt)
-        # woo_summary_for_main_report contendrá una nota sobre el archivo de detalles o una advertencia.
-        woo_summary_for_main_report = woo_processed_data.get("summary_md", "") 
-        woo_detailed_report_md = woo_processed_data.get("details_md", "") 
-        
-        # 保存处理后的订单数据
-        all_processed_orders_for_detail_md = raw_woo_orders
-        
-        if woo_summary_for_main_report: # Siempre agregar la nota o advertencia de Woo al reporte principal
-            all_markdown_for_main_report.append(woo_summary_for_main_report)
-        logger.info("WooCommerce数据处理完成。详细报告已生成。")
-    else:
-        logger.warning("未能获取WooCommerce原始订单数据或返回空列表。")
-        all_markdown_for_main_report.append("### WooCommerce 数据 (警告)\n- 未能获取原始订单数据。")
-
-    # 2. GA4 数据
-    logger.info(f"获取GA4数据 (从 {start_date_dt.strftime('%Y-%m-%d')} 到 {end_date_dt.strftime('%Y-%m-%d')})...")
-    ga4_summary_md = get_ga4_summary(start_date_dt, end_date_dt)
-    if ga4_summary_md and "(错误)" not in ga4_summary_md and "(警告)" not in ga4_summary_md:
-        all_markdown_for_main_report.append(ga4_summary_md)
-        logger.info("GA4 Markdown摘要获取完成。")
-    elif ga4_summary_md: # Incluir si es mensaje de error/advertencia
-        all_markdown_for_main_report.append(ga4_summary_md)
-        logger.warning(f"获取GA4数据时返回警告或错误: {ga4_summary_md}")
-    else:
-        logger.warning("GA4数据获取返回空。")
-        all_markdown_for_main_report.append("### GA4 数据 (警告)\n- 未返回任何数据。")
-
-    # 3. GSC 数据
-    logger.info(f"获取GSC数据...")
-    gsc_end_date_dt = end_date_dt - timedelta(days=2) 
-    gsc_start_date_dt = gsc_end_date_dt - timedelta(days=data_collection_days) # Asegurar la misma duración que otros conectores, pero desfasado
-    # Corregir si el rango es inválido debido al desfase
-    if gsc_start_date_dt > gsc_end_date_dt:
-        gsc_start_date_dt = gsc_end_date_dt - timedelta(days=max(0, data_collection_days-2)) # Evitar duración negativa
-        if gsc_start_date_dt > gsc_end_date_dt: # Si aún es problemático, ajustar a un solo día
-             gsc_start_date_dt = gsc_end_date_dt
-
-    logger.info(f"Ajustando rango de fechas para GSC: {gsc_start_date_dt.strftime('%Y-%m-%d')} a {gsc_end_date_dt.strftime('%Y-%m-%d')}")
-    gsc_summary_md = get_gsc_summary(gsc_start_date_dt, gsc_end_date_dt)
-    if gsc_summary_md and "(错误)" not in gsc_summary_md and "(警告)" not in gsc_summary_md:
-        all_markdown_for_main_report.append(gsc_summary_md)
-        logger.info("GSC Markdown摘要获取完成。")
-    elif gsc_summary_md:
-        all_markdown_for_main_report.append(gsc_summary_md)
-        logger.warning(f"获取GSC数据时返回警告或错误: {gsc_summary_md}")
-    else:
-        logger.warning("GSC数据获取返回空。")
-        all_markdown_for_main_report.append("### GSC 数据 (警告)\n- 未返回任何数据。")
+    export_dir = "data_exports"
+
+    # 采集阶段只写入本地发件箱，推送由发件箱在采集结束后 (或独立的 drain 进程) 完成，
+    # FastGPT 变慢或不可用不会拖慢采集
+    outbox = FastGPTOutbox()
+    push_batch_size, _ = get_push_batch_limits()
+    woo_push_buffer = []
+    woo_push_lock = threading.Lock()
+
+    def flush_woo_orders():
+        with woo_push_lock:
+            documents = woo_push_buffer[:]
+            del woo_push_buffer[:]
+        if documents:
+            enqueue_documents(outbox, documents, "订单")
+
+    def push_woo_order(order):
+        order_md = format_woo_order_push_md(order)
+        logger.info(f"缓冲订单ID {order.id} 内容预览: {order_md[:200]} ...")
+        with woo_push_lock:
+            woo_push_buffer.append({"file_name": f"woo_order_{order.id}.md", "content": order_md})
+            batch_full = len(woo_push_buffer) >= push_batch_size
+        if batch_full:
+            flush_woo_orders()
+
+    woo_stop_event = threading.Event()
+    sources = [
+        {
+            "name": "WooCommerce",
+            "func": lambda: collect_woo_section(start_date_dt, end_date_dt, export_dir, report_generation_time_str, on_order=push_woo_order, stop_event=woo_stop_event),
+            "timeout": get_source_timeout("WOO"),
+            "stop_event": woo_stop_event,
+        },
+        {
+            "name": "GA4",
+            "func": lambda: collect_ga4_section(start_date_dt, end_date_dt),
+            "timeout": get_source_timeout("GA4"),
+        },
+        {
+            "name": "GSC",
+            "func": lambda: collect_gsc_section(end_date_dt, data_collection_days),
+            "timeout": get_source_timeout("GSC"),
+        },
+    ]
+    concurrent_sources = os.getenv("COLLECTOR_CONCURRENT_SOURCES", "false").lower() in ("1", "true", "yes")
+    logger.info(f"开始获取数据源 ({'并发' if concurrent_sources else '依次'}执行)...")
+    all_markdown_for_main_report = run_data_sources(sources, concurrent=concurrent_sources) # Cambiado de all_markdown_summaries
+    flush_woo_orders()
 
     if not all_markdown_for_main_report or all( ("(错误)" in text or "(警告)" in text) and "WooCommerce 数据" not in text for text in all_markdown_for_main_report ):
         # Si all_markdown_for_main_report está vacío O todos sus elementos son errores/advertencias (excluyendo la nota de Woo)
@@ -285,15 +503,7 @@ def main():
         final_markdown_report = f"# 综合数据报告 - {current_date_for_report_title}\n\n"
         final_markdown_report += "\n\n---\n\n".join(all_markdown_for_main_report)
 
-        export_dir = "data_exports"
-        if not os.path.exists(export_dir):
-            try:
-                os.makedirs(export_dir)
-                logger.info(f"创建目录: {export_dir}")
-            except OSError as e:
-                logger.error(f"创建目录 {export_dir} 失败: {e}")
-        
-        if os.path.exists(export_dir):
+        if ensure_export_dir(export_dir):
             report_filename_md = f"data_report_main_{report_generation_time_str}.md"
             report_filepath_md = os.path.join(export_dir, report_filename_md)
             try:
@@ -302,110 +512,43 @@ def main():
                 logger.info(f"Informe principal Markdown guardado en: {report_filepath_md}")
 
                 logger.info(f"Comenzando subida del informe principal {report_filename_md} a FastGPT KB {fastgpt_kb_id}...")
-                # 汇总数据只按###大标题分块推送到FastGPT
+                # 汇总数据按大小均匀的分块推送到FastGPT (小段落合并，大表格按行切分并重复表头)
                 if fastgpt_api_key and fastgpt_base_url and fastgpt_kb_id:
-                    logger.info(f"开始按###大标题分块推送主报告汇总数据到FastGPT KB {fastgpt_kb_id}...")
+                    logger.info(f"开始分块推送主报告汇总数据到FastGPT KB {fastgpt_kb_id}...")
+                    replace_mode = get_sync_mode() == SYNC_MODE_REPLACE
+                    summary_documents = []
                     for idx, summary_md in enumerate(all_markdown_for_main_report):
-                        # 只按###大标题分块
-                        blocks = re.split(r'(### .+)', summary_md)
-                        chunk_list = []
-                        i = 1
-                        while i < len(blocks):
-                            title = blocks[i].strip()
-                            content = blocks[i+1].strip() if (i+1)<len(blocks) else ''
-                            chunk = f"{title}\n{content}"
-                            chunk_list.append(chunk)
-                            i += 2
+                        chunk_list = chunk_markdown(summary_md)
                         for chunk_idx, chunk in enumerate(chunk_list):
-                            file_name = f"main_summary_part{idx+1}_section{chunk_idx+1}_{report_generation_time_str}.md"
-                            logger.info(f"推送主报告汇总 section{chunk_idx+1} 内容预览: {chunk[:200]} ...")
-                            success = update_fastgpt_kb_with_content(
-                                api_key=fastgpt_api_key,
-                                base_url=fastgpt_base_url,
-                                kb_id=fastgpt_kb_id,
-                                file_name=file_name,
-                                content=chunk
-                            )
-                            if success:
-                                logger.info(f"主报告汇总 section{chunk_idx+1} 推送成功")
+                            if replace_mode:
+                                # 来源键不含时间戳，每次运行更新同一条数据而不是追加新副本
+                                file_name = f"{SUMMARY_SOURCE_PREFIX}part{idx+1}_section{chunk_idx+1}.md"
                             else:
-                                logger.error(f"主报告汇总 section{chunk_idx+1} 推送失败")
-                            time.sleep(1)
-                    logger.info("主报告汇总数据按###大标题分块推送完成")
+                                file_name = f"{SUMMARY_SOURCE_PREFIX}part{idx+1}_section{chunk_idx+1}_{report_generation_time_str}.md"
+                            logger.info(f"推送主报告汇总 section{chunk_idx+1} 内容预览: {chunk[:200]} ...")
+                            summary_documents.append({"file_name": file_name, "content": chunk})
+                    enqueue_documents(outbox, summary_documents, "主报告汇总")
+                    if replace_mode:
+                        # 分块数减少时删除多出来的旧分块，由发件箱投递时执行
+                        try:
+                            outbox.enqueue_prune(SUMMARY_SOURCE_PREFIX, [doc["file_name"] for doc in summary_documents])
+                        except sqlite3.Error as e:
+                            logger.error(f"主报告过期分块的删除请求写入FastGPT发件箱失败: {e}")
 
             except IOError as e:
                 logger.error(f"Error al guardar o procesar el informe principal Markdown: {e}")
         else:
             logger.error("El directorio de exportación no existe y no pudo ser creado. No se guardará ni subirá el informe principal.")
 
-    # Guardar el informe detallado de WooCommerce si existe y contiene datos reales
-    if woo_detailed_report_md and "未收到任何订单数据" not in woo_detailed_report_md and "没有需要报告的订单详情" not in woo_detailed_report_md:
-        export_dir = "data_exports" # Asegurar que existe, aunque ya se haya verificado arriba
-        if not os.path.exists(export_dir):
-            try:
-                os.makedirs(export_dir)
-                logger.info(f"创建目录: {export_dir}") # Log creation
-            except OSError as e:
-                logger.error(f"创建目录 {export_dir} 失败: {e}") # Log error if creation fails
-        
-        if os.path.exists(export_dir):
-            woo_detail_filename = f"woo_orders_detail_{report_generation_time_str}.md"
-            woo_detail_filepath = os.path.join(export_dir, woo_detail_filename)
-            try:
-                # 分批推送WooCommerce详细数据到FastGPT（每条订单单独推送）
-                if fastgpt_api_key and fastgpt_base_url and fastgpt_kb_id:
-                    logger.info(f"开始分批推送WooCommerce详细订单数据到FastGPT KB {fastgpt_kb_id}...")
-                    for order in all_processed_orders_for_detail_md:
-                        # 生成单条订单的markdown内容
-                        items_info = []
-                        for item in order.get('line_items', []):
-                            items_info.append(f"{item.get('name', 'N/A')} (SKU: {item.get('sku', 'N/A')})")
-                        items_str = "<br>".join(items_info)
-                        customer_info = []
-                        if order.get('billing'):
-                            billing = order['billing']
-                            customer_info.append(f"{billing.get('first_name', '')} {billing.get('last_name', '')}")
-                            if billing.get('email'):
-                                customer_info.append(billing['email'])
-                        customer_str = "<br>".join(customer_info) if customer_info else "N/A"
-                        notes = []
-                        for note in order.get('meta_data', []):
-                            if note.get('key') == '_order_comments':
-                                notes.append(note.get('value', ''))
-                        notes_str = "<br>".join(notes) if notes else "N/A"
-                        order_md = (
-                            f"### WooCommerce 订单\n"
-                            f"- 订单ID: {order.get('id', 'N/A')}\n"
-                            f"- 日期: {order.get('date_created', 'N/A')}\n"
-                            f"- 状态: {order.get('status', 'N/A')}\n"
-                            f"- 客户: {customer_str}\n"
-                            f"- 商品: {items_str}\n"
-                            f"- 数量: {sum(item.get('quantity', 0) for item in order.get('line_items', []))}\n"
-                            f"- 总金额: {order.get('total', 'N/A')}\n"
-                            f"- 币种: {order.get('currency', 'N/A')}\n"
-                            f"- 支付方式: {order.get('payment_method_title', 'N/A')}\n"
-                            f"- 备注: {notes_str}\n"
-                        )
-                        file_name = f"woo_order_{order.get('id', 'N/A')}.md"
-                        logger.info(f"推送订单ID {order.get('id', 'N/A')} 内容预览: {order_md[:200]} ...")
-                        success = update_fastgpt_kb_with_content(
-                            api_key=fastgpt_api_key,
-                            base_url=fastgpt_base_url,
-                            kb_id=fastgpt_kb_id,
-                            file_name=file_name,
-                            content=order_md
-                        )
-                        if success:
-                            logger.info(f"订单ID {order.get('id', 'N/A')} 推送成功")
-                        else:
-                            logger.error(f"订单ID {order.get('id', 'N/A')} 推送失败")
-                        time.sleep(1)  # 避免接口限流
-                    logger.info("WooCommerce详细订单数据分批推送完成")
+    run_ga4_db_ingest(start_date_dt, end_date_dt)
 
-            except IOError as e:
-                logger.error(f"Error al guardar o procesar el informe detallado de WooCommerce: {e}")
-        else:
-             logger.error("El directorio de exportación no existe y no pudo ser creado. No se guardará ni subirá el informe detallado de WooCommerce.")
+    drain_budget = get_outbox_drain_budget()
+    if drain_budget > 0:
+        logger.info(f"开始投递FastGPT发件箱 (时间预算 {drain_budget:.0f} 秒)...")
+        outbox.drain(fastgpt_api_key, fastgpt_base_url, fastgpt_kb_id, time_budget=drain_budget)
+    outbox_stats = outbox.stats()
+    if outbox_stats["pending"] or outbox_stats["dead"]:
+        logger.warning(f"FastGPT发件箱有 {outbox_stats['pending']} 个待推送、{outbox_stats['dead']} 个失败文档，由 `python fastgpt_outbox.py drain --loop` 投递")
 
     logger.info("Proceso de generación de informes Markdown completado.")
 
@@ -0,0 +1,560 @@
+import os
+import json
+import logging
+import argparse
+import shutil
+import tempfile
+import requests
+import mysql.connector
+import pandas as pd
+from contextlib import closing
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+from connectors.ga4_data import GA4Client
+from connectors.woo_data import iter_woo_orders, WooAPIError
+from connectors.report_frames import ga4_report_to_frame, bounce_rate_percent
+from google.analytics.data_v1beta.types import DateRange
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_INGEST_BATCH_SIZE = 1000 # 每条多行 INSERT 语句包含的行数
+DEFAULT_DB_INGEST_MAX_STATEMENT_BYTES = 2 * 1024 * 1024 # 单条语句参数的估算字节数上限，低于 MySQL 5.7 默认的 4MB max_allowed_packet
+SQL_VALUE_OVERHEAD_BYTES = 4 # 每个值在语句中的引号、逗号等开销
+GA4_INGEST_ROW_LIMIT = 100000 # 入库报告的单次行数上限 (按天拆分后通常远小于该值)
+GA4_OVERALL_SESSION_DEPTH = 0 # GA4 没有会话深度维度，整体会话指标记在 session_depth=0
+GA4_DEVICE_TYPE_NAMES = {"desktop": "pc"} # ga4_device_metrics.device_type 约定使用 'pc'/'mobile'
+LOAD_DATA_NULL = "\\N" # LOAD DATA 文件中的 NULL
+
+
+def get_ingest_batch_size():
+    """多行 INSERT 的批大小，可通过环境变量 DB_INGEST_BATCH_SIZE 覆盖。"""
+    try:
+        return max(1, int(os.getenv("DB_INGEST_BATCH_SIZE", DEFAULT_DB_INGEST_BATCH_SIZE)))
+    except ValueError:
+        logger.warning(f"DB_INGEST_BATCH_SIZE环境变量值无效，将使用默认值: {DEFAULT_DB_INGEST_BATCH_SIZE}")
+        return DEFAULT_DB_INGEST_BATCH_SIZE
+
+
+def get_ingest_max_statement_bytes():
+    """多行 INSERT 单条语句的字节数上限，可通过环境变量 DB_INGEST_MAX_STATEMENT_BYTES 覆盖。"""
+    try:
+        return max(1024, int(os.getenv("DB_INGEST_MAX_STATEMENT_BYTES", DEFAULT_DB_INGEST_MAX_STATEMENT_BYTES)))
+    except ValueError:
+        logger.warning(f"DB_INGEST_MAX_STATEMENT_BYTES环境变量值无效，将使用默认值: {DEFAULT_DB_INGEST_MAX_STATEMENT_BYTES}")
+        return DEFAULT_DB_INGEST_MAX_STATEMENT_BYTES
+
+
+def _row_bytes(row):
+    # 估算一行在语句中占用的字节数；字符串按 UTF-8 编码计，其余按文本表示计
+    return sum(
+        (len(value.encode("utf-8")) if isinstance(value, str) else len(str(value))) + SQL_VALUE_OVERHEAD_BYTES
+        for value in row
+    )
+
+
+def get_mysql_connection(**kwargs):
+    """按 DB_HOST/DB_PORT/DB_NAME/DB_USER/DB_PASSWORD 建立连接 (与 data_api_service 使用同一组配置)。"""
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        port=int(os.getenv("DB_PORT", 3306)),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        **kwargs
+    )
+
+
+def upsert_rows(conn, table, columns, rows, update_columns=None, batch_size=None, commit=True, max_statement_bytes=None):
+    """
+    以多行 INSERT ... ON DUPLICATE KEY UPDATE 批量写入，每批一次往返，全部写完后提交。
+    update_columns 为空列表时为普通的多行 INSERT。每条语句同时受行数和估算字节数限制，
+    行很大 (例如带完整 API 响应) 时提前切分，避免超过服务端的 max_allowed_packet。
+
+    Args:
+        conn: MySQL 连接。
+        table (str): 表名。
+        columns (list): 列名，与 rows 中每个元组的顺序一致。
+        rows (iterable): 行元组。
+        update_columns (list, optional): 主键/唯一键冲突时更新的列，默认为除第一列外的全部列。
+        batch_size (int, optional): 每条语句的行数，默认读取 DB_INGEST_BATCH_SIZE。
+        commit (bool): 为 False 时由调用方提交，以便与其他语句放在同一事务中。
+        max_statement_bytes (int, optional): 每条语句的估算字节数上限，默认读取 DB_INGEST_MAX_STATEMENT_BYTES。
+            单行超过上限时单独成一条语句。
+
+    Returns:
+        int: 写入的行数。
+    """
+    batch_size = batch_size or get_ingest_batch_size()
+    max_statement_bytes = max_statement_bytes or get_ingest_max_statement_bytes()
+    update_columns = update_columns if update_columns is not None else columns[1:]
+    column_sql = ", ".join(f"`{column}`" for column in columns)
+    row_placeholder = f"({', '.join(['%s'] * len(columns))})"
+    update_sql = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in update_columns)
+
+    def flush(cursor, batch):
+        sql = f"INSERT INTO `{table}` ({column_sql}) VALUES {', '.join([row_placeholder] * len(batch))}"
+        if update_sql:
+            sql += f" ON DUPLICATE KEY UPDATE {update_sql}"
+        cursor.execute(sql, [value for row in batch for value in row])
+
+    written = 0
+    batch = []
+    batch_bytes = 0
+    with closing(conn.cursor()) as cursor:
+        for row in rows:
+            row_bytes = _row_bytes(row)
+            if batch and batch_bytes + row_bytes > max_statement_bytes:
+                flush(cursor, batch)
+                written += len(batch)
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+            if len(batch) >= batch_size:
+                flush(cursor, batch)
+                written += len(batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            flush(cursor, batch)
+            written += len(batch)
+    if commit:
+        conn.commit()
+    return written
+
+
+def _frame_rows(frame, columns):
+    # Series.tolist() 返回 Python 原生类型，mysql.connector 无法直接转换 numpy 标量
+    return list(zip(*(frame[column].tolist() for column in columns)))
+
+
+def _report_dates(frame):
+    return pd.to_datetime(frame["date"], format="%Y%m%d").dt.date
+
+
+def _ga4_ingest_report_specs(date_range):
+    """入库所需的 GA4 报告，均按 date 维度逐日拆分，合计 4 个报告即一次 batchRunReports 请求。"""
+    return [
+        {
+            "dimensions": ["date", "sessionDefaultChannelGroup"],
+            "metrics": ["activeUsers", "userEngagementDuration"],
+            "date_ranges": date_range,
+            "limit": GA4_INGEST_ROW_LIMIT
+        },
+        {
+            "dimensions": ["date", "pagePath"],
+            "metrics": ["averageSessionDuration", "bounceRate"],
+            "date_ranges": date_range,
+            "limit": GA4_INGEST_ROW_LIMIT
+        },
+        {
+            "dimensions": ["date", "deviceCategory"],
+            "metrics": ["activeUsers", "sessions", "engagedSessions", "averageSessionDuration", "addToCarts", "checkouts"],
+            "date_ranges": date_range,
+            "limit": GA4_INGEST_ROW_LIMIT
+        },
+        {
+            "dimensions": ["date"],
+            "metrics": ["activeUsers", "sessions", "engagedSessions", "engagementRate", "addToCarts", "checkouts", "keyEvents", "totalRevenue"],
+            "date_ranges": date_range,
+            "limit": GA4_INGEST_ROW_LIMIT
+        },
+    ]
+
+
+def build_ga4_table_rows(channels_report, pages_report, devices_report, daily_report):
+    """
+    把按日拆分的 GA4 报告转换为各 ga4_* 表的行。
+
+    Returns:
+        dict: {表名: (列名列表, 行元组列表)}，请求失败的报告对应的表不出现在结果中。
+    """
+    tables = {}
+
+    frame = ga4_report_to_frame(channels_report)
+    if frame is not None:
+        frame["report_date"] = _report_dates(frame)
+        users = frame["activeUsers"]
+        frame["avg_engagement_time"] = (frame["userEngagementDuration"] / users.where(users > 0)).fillna(0).round(2)
+        frame = frame.rename(columns={"sessionDefaultChannelGroup": "channel", "activeUsers": "visitors"})
+        columns = ["report_date", "channel", "visitors", "avg_engagement_time"]
+        tables["ga4_traffic_channels"] = (columns, _frame_rows(frame, columns))
+
+    frame = ga4_report_to_frame(pages_report)
+    if frame is not None:
+        frame["report_date"] = _report_dates(frame)
+        frame["page_path"] = frame["pagePath"].str.slice(0, 255)
+        frame["avg_time_on_page"] = frame["averageSessionDuration"].round(2)
+        frame["bounce_rate"] = (frame["bounceRate"] * 100).round(2)
+        # 截断到 255 字符后可能出现重复的页面路径，同一天只保留第一条
+        frame = frame.drop_duplicates(subset=["page_path", "report_date"])
+        columns = ["report_date", "page_path", "avg_time_on_page", "bounce_rate"]
+        tables["ga4_page_metrics"] = (columns, _frame_rows(frame, columns))
+
+    frame = ga4_report_to_frame(devices_report)
+    if frame is not None:
+        frame["report_date"] = _report_dates(frame)
+        frame["device_type"] = frame["deviceCategory"].replace(GA4_DEVICE_TYPE_NAMES)
+        frame["bounce_rate"] = bounce_rate_percent(frame["engagedSessions"], frame["sessions"]).round(2)
+        frame["avg_visit_time"] = frame["averageSessionDuration"].round(2)
+        frame = frame.rename(columns={"activeUsers": "visitors", "addToCarts": "add_to_cart", "checkouts": "checkout"})
+        columns = ["report_date", "device_type", "visitors", "bounce_rate", "avg_visit_time", "add_to_cart", "checkout"]
+        tables["ga4_device_metrics"] = (columns, _frame_rows(frame, columns))
+
+    frame = ga4_report_to_frame(daily_report)
+    if frame is not None:
+        frame["report_date"] = _report_dates(frame)
+        frame["engagement_rate"] = (frame["engagementRate"] * 100).round(2)
+        frame["total_revenue"] = frame["totalRevenue"].round(2)
+        frame["session_depth"] = GA4_OVERALL_SESSION_DEPTH
+        frame["bounce_rate"] = bounce_rate_percent(frame["engagedSessions"], frame["sessions"]).round(2)
+        # keyEvents 是浮点指标，conversions_total 是 INT 列，显式取整而不是交给 MySQL 隐式转换
+        frame["conversions_total"] = frame["keyEvents"].round().astype("int64")
+        frame = frame.rename(columns={
+            "activeUsers": "active_users",
+            "addToCarts": "add_to_cart",
+            "checkouts": "checkout"
+        })
+        columns = ["report_date", "active_users", "sessions", "engagement_rate", "conversions_total", "total_revenue"]
+        tables["ga4_daily_overview"] = (columns, _frame_rows(frame, columns))
+        columns = ["report_date", "session_depth", "bounce_rate", "add_to_cart", "checkout"]
+        tables["ga4_session_depth"] = (columns, _frame_rows(frame, columns))
+        frame = frame.rename(columns={"active_users": "visitors", "sessions": "visits"})
+        columns = ["report_date", "visitors", "visits"]
+        tables["ga4_visit_depth"] = (columns, _frame_rows(frame, columns))
+
+    return tables
+
+
+# 各表的唯一键列，冲突时更新其余列
+GA4_TABLE_KEYS = {
+    "ga4_daily_overview": ["report_date"],
+    "ga4_traffic_channels": ["report_date", "channel"],
+    "ga4_page_metrics": ["report_date", "page_path"],
+    "ga4_session_depth": ["report_date", "session_depth"],
+    "ga4_visit_depth": ["report_date"],
+    "ga4_device_metrics": ["report_date", "device_type"],
+}
+
+
+def ingest_ga4_to_mysql(start_date_dt, end_date_dt, conn=None):
+    """
+    按天获取 GA4 指标并批量写入 ga4_* 数据表 (SQL/createtable.sql)，重复运行时按唯一键覆盖。
+
+    Returns:
+        dict: {表名: 写入行数}，获取或写入失败时返回已写入的部分。
+    """
+    start_date_str = start_date_dt.strftime("%Y-%m-%d")
+    end_date_str = end_date_dt.strftime("%Y-%m-%d")
+    logger.info(f"开始写入GA4数据表 ({start_date_str} 到 {end_date_str})...")
+    written = {}
+    try:
+        client = GA4Client()
+        reports = client.run_batch_reports(_ga4_ingest_report_specs([DateRange(start_date=start_date_str, end_date=end_date_str)]))
+        for report in reports:
+            if report and report.get("rowCount", 0) > len(report.get("rows", [])):
+                logger.warning(f"GA4入库报告行数 {report['rowCount']} 超过单次上限 {GA4_INGEST_ROW_LIMIT}，超出部分未写入")
+        tables = build_ga4_table_rows(*reports)
+        if not tables:
+            logger.warning("GA4入库报告全部获取失败，跳过写入。")
+            return written
+
+        own_conn = conn is None
+        conn = conn or get_mysql_connection()
+        try:
+            for table, (columns, rows) in tables.items():
+                keys = GA4_TABLE_KEYS[table]
+                written[table] = upsert_rows(conn, table, columns, rows, [column for column in columns if column not in keys])
+        finally:
+            if own_conn:
+                conn.close()
+    except mysql.connector.Error as db_err:
+        logger.error(f"写入GA4数据表失败: {db_err}")
+    except Exception as e:
+        logger.error(f"GA4入库时发生错误: {e}", exc_info=True)
+    logger.info(f"GA4数据表写入完成: {written}")
+    return written
+
+
+# woocommerce_orders 的列 (last_synced_at 由数据库维护)
+WOO_ORDER_COLUMNS = [
+    "order_id", "order_number", "status", "currency", "total_amount", "discount_total", "shipping_total", "customer_id",
+    "billing_first_name", "billing_last_name", "billing_email", "billing_phone", "billing_company",
+    "billing_address_1", "billing_address_2", "billing_city", "billing_state", "billing_postcode", "billing_country",
+    "shipping_first_name", "shipping_last_name", "shipping_company",
+    "shipping_address_1", "shipping_address_2", "shipping_city", "shipping_state", "shipping_postcode", "shipping_country",
+    "customer_ip_address", "customer_user_agent", "payment_method_id", "payment_method_title", "transaction_id",
+    "date_created_gmt", "date_paid_gmt", "date_completed_gmt", "date_modified_gmt",
+    "customer_note", "meta_data", "raw_api_response",
+]
+WOO_ORDER_ITEM_COLUMNS = ["order_id", "product_id", "product_name", "quantity", "total", "sku", "meta_data"]
+WOO_ADDRESS_FIELDS = ("first_name", "last_name", "company", "address_1", "address_2", "city", "state", "postcode", "country")
+
+
+def _woo_datetime(value):
+    # WooCommerce 返回 "2024-01-01T10:00:00"，转为 MySQL DATETIME 字面量
+    return value.replace("T", " ") if value else None
+
+
+def woo_order_row(order):
+    """把 WooCommerce API 返回的订单字典映射为 woocommerce_orders 的一行 (顺序同 WOO_ORDER_COLUMNS)。"""
+    billing = order.get("billing") or {}
+    shipping = order.get("shipping") or {}
+    return (
+        order["id"],
+        order.get("number") or str(order["id"]),
+        order.get("status"),
+        order.get("currency"),
+        order.get("total") or 0,
+        order.get("discount_total") or 0,
+        order.get("shipping_total") or 0,
+        order.get("customer_id") or None,
+        billing.get("first_name"),
+        billing.get("last_name"),
+        billing.get("email"),
+        billing.get("phone"),
+        billing.get("company"),
+        billing.get("address_1"),
+        billing.get("address_2"),
+        billing.get("city"),
+        billing.get("state"),
+        billing.get("postcode"),
+        billing.get("country"),
+        *(shipping.get(field) for field in WOO_ADDRESS_FIELDS),
+        order.get("customer_ip_address"),
+        order.get("customer_user_agent"),
+        order.get("payment_method"),
+        order.get("payment_method_title"),
+        order.get("transaction_id"),
+        _woo_datetime(order.get("date_created_gmt")),
+        _woo_datetime(order.get("date_paid_gmt")),
+        _woo_datetime(order.get("date_completed_gmt")),
+        _woo_datetime(order.get("date_modified_gmt")),
+        order.get("customer_note"),
+        json.dumps(order.get("meta_data", []), ensure_ascii=False),
+        json.dumps(order, ensure_ascii=False),
+    )
+
+
+def woo_order_item_rows(order):
+    """把订单的 line_items 映射为 woocommerce_order_items 的行 (顺序同 WOO_ORDER_ITEM_COLUMNS)。"""
+    return [
+        (
+            order["id"],
+            item.get("product_id") or None,
+            (item.get("name") or "")[:255],
+            item.get("quantity") or 0,
+            item.get("total") or 0,
+            item.get("sku") or None,
+            json.dumps(item.get("meta_data", []), ensure_ascii=False),
+        )
+        for item in order.get("line_items", [])
+    ]
+
+
+def _write_order_batch(conn, orders):
+    """
+    在一个事务中写入一批订单：订单多行 upsert，商品明细先按订单整体删除再多行插入。
+    订单行带有完整的 raw_api_response，多行语句按 DB_INGEST_MAX_STATEMENT_BYTES 自动切分。
+    """
+    order_ids = [order["id"] for order in orders]
+    item_rows = [row for order in orders for row in woo_order_item_rows(order)]
+    try:
+        upsert_rows(conn, "woocommerce_orders", WOO_ORDER_COLUMNS, map(woo_order_row, orders), batch_size=len(orders), commit=False)
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(
+                f"DELETE FROM `woocommerce_order_items` WHERE `order_id` IN ({', '.join(['%s'] * len(order_ids))})",
+                order_ids
+            )
+        upsert_rows(conn, "woocommerce_order_items", WOO_ORDER_ITEM_COLUMNS, item_rows, update_columns=[], commit=False)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(item_rows)
+
+
+class WooOrderWriter:
+    """
+    按批把订单写入 woocommerce_orders / woocommerce_order_items 的写入器。
+
+    调用方在自己的订单流中逐单 add()，满 batch_size 个订单写入一个事务，close() 写入剩余订单并
+    返回统计；采集流程借此在生成报告的同时入库，不必再次拉取订单。数据库出错后记录日志并停止写入。
+    """
+
+    def __init__(self, conn=None, batch_size=None):
+        self.conn = conn
+        self.batch_size = batch_size or get_ingest_batch_size()
+        self.totals = {"orders": 0, "items": 0}
+        self.failed = False
+        self._own_conn = conn is None
+        self._batch = []
+
+    def add(self, order):
+        if self.failed:
+            return
+        self._batch.append(order)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.failed or not self._batch:
+            return
+        try:
+            if self.conn is None:
+                self.conn = get_mysql_connection()
+            self.totals["items"] += _write_order_batch(self.conn, self._batch)
+            self.totals["orders"] += len(self._batch)
+        except mysql.connector.Error as db_err:
+            logger.error(f"写入WooCommerce订单表失败，后续订单不再入库: {db_err}")
+            self.failed = True
+        finally:
+            self._batch = []
+
+    def close(self):
+        """写入剩余订单并关闭自行建立的连接，返回 {"orders": 写入订单数, "items": 写入商品行数}。"""
+        try:
+            self.flush()
+        finally:
+            if self._own_conn and self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        logger.info(f"WooCommerce订单入库完成: 订单 {self.totals['orders']}，商品行 {self.totals['items']}")
+        return self.totals
+
+
+def sync_woo_orders_to_mysql(start_date_dt, end_date_dt, conn=None, batch_size=None):
+    """
+    流式读取指定日期范围内的 WooCommerce 订单并批量写入 woocommerce_orders / woocommerce_order_items。
+
+    每 batch_size (默认 DB_INGEST_BATCH_SIZE) 个订单一个事务：订单一条多行 upsert 语句，
+    该批订单的商品明细一条 DELETE 加一条多行 INSERT，内存中只保留一批订单。
+
+    Returns:
+        dict: {"orders": 写入订单数, "items": 写入商品行数}，失败时为已提交的部分。
+    """
+    writer = WooOrderWriter(conn, batch_size)
+    try:
+        for order in iter_woo_orders(start_date_dt, end_date_dt):
+            writer.add(order)
+            if writer.failed:
+                break
+    except WooAPIError as api_e:
+        logger.error(f"WooCommerce API请求失败，订单入库中止: {api_e}")
+    except requests.exceptions.RequestException as req_e:
+        logger.error(f"WooCommerce API网络请求时发生异常，订单入库中止: {req_e}")
+    except Exception as e:
+        logger.error(f"WooCommerce订单入库时发生错误: {e}", exc_info=True)
+    return writer.close()
+
+
+def _load_data_field(value):
+    if value is None:
+        return LOAD_DATA_NULL
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _write_load_data_rows(out, rows):
+    for row in rows:
+        out.write("\t".join(map(_load_data_field, row)))
+        out.write("\n")
+
+
+def _load_data_file(cursor, path, table, columns, replace=False):
+    cursor.execute(
+        f"LOAD DATA LOCAL INFILE %s {'REPLACE ' if replace else ''}INTO TABLE `{table}` CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+        f"({', '.join(f'`{column}`' for column in columns)})",
+        (path,)
+    )
+
+
+def backfill_woo_orders_with_load_data(start_date_dt, end_date_dt, conn=None, orders=None):
+    """
+    大范围回填：订单和商品明细先流式写入临时制表符分隔文件，再各用一条 LOAD DATA LOCAL INFILE 导入。
+
+    订单以 REPLACE 方式导入 (按 order_id 覆盖)；导入商品明细前按订单分批删除旧明细。
+    需要 MySQL 服务端开启 local_infile，连接以 allow_local_infile=True 建立。
+    orders 为空时从 WooCommerce 拉取日期范围内的订单，否则直接导入给定的订单字典。
+
+    Returns:
+        dict: {"orders": 导入订单数, "items": 导入商品行数}，失败时为空结果。
+    """
+    totals = {"orders": 0, "items": 0}
+    own_conn = conn is None
+    tmp_dir = tempfile.mkdtemp(prefix="woo_backfill_")
+    orders_path = os.path.join(tmp_dir, "orders.tsv")
+    items_path = os.path.join(tmp_dir, "order_items.tsv")
+    order_ids = []
+    try:
+        with open(orders_path, "w", encoding="utf-8", newline="") as orders_file, \
+                open(items_path, "w", encoding="utf-8", newline="") as items_file:
+            for order in orders if orders is not None else iter_woo_orders(start_date_dt, end_date_dt):
+                order_ids.append(order["id"])
+                _write_load_data_rows(orders_file, [woo_order_row(order)])
+                item_rows = woo_order_item_rows(order)
+                _write_load_data_rows(items_file, item_rows)
+                totals["items"] += len(item_rows)
+        logger.info(f"WooCommerce回填文件已生成: 订单 {len(order_ids)}，商品行 {totals['items']}")
+
+        conn = conn or get_mysql_connection(allow_local_infile=True)
+        batch_size = get_ingest_batch_size()
+        with closing(conn.cursor()) as cursor:
+            _load_data_file(cursor, orders_path, "woocommerce_orders", WOO_ORDER_COLUMNS, replace=True)
+            for offset in range(0, len(order_ids), batch_size):
+                batch_ids = order_ids[offset:offset + batch_size]
+                cursor.execute(
+                    f"DELETE FROM `woocommerce_order_items` WHERE `order_id` IN ({', '.join(['%s'] * len(batch_ids))})",
+                    batch_ids
+                )
+            _load_data_file(cursor, items_path, "woocommerce_order_items", WOO_ORDER_ITEM_COLUMNS)
+        conn.commit()
+        totals["orders"] = len(order_ids)
+    except WooAPIError as api_e:
+        logger.error(f"WooCommerce API请求失败，回填中止: {api_e}")
+        return {"orders": 0, "items": 0}
+    except requests.exceptions.RequestException as req_e:
+        logger.error(f"WooCommerce API网络请求时发生异常，回填中止: {req_e}")
+        return {"orders": 0, "items": 0}
+    except mysql.connector.Error as db_err:
+        logger.error(f"LOAD DATA 回填WooCommerce订单失败: {db_err}")
+        if conn is not None:
+            conn.rollback()
+        return {"orders": 0, "items": 0}
+    except Exception as e:
+        logger.error(f"WooCommerce订单回填时发生错误: {e}", exc_info=True)
+        if conn is not None:
+            conn.rollback()
+        return {"orders": 0, "items": 0}
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info(f"WooCommerce订单回填完成: 订单 {totals['orders']}，商品行 {totals['items']}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 GA4 指标和 WooCommerce 订单写入 MySQL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("ga4", "写入 ga4_* 数据表"), ("woo", "写入 woocommerce_orders / woocommerce_order_items")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--start", help="开始日期 YYYY-MM-DD (默认 7 天前)")
+        sub.add_argument("--end", help="结束日期 YYYY-MM-DD (默认昨天)")
+        if name == "woo":
+            sub.add_argument("--backfill", action="store_true", help="使用 LOAD DATA LOCAL INFILE 回填大范围历史订单")
+    args = parser.parse_args()
+
+    end_date = datetime.strptime(args.end, "%Y-%m-%d") if args.end else datetime.now() - timedelta(days=1)
+    start_date = datetime.strptime(args.start, "%Y-%m-%d") if args.start else end_date - timedelta(days=7)
+    if args.command == "ga4":
+        ingest_ga4_to_mysql(start_date, end_date)
+    elif args.backfill:
+        backfill_woo_orders_with_load_data(start_date, end_date)
+    else:
+        sync_woo_orders_to_mysql(start_date, end_date)
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()